@@ -0,0 +1,3 @@
+# Benchmarks de la aplicación. Se ejecutan como módulos, p. ej.:
+#   python -m transacciones.bench.estadisticas --filas 1000000
+#   python -m transacciones.bench.suite --filas 100000 --salida resultados.json
@@ -0,0 +1,124 @@
+# analitica.py
+"""
+Mide las estadísticas y series en memoria (analitica.py), desde el libro y desde el resumen
+diario, frente a la agregación en SQL y a recorrer objetos del ORM con Decimal por fila,
+para los rangos yearly y all.
+
+    python -m transacciones.bench.analitica --filas 100000 1000000
+"""
+import argparse
+import datetime
+import os
+import tempfile
+import time
+from decimal import Decimal
+
+
+def estadisticas_orm(inicio):
+    """
+    Recorre las transacciones como objetos del ORM y suma un Decimal por campo y por fila.
+    """
+    from ..src.models import db, CostoTransaccion, Transaction
+
+    filas = (db.session.query(Transaction, CostoTransaccion.resultado)
+             .outerjoin(CostoTransaccion, CostoTransaccion.transaction_id == Transaction.id)
+             .filter(Transaction.fecha_hora >= inicio).all())
+    centavo = Decimal('0.01')
+    return {
+        'total_dolares_vendidos': sum((t.monto for t, _ in filas if t.tipo == 'venta_dolares'), Decimal(0)),
+        'total_pesos_vendidos': sum(((t.monto / t.tasa_cambio).quantize(centavo) for t, _ in filas
+                                     if t.tipo == 'venta_pesos' and t.tasa_cambio), Decimal(0)),
+        'total_ganancias': sum((r for _, r in filas if r and r > 0), Decimal(0)),
+        'total_perdidas': sum((-r for _, r in filas if r and r < 0), Decimal(0)),
+        'total_comisiones': sum((t.comision or 0 for t, _ in filas
+                                 if t.tipo in ('cable_subida', 'cable_bajada')), Decimal(0)),
+        'total_descuentos_cheques': sum((t.descuento_cheque or 0 for t, _ in filas
+                                         if t.tipo == 'descuento_cheque'), Decimal(0)),
+    }
+
+
+def serie_sql(inicio):
+    """
+    Serie diaria con GROUP BY en SQL, como la arma reconstruir_resumen.
+    """
+    from sqlalchemy import func, select
+
+    from ..src.estadisticas import columnas_resumen, filas_con_costo
+    from ..src.models import db
+
+    filas = filas_con_costo(inicio)
+    dia = func.date(filas.c.fecha_hora)
+    return db.session.execute(
+        select(dia, filas.c.tipo, *columnas_resumen(filas)).group_by(dia, filas.c.tipo)
+    ).all()
+
+
+def _medir(funcion, *args, **kwargs):
+    t0 = time.perf_counter()
+    resultado = funcion(*args, **kwargs)
+    return time.perf_counter() - t0, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--filas', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--max-orm', type=int, default=200000,
+                        help="No medir el recorrido con el ORM por encima de este tamaño")
+    args = parser.parse_args()
+
+    from ..src.analitica import FUENTES, analizar, numpy_disponible
+    from ..src.app import create_app
+    from ..src.estadisticas import calcular_estadisticas, estadisticas_desde_resumen, inicio_de_rango
+    from ..src.models import db
+    from ..src.resumenes import reconstruir_resumen
+    from .generador import generar_libro
+
+    directorio = tempfile.mkdtemp(prefix='bench_analitica_')
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(directorio, "database.db")}',
+        'METRICAS_HABILITADAS': False,
+        'CACHE_VISTAS_HABILITADA': False,
+    })
+    motores = [('python', False)] + ([('numpy', True)] if numpy_disponible() else [])
+    if len(motores) == 1:
+        print("NumPy no está instalado: sólo se mide el recorrido en Python.")
+
+    with app.app_context():
+        cargadas = 0
+        for filas in sorted(args.filas):
+            # Se crece la misma base hasta cada tamaño pedido
+            generar_libro(filas - cargadas, semilla=filas)
+            reconstruir_resumen()
+            db.session.commit()
+            cargadas = filas
+
+            hoy = datetime.datetime.utcnow()
+            for rango in ('yearly', 'all'):
+                inicio = inicio_de_rango(rango, hoy)
+                print(f"{filas:>9} filas  range={rango}")
+                esperados = {}
+                for fuente, funcion in (('libro', calcular_estadisticas), ('resumen', estadisticas_desde_resumen)):
+                    segundos, esperados[fuente] = _medir(funcion, inicio)
+                    print(f"    {f'totales sql {fuente}':30} {segundos:8.3f}s")
+                if filas <= args.max_orm:
+                    segundos, _ = _medir(estadisticas_orm, inicio)
+                    print(f"    {'totales orm + Decimal':30} {segundos:8.3f}s")
+                for fuente in FUENTES:
+                    for nombre, usar_numpy in motores:
+                        segundos, (totales, _) = _medir(analizar, inicio, fuente=fuente, usar_numpy=usar_numpy)
+                        diferencia = '' if totales == esperados[fuente] else '  <-- distinto de sql'
+                        print(f"    {f'totales {fuente} {nombre}':30} {segundos:8.3f}s{diferencia}")
+
+                segundos, _ = _medir(serie_sql, inicio)
+                print(f"    {'serie diaria sql libro':30} {segundos:8.3f}s")
+                for fuente in FUENTES:
+                    for periodo in ('daily', 'monthly'):
+                        for nombre, usar_numpy in motores:
+                            segundos, (_, serie) = _medir(analizar, inicio, periodo, fuente, usar_numpy)
+                            print(f"    {f'serie {periodo} {fuente} {nombre}':30} {segundos:8.3f}s"
+                                  f"  ({len(serie)} puntos)")
+            db.session.rollback()
+
+
+if __name__ == '__main__':
+    main()
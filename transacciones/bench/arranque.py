@@ -0,0 +1,72 @@
+# arranque.py
+"""
+Tiempo de arranque de un worker: importar la app, crearla con create_app() y atender
+la primera request (y la segunda, ya en caliente). Cada repetición corre en un proceso
+nuevo, como un worker recién creado; se informa la mediana.
+
+    python -m transacciones.bench.arranque --repeticiones 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _hijo():
+    t0 = time.perf_counter()
+    from ..src.app import create_app
+    t1 = time.perf_counter()
+    app = create_app()
+    t2 = time.perf_counter()
+    cliente = app.test_client()
+    cliente.post('/login', data={'username': 'bench', 'password': 'bench'})
+    t3 = time.perf_counter()
+    cliente.get('/')
+    t4 = time.perf_counter()
+    cliente.get('/')
+    t5 = time.perf_counter()
+    print(json.dumps({
+        'importar': t1 - t0, 'create_app': t2 - t1, 'login': t3 - t2,
+        'primera /': t4 - t3, 'segunda /': t5 - t4,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeticiones', type=int, default=10)
+    parser.add_argument('--hijo', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.hijo:
+        return _hijo()
+
+    directorio = tempfile.mkdtemp(prefix='bench_arranque_')
+    entorno = dict(
+        os.environ,
+        DATABASE_URL=f'sqlite:///{os.path.join(directorio, "database.db")}',
+        COTIZACION_CACHE_PATH=os.path.join(directorio, 'cotizacion.db'),
+        COTIZACION_URL='http://127.0.0.1:9/',  # Sin red: el arranque no debe depender de la cotización
+        SECRET_KEY='bench', DEFAULT_USERNAME='bench', DEFAULT_PASSWORD='bench',
+    )
+    comando = [sys.executable, '-m', 'transacciones.bench.arranque', '--hijo']
+    subprocess.run(comando, cwd=RAIZ, env=entorno, check=True, capture_output=True)  # Crea la base
+
+    tiempos, totales = [], []
+    for _ in range(args.repeticiones):
+        t0 = time.perf_counter()
+        salida = subprocess.run(comando, cwd=RAIZ, env=entorno, check=True, capture_output=True, text=True)
+        totales.append(time.perf_counter() - t0)
+        tiempos.append(json.loads(salida.stdout.strip().splitlines()[-1]))
+
+    for etapa in tiempos[0]:
+        print(f"{etapa:12} {statistics.median(t[etapa] for t in tiempos) * 1000:8.1f} ms")
+    print(f"{'proceso':12} {statistics.median(totales) * 1000:8.1f} ms (intérprete incluido)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+# busqueda.py
+"""
+Compara el filtro de concepto del historial con LIKE '%texto%' frente al índice FTS5.
+
+    python -m transacciones.bench.busqueda --filas 200000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--filas', type=int, default=200000)
+    parser.add_argument('--repeticiones', type=int, default=20)
+    args = parser.parse_args()
+
+    ruta = os.path.join(tempfile.mkdtemp(prefix='bench_busqueda_'), 'database.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{ruta}'
+    from ..src.app import app
+    from ..src.busqueda import filtro_concepto
+    from ..src.migraciones import aplicar_migraciones
+    from ..src.models import Transaction
+    from .generador import generar_libro
+
+    with app.app_context():
+        aplicar_migraciones()
+        generar_libro(args.filas)
+        for texto in ('cliente 42', 'prov', 'sucursal 4999'):
+            caminos = {
+                'LIKE': Transaction.concepto.contains(texto),
+                'FTS5': filtro_concepto(texto),
+            }
+            for nombre, condicion in caminos.items():
+                t0 = time.perf_counter()
+                for _ in range(args.repeticiones):
+                    cantidad = Transaction.query.filter(condicion).order_by(
+                        Transaction.fecha_hora.desc()).limit(100).count()
+                promedio = (time.perf_counter() - t0) / args.repeticiones
+                print(f"{texto!r:16} {nombre}  {promedio * 1000:8.2f} ms  ({cantidad} filas)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+# carga.py
+"""
+Prueba de carga HTTP del modo WSGI (gunicorn) contra el modo ASGI (uvicorn, ver src/asgi.py).
+Levanta un servidor de cotización local que responde como bluelytics con una demora fija,
+arranca cada modo como subproceso sobre la misma base y mide requests/s y latencias
+con varios clientes concurrentes.
+
+    python -m transacciones.bench.carga --clientes 32 --segundos 10 --workers 4 --demora 0.2
+"""
+import argparse
+import http.client
+import http.server
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+TOKEN = 'bench'
+
+
+def _servidor_cotizacion(demora):
+    """
+    Stub de bluelytics en un hilo. Devuelve la URL.
+    """
+    class Manejador(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(demora)
+            cuerpo = json.dumps({'blue': {'value_buy': 1000.0, 'value_sell': 1020.0}}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Manejador)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{servidor.server_port}/v2/latest'
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _preparar(directorio, url_cotizacion, transacciones):
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(directorio, "database.db")}'
+    os.environ['COTIZACION_URL'] = url_cotizacion
+    os.environ['COTIZACION_CACHE_PATH'] = os.path.join(directorio, 'cotizacion.db')
+    os.environ['COTIZACION_TTL'] = '1'  # El hilo de refresco consulta el stub durante toda la prueba
+    os.environ.setdefault('SECRET_KEY', 'bench')
+    os.environ['DEFAULT_USERNAME'] = 'bench'
+    os.environ['DEFAULT_PASSWORD'] = 'bench'
+    os.environ['API_TOKENS'] = TOKEN
+    from ..src.app import app
+    with app.app_context():
+        from ..src.migraciones import aplicar_migraciones
+        aplicar_migraciones()
+    cliente = app.test_client()
+    cliente.post('/login', data={'username': 'bench', 'password': 'bench'})
+    cliente.post('/caja/inicial', data={'pesos': '1000000000', 'dolares': '0'})
+    filas = [{'tipo': 'compra_dolares', 'monto': '1', 'concepto': 'carga', 'precio_compra': '1000'}] * transacciones
+    if filas:
+        cliente.post('/api/v1/transactions/batch', json={'transacciones': filas},
+                     headers={'Authorization': f'Bearer {TOKEN}'})
+
+
+def _comando(modo, puerto, workers):
+    if modo == 'wsgi':
+        return [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{puerto}',
+                '--log-level', 'warning', '--preload', 'transacciones.src.app:create_app()']
+    return [sys.executable, '-m', 'uvicorn', '--host', '127.0.0.1', '--port', str(puerto),
+            '--log-level', 'warning', '--no-access-log', 'transacciones.src.asgi:aplicacion']
+
+
+def _esperar(puerto, segundos=30):
+    limite = time.monotonic() + segundos
+    while time.monotonic() < limite:
+        try:
+            conexion = http.client.HTTPConnection('127.0.0.1', puerto, timeout=1)
+            conexion.request('GET', '/login')
+            if conexion.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f"El servidor no respondió en el puerto {puerto}")
+
+
+def _iniciar_sesion(puerto):
+    conexion = http.client.HTTPConnection('127.0.0.1', puerto, timeout=10)
+    cuerpo = urllib.parse.urlencode({'username': 'bench', 'password': 'bench'})
+    conexion.request('POST', '/login', cuerpo, {'Content-Type': 'application/x-www-form-urlencoded'})
+    respuesta = conexion.getresponse()
+    return respuesta.getheader('Set-Cookie').split(';', 1)[0]
+
+
+def _cliente(puerto, rutas, cabeceras, fin, latencias, errores):
+    propias, fallidas, i = [], 0, 0
+    while time.perf_counter() < fin:
+        ruta = rutas[i % len(rutas)]
+        i += 1
+        t0 = time.perf_counter()
+        try:
+            conexion = http.client.HTTPConnection('127.0.0.1', puerto, timeout=30)
+            conexion.request('GET', ruta, headers=cabeceras)
+            respuesta = conexion.getresponse()
+            respuesta.read()
+            conexion.close()
+            if respuesta.status != 200:
+                fallidas += 1
+                continue
+        except OSError:
+            fallidas += 1
+            continue
+        propias.append(time.perf_counter() - t0)
+    latencias.extend(propias)
+    errores.append(fallidas)
+
+
+def _percentil(valores, p):
+    return valores[min(int(len(valores) * p), len(valores) - 1)] if valores else float('nan')
+
+
+def medir(modo, args):
+    puerto = _puerto_libre()
+    servidor = subprocess.Popen(_comando(modo, puerto, args.workers), cwd=RAIZ, env=os.environ.copy())
+    try:
+        _esperar(puerto)
+        cabeceras = {'Cookie': _iniciar_sesion(puerto), 'Authorization': f'Bearer {TOKEN}'}
+        latencias, errores = [], []
+        fin = time.perf_counter() + args.segundos
+        hilos = [
+            threading.Thread(target=_cliente, args=(puerto, args.rutas, cabeceras, fin, latencias, errores))
+            for _ in range(args.clientes)
+        ]
+        t0 = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        segundos = time.perf_counter() - t0
+    finally:
+        servidor.terminate()
+        servidor.wait()
+
+    latencias.sort()
+    print(f"{modo:5} {len(latencias) / segundos:8.1f} req/s  p50 {_percentil(latencias, 0.5) * 1000:7.1f} ms  "
+          f"p99 {_percentil(latencias, 0.99) * 1000:7.1f} ms  errores {sum(errores)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--modos', nargs='+', choices=['wsgi', 'asgi'], default=['wsgi', 'asgi'])
+    parser.add_argument('--clientes', type=int, default=32, help="Hilos cliente concurrentes.")
+    parser.add_argument('--segundos', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=4, help="Workers de gunicorn en el modo wsgi.")
+    parser.add_argument('--demora', type=float, default=0.2, help="Segundos que tarda el stub de cotización.")
+    parser.add_argument('--transacciones', type=int, default=500, help="Operaciones cargadas antes de medir.")
+    parser.add_argument('--rutas', nargs='+', default=['/', '/api/v1/caja'])
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix='bench_carga_')
+    _preparar(directorio, _servidor_cotizacion(args.demora), args.transacciones)
+    print(f"{args.clientes} clientes, {args.segundos:g}s por modo, rutas {' '.join(args.rutas)}")
+    for modo in args.modos:
+        medir(modo, args)
+
+
+if __name__ == '__main__':
+    main()
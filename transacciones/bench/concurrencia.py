@@ -0,0 +1,92 @@
+# concurrencia.py
+"""
+Carga concurrente de lectura y escritura con varios procesos, como los workers de gunicorn.
+Compara los perfiles de SQLite definidos en config.SQLITE_PERFILES.
+
+    python -m transacciones.bench.concurrencia --escritores 4 --lectores 4 --segundos 10
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+
+def _preparar(ruta, perfil):
+    os.environ['DATABASE_URL'] = f'sqlite:///{ruta}'
+    os.environ['SQLITE_PERFIL'] = perfil
+    os.environ.setdefault('SECRET_KEY', 'bench')
+    os.environ['DEFAULT_USERNAME'] = 'bench'
+    os.environ['DEFAULT_PASSWORD'] = 'bench'
+    from ..src.app import app
+    cliente = app.test_client()
+    cliente.post('/login', data={'username': 'bench', 'password': 'bench'})
+    return app, cliente
+
+
+def _trabajador(ruta, perfil, rol, segundos, resultados):
+    app, cliente = _preparar(ruta, perfil)
+    ok = errores = 0
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        if rol == 'escritor':
+            respuesta = cliente.post('/transactions', follow_redirects=True, data={
+                'tipo': 'compra_dolares', 'monto': '1', 'concepto': 'carga', 'precio_compra': '1000',
+            })
+            exito = 'registrada correctamente'.encode() in respuesta.data
+        else:
+            respuesta = cliente.get('/historial' if ok % 2 else '/stats?range=monthly')
+            exito = respuesta.status_code == 200
+        if exito:
+            ok += 1
+        else:
+            errores += 1
+    resultados.put((rol, ok, errores))
+
+
+def medir(perfil, escritores, lectores, segundos):
+    ruta = os.path.join(tempfile.mkdtemp(prefix=f'bench_conc_{perfil}_'), 'database.db')
+    app, cliente = _preparar(ruta, perfil)
+    with app.app_context():
+        from ..src.migraciones import aplicar_migraciones
+        aplicar_migraciones()
+    cliente.post('/caja/inicial', data={'pesos': '1000000000', 'dolares': '0'})
+
+    contexto = multiprocessing.get_context('spawn')
+    resultados = contexto.Queue()
+    procesos = [
+        contexto.Process(target=_trabajador, args=(ruta, perfil, rol, segundos, resultados))
+        for rol in ['escritor'] * escritores + ['lector'] * lectores
+    ]
+    for proceso in procesos:
+        proceso.start()
+    totales = {'escritor': [0, 0], 'lector': [0, 0]}
+    for _ in procesos:
+        rol, ok, errores = resultados.get()
+        totales[rol][0] += ok
+        totales[rol][1] += errores
+    for proceso in procesos:
+        proceso.join()
+
+    for rol, (ok, errores) in totales.items():
+        print(f"{perfil:12} {rol:9} {ok / segundos:8.1f} ops/s  errores {errores}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--escritores', type=int, default=4)
+    parser.add_argument('--lectores', type=int, default=4)
+    parser.add_argument('--segundos', type=float, default=10)
+    parser.add_argument('--perfiles', nargs='+', default=['compatible', 'produccion'])
+    args = parser.parse_args()
+    for perfil in args.perfiles:
+        # Cada perfil en su propio proceso: la app lee la configuración al importarse
+        proceso = multiprocessing.get_context('spawn').Process(
+            target=medir, args=(perfil, args.escritores, args.lectores, args.segundos)
+        )
+        proceso.start()
+        proceso.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# estadisticas.py
+"""
+Mide /stats con el motor agregado frente a la implementación anterior (N+1 consultas).
+
+    python -m transacciones.bench.estadisticas --filas 10000 100000 1000000
+"""
+import argparse
+import datetime
+import os
+import tempfile
+import time
+from decimal import Decimal
+
+
+def _precio_compra_previo(tipo):
+    from ..src.models import Transaction
+
+    tipo_compra = {'venta_dolares': 'compra_dolares', 'venta_pesos': 'compra_pesos'}[tipo]
+    compra = Transaction.query.filter_by(tipo=tipo_compra).order_by(Transaction.fecha_hora.desc()).first()
+    return Decimal(compra.tasa_cambio) if compra else Decimal(0)
+
+
+def estadisticas_anteriores(inicio):
+    """
+    Implementación previa: carga todas las filas y consulta el precio de compra por cada venta.
+    """
+    from ..src.models import Transaction
+
+    transacciones = Transaction.query.filter(Transaction.fecha_hora >= inicio).all()
+    ventas = [t for t in transacciones if t.tipo in ("venta_dolares", "venta_pesos")]
+    ganancias = sum(
+        max(Decimal(0), (Decimal(t.tasa_cambio) - _precio_compra_previo(t.tipo)) * Decimal(t.monto))
+        for t in ventas
+    )
+    return ganancias
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--filas', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--max-anterior', type=int, default=20000,
+                        help="No medir la implementación anterior por encima de este tamaño")
+    args = parser.parse_args()
+
+    # La URL de la base se lee al importar la app, así que se fija antes
+    ruta = os.path.join(tempfile.mkdtemp(prefix='bench_stats_'), 'database.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{ruta}'
+    from ..src.app import app
+    from ..src.models import db
+    from ..src.estadisticas import calcular_estadisticas
+    from .generador import generar_libro
+
+    inicio = datetime.datetime.min
+    with app.app_context():
+        db.create_all()
+        cargadas = 0
+        for filas in sorted(args.filas):
+            # Se crece la misma base hasta cada tamaño pedido
+            generar_libro(filas - cargadas, semilla=filas)
+            cargadas = filas
+
+            t0 = time.perf_counter()
+            calcular_estadisticas(inicio)
+            linea = f"{filas:>9} filas  agregado {time.perf_counter() - t0:8.3f}s"
+
+            if filas <= args.max_anterior:
+                t0 = time.perf_counter()
+                estadisticas_anteriores(inicio)
+                linea += f"  anterior {time.perf_counter() - t0:8.3f}s"
+            print(linea)
+
+
+if __name__ == '__main__':
+    main()
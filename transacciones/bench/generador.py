@@ -0,0 +1,60 @@
+# generador.py
+import datetime
+import random
+
+from sqlalchemy import insert
+
+from ..src.costos import recalcular_costos_desde
+from ..src.libro_caja import caja_actual, crear_caja
+from ..src.models import db, Transaction
+
+TIPOS = (
+    'compra_dolares', 'venta_dolares', 'compra_pesos', 'venta_pesos',
+    'cable_subida', 'cable_bajada', 'cash_to_cash', 'descuento_cheque',
+)
+PESOS_TIPOS = (30, 30, 5, 5, 10, 10, 5, 5)  # Frecuencia relativa de cada tipo
+
+
+def generar_fila(rng, fecha_hora):
+    """
+    Devuelve los valores de una transacción sintética con montos y tasas plausibles.
+    """
+    tipo = rng.choices(TIPOS, weights=PESOS_TIPOS)[0]
+    tasa = round(rng.uniform(900, 1300), 2)
+    monto = round(rng.lognormvariate(6, 1.2), 2)
+    fila = {
+        'tipo': tipo,
+        'monto': monto,
+        'concepto': f"{rng.choice(('cliente', 'proveedor', 'sucursal', 'cuenta'))} {rng.randint(1, 5000)}",
+        'fecha_hora': fecha_hora,
+        'tasa_cambio': tasa,
+        'comision': 0.0,
+        'descuento_cheque': 0.0,
+    }
+    if tipo in ('cable_subida', 'cable_bajada', 'cash_to_cash'):
+        fila['comision'] = round(monto * rng.uniform(0.005, 0.03), 2)
+    elif tipo == 'descuento_cheque':
+        fila['monto'] = round(monto * 1000, 2)
+        fila['descuento_cheque'] = round(fila['monto'] * rng.uniform(0.005, 0.03), 2)
+    return fila
+
+
+def generar_libro(filas, dias=365 * 3, semilla=1234, lote=10000):
+    """
+    Inserta `filas` transacciones repartidas en los últimos `dias` días y una caja inicial,
+    con sus costos calculados.
+    Debe llamarse dentro de un app context.
+    """
+    rng = random.Random(semilla)
+    fin = datetime.datetime.now()
+    inicio = fin - datetime.timedelta(days=dias)
+    paso = (fin - inicio) / max(filas, 1)
+
+    if not caja_actual():
+        crear_caja(10 ** 9, 10 ** 7)
+
+    for desde in range(0, filas, lote):
+        valores = [generar_fila(rng, inicio + paso * i) for i in range(desde, min(desde + lote, filas))]
+        db.session.execute(insert(Transaction), valores)
+    recalcular_costos_desde(inicio)
+    db.session.commit()
@@ -0,0 +1,71 @@
+# importacion.py
+"""
+Mide la importación masiva de un CSV sintético.
+
+    python -m transacciones.bench.importacion --filas 100000
+"""
+import argparse
+import csv
+import datetime
+import os
+import random
+import tempfile
+import time
+
+from .generador import generar_fila
+
+COLUMNAS = ('tipo', 'monto', 'concepto', 'fecha_hora', 'precio_compra', 'precio_venta',
+            'comision', 'descuento_cheque')
+
+
+def escribir_csv(ruta, filas, semilla=1234):
+    rng = random.Random(semilla)
+    inicio = datetime.datetime.now() - datetime.timedelta(days=365)
+    paso = datetime.timedelta(days=365) / max(filas, 1)
+    with open(ruta, 'w', newline='') as archivo:
+        escritor = csv.DictWriter(archivo, fieldnames=COLUMNAS)
+        escritor.writeheader()
+        for i in range(filas):
+            fila = generar_fila(rng, inicio + paso * i)
+            escritor.writerow({
+                'tipo': fila['tipo'],
+                'monto': fila['monto'],
+                'concepto': fila['concepto'],
+                'fecha_hora': fila['fecha_hora'].isoformat(),
+                'precio_compra': fila['tasa_cambio'],
+                'precio_venta': fila['tasa_cambio'],
+                'comision': round(rng.uniform(0.5, 3), 2),
+                'descuento_cheque': round(rng.uniform(0.5, 3), 2),
+            })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--filas', type=int, default=100000)
+    parser.add_argument('--lote', type=int, default=1000)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix='bench_importacion_')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(directorio, 'database.db')}"
+    from ..src.app import app
+    from ..src.importacion import importar_transacciones
+    from ..src.migraciones import aplicar_migraciones
+    from ..src.libro_caja import crear_caja
+    from ..src.models import db
+
+    ruta_csv = os.path.join(directorio, 'transacciones.csv')
+    escribir_csv(ruta_csv, args.filas)
+    with app.app_context():
+        aplicar_migraciones()
+        crear_caja(10 ** 12, 10 ** 10)
+        db.session.commit()
+        t0 = time.perf_counter()
+        with open(ruta_csv, newline='') as archivo:
+            resultado = importar_transacciones(archivo, 'csv', lote=args.lote)
+        segundos = time.perf_counter() - t0
+    print(f"{resultado.importadas} filas importadas en {segundos:.2f}s "
+          f"({resultado.importadas / segundos:,.0f} filas/s), {len(resultado.errores)} con errores")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# reproduccion.py
+"""
+Reproduce el libro completo con la tabla de impactos y muestra el tiempo y las filas por segundo.
+El generador no registra movimientos, así que antes se agrega el alta de cada transacción y se
+alteran unas pocas para comprobar que los desvíos aparecen.
+
+    python -m transacciones.bench.reproduccion --filas 1000000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--filas', type=int, default=1000000)
+    parser.add_argument('--lote', type=int, default=10000)
+    parser.add_argument('--desvios', type=int, default=10, help="Movimientos alterados a propósito.")
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix='bench_reproduccion_')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(directorio, 'database.db')}"
+    from sqlalchemy import Integer, select, type_coerce
+
+    from ..src.app import app
+    from ..src.impactos import impacto_en_caja
+    from ..src.libro_caja import caja_actual
+    from ..src.migraciones import aplicar_migraciones
+    from ..src.models import db, Transaction
+    from ..src.reproduccion import reproducir_caja
+    from .generador import generar_libro
+
+    with app.app_context():
+        aplicar_migraciones()
+        generar_libro(args.filas)
+        caja = caja_actual()
+        db.session.execute(Transaction.__table__.update().values(caja_id=caja.id))
+
+        t = Transaction.__table__.c
+        crudo = [type_coerce(columna, Integer) for columna in (t.monto, t.tasa_cambio, t.comision, t.descuento_cheque)]
+        alterados = set(random.Random(1).sample(range(1, args.filas + 1), min(args.desvios, args.filas)))
+        movimientos = []
+        for transaction_id, tipo, fecha_hora, *valores in db.session.execute(
+                select(t.id, t.tipo, t.fecha_hora, *crudo).order_by(t.id)).all():
+            pesos, dolares = impacto_en_caja(tipo, *valores)
+            if transaction_id in alterados:
+                dolares += 1
+            movimientos.append((caja.id, transaction_id, fecha_hora.isoformat(' '), pesos, dolares))
+        # Montos ya en unidades mínimas: se insertan sin pasar por la columna Dinero
+        db.session.connection().exec_driver_sql(
+            "INSERT INTO movimiento_caja (caja_id, transaction_id, motivo, fecha_hora, pesos, dolares)"
+            " VALUES (?, ?, 'alta', ?, ?, ?)", movimientos,
+        )
+        db.session.commit()
+        del movimientos
+        print(f"{args.filas} filas generadas, {len(alterados)} movimientos alterados")
+
+        t0 = time.perf_counter()
+        reproduccion = reproducir_caja(caja, args.lote)
+        segundos = time.perf_counter() - t0
+        print(f"reproducción {segundos:7.2f}s  {reproduccion.transacciones / segundos:12,.0f} filas/s  "
+              f"desvíos {reproduccion.cantidad_desvios}")
+        print(f"esperado {reproduccion.esperado}  registrado {reproduccion.registrado}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# saldos.py
+"""
+Prueba de estrés del saldo de la caja con varios procesos escribiendo a la vez.
+La caja arranca con fondos para exactamente `--cupo` compras y los workers intentan muchas más:
+al terminar deben haberse aceptado `--cupo` compras, el saldo en pesos debe ser cero y
+los snapshots deben coincidir con los movimientos.
+
+    python -m transacciones.bench.saldos --procesos 8 --cupo 2000
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+PRECIO = 1000
+
+
+def _preparar(ruta):
+    os.environ['DATABASE_URL'] = f'sqlite:///{ruta}'
+    os.environ.setdefault('SECRET_KEY', 'bench')
+    os.environ['DEFAULT_USERNAME'] = 'bench'
+    os.environ['DEFAULT_PASSWORD'] = 'bench'
+    from ..src.app import app
+    cliente = app.test_client()
+    cliente.post('/login', data={'username': 'bench', 'password': 'bench'})
+    return app, cliente
+
+
+def _trabajador(ruta, intentos, resultados):
+    _, cliente = _preparar(ruta)
+    aceptadas = rechazadas = errores = 0
+    for _ in range(intentos):
+        respuesta = cliente.post('/transactions', follow_redirects=True, data={
+            'tipo': 'compra_dolares', 'monto': '1', 'concepto': 'estres', 'precio_compra': str(PRECIO),
+        })
+        if 'registrada correctamente'.encode() in respuesta.data:
+            aceptadas += 1
+        elif 'Fondos insuficientes'.encode() in respuesta.data:
+            rechazadas += 1
+        else:
+            errores += 1
+    resultados.put((aceptadas, rechazadas, errores))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--procesos', type=int, default=8)
+    parser.add_argument('--cupo', type=int, default=2000, help="Compras que alcanza a pagar la caja.")
+    parser.add_argument('--exceso', type=float, default=1.5, help="Intentos totales sobre el cupo.")
+    args = parser.parse_args()
+
+    ruta = os.path.join(tempfile.mkdtemp(prefix='bench_saldos_'), 'database.db')
+    app, cliente = _preparar(ruta)
+    with app.app_context():
+        from ..src.migraciones import aplicar_migraciones
+        aplicar_migraciones()
+    cliente.post('/caja/inicial', data={'pesos': str(args.cupo * PRECIO), 'dolares': '0'})
+
+    intentos = int(args.cupo * args.exceso / args.procesos) + 1
+    contexto = multiprocessing.get_context('spawn')
+    resultados = contexto.Queue()
+    procesos = [
+        contexto.Process(target=_trabajador, args=(ruta, intentos, resultados))
+        for _ in range(args.procesos)
+    ]
+    t0 = time.perf_counter()
+    for proceso in procesos:
+        proceso.start()
+    aceptadas = rechazadas = errores = 0
+    for _ in procesos:
+        a, r, e = resultados.get()
+        aceptadas, rechazadas, errores = aceptadas + a, rechazadas + r, errores + e
+    for proceso in procesos:
+        proceso.join()
+    segundos = time.perf_counter() - t0
+
+    from ..src.libro_caja import caja_actual, saldo_caja, verificar_saldos
+    with app.app_context():
+        saldo = saldo_caja(caja_actual())
+        diferencias = verificar_saldos()
+
+    total = aceptadas + rechazadas + errores
+    print(f"{total} requests en {segundos:.1f}s ({total / segundos:,.0f} req/s), {args.procesos} procesos")
+    print(f"aceptadas {aceptadas}, sin fondos {rechazadas}, errores {errores}")
+    print(f"saldo final: {saldo.pesos} pesos, {saldo.dolares} dólares; diferencias en snapshots: {len(diferencias)}")
+    correcto = aceptadas == args.cupo and saldo.pesos == 0 and saldo.dolares == args.cupo and not diferencias
+    print("OK" if correcto else "FALLA: el saldo no coincide con las compras aceptadas")
+    if not correcto:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
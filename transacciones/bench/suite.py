@@ -0,0 +1,211 @@
+# suite.py
+"""
+Suite de benchmarks de las vistas sobre un libro sintético. Corre sin red (cotización fija)
+y guarda los resultados en JSON para comparar entre commits:
+
+    python -m transacciones.bench.suite --filas 100000 --salida resultados.json
+    python -m transacciones.bench.suite --filas 100000 --comparar resultados.json
+
+Cada escenario informa operaciones por segundo, percentiles de latencia, consultas SQL por
+request (del header Server-Timing) y las operaciones que terminaron con un mensaje de error.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import re
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+RANGOS = ('daily', 'weekly', 'monthly', 'yearly', 'all')
+FILTROS_HISTORIAL = {
+    'sin_filtro': {},
+    'tipo': {'type': 'venta_dolares'},
+    'concepto': {'concept': 'cliente 42'},
+    'fechas': {'start_date': '{hace_30}', 'end_date': '{hoy}'},
+    'combinado': {'type': 'compra_dolares', 'concept': 'cliente', 'start_date': '{hace_30}'},
+}
+# Formularios de alta, uno por tipo, que la caja sintética siempre puede pagar
+ALTAS = (
+    {'tipo': 'compra_dolares', 'monto': '10', 'precio_compra': '1000'},
+    {'tipo': 'venta_dolares', 'monto': '10', 'precio_venta': '1050', 'precio_compra': '1000'},
+    {'tipo': 'compra_pesos', 'monto': '10000', 'precio_compra': '1000'},
+    {'tipo': 'venta_pesos', 'monto': '10000', 'precio_venta': '1050', 'precio_compra': '1000'},
+    {'tipo': 'cable_subida', 'monto': '100', 'comision': '1'},
+    {'tipo': 'cable_bajada', 'monto': '100', 'comision': '1'},
+    {'tipo': 'cash_to_cash', 'monto': '100', 'comision': '1'},
+    {'tipo': 'descuento_cheque', 'monto': '100000', 'descuento_cheque': '2'},
+)
+
+
+class Cliente:
+    """
+    test_client logueado que mide cada request y revisa los mensajes flash que deja.
+    """
+
+    def __init__(self, app):
+        self.cliente = app.test_client()
+        self.cliente.post('/login', data={'username': 'bench', 'password': 'bench'})
+
+    def medir(self, metodo, ruta, **kwargs):
+        t0 = time.perf_counter()
+        respuesta = self.cliente.open(ruta, method=metodo, **kwargs)
+        if respuesta.is_streamed:
+            b''.join(respuesta.response)
+        segundos = time.perf_counter() - t0
+        consultas = re.search(r'desc="(\d+) consultas"', respuesta.headers.get('Server-Timing', ''))
+        with self.cliente.session_transaction() as sesion:
+            mensajes = sesion.pop('_flashes', [])
+        error = respuesta.status_code >= 400 or any(categoria == 'error' for categoria, _ in mensajes)
+        return segundos, int(consultas.group(1)) if consultas else None, error
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(int(len(ordenados) * p), len(ordenados) - 1)]
+
+
+def _resumir(mediciones):
+    segundos = [s for s, _, _ in mediciones]
+    consultas = [c for _, c, _ in mediciones if c is not None]
+    total = sum(segundos)
+    return {
+        'operaciones': len(mediciones),
+        'ops_por_segundo': round(len(mediciones) / total, 2) if total else None,
+        'p50_ms': round(_percentil(segundos, 0.5) * 1000, 3),
+        'p95_ms': round(_percentil(segundos, 0.95) * 1000, 3),
+        'p99_ms': round(_percentil(segundos, 0.99) * 1000, 3),
+        'consultas_sql': round(statistics.mean(consultas), 1) if consultas else None,
+        'errores': sum(1 for _, _, error in mediciones if error),
+    }
+
+
+def escenarios(cliente, rng, repeticiones, ids):
+    """
+    Devuelve [(nombre, función que corre el escenario y devuelve sus mediciones)]. Los de
+    escritura van al final para que las lecturas se midan todas sobre el mismo libro.
+    """
+    hoy = datetime.date.today()
+    fechas = {'hoy': hoy.isoformat(), 'hace_30': (hoy - datetime.timedelta(days=30)).isoformat()}
+    editadas = rng.sample(ids, min(repeticiones, len(ids)))
+    restantes = sorted(set(ids) - set(editadas))
+    eliminadas = rng.sample(restantes, min(repeticiones, len(restantes)))
+
+    def leer(ruta, parametros, veces=repeticiones):
+        return lambda: [cliente.medir('GET', ruta, query_string=parametros) for _ in range(veces)]
+
+    lista = [
+        (f'historial_{nombre}', leer('/historial', {c: v.format(**fechas) for c, v in filtro.items()}))
+        for nombre, filtro in FILTROS_HISTORIAL.items()
+    ]
+    lista.append(('historial_stream', leer(
+        '/historial', {'stream': 1, 'type': 'cable_subida', 'start_date': fechas['hace_30']},
+        max(repeticiones // 10, 1),
+    )))
+    lista += [(f'stats_{rango}', leer('/stats', {'range': rango})) for rango in RANGOS]
+    lista.append(('transactions_post', lambda: [
+        cliente.medir('POST', '/transactions', data={'concepto': 'bench', **ALTAS[i % len(ALTAS)]})
+        for i in range(repeticiones)
+    ]))
+    lista.append(('transactions_edit', lambda: [
+        cliente.medir('POST', f'/transactions/edit/{transaction_id}', data={
+            'type': 'compra_dolares', 'amount': '5', 'exchange_rate': '1000', 'comision': '0', 'concept': 'editada',
+        })
+        for transaction_id in editadas
+    ]))
+    lista.append(('transactions_delete', lambda: [
+        cliente.medir('POST', f'/transactions/delete/{transaction_id}') for transaction_id in eliminadas
+    ]))
+    return lista
+
+
+def _commit_actual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _comparar(resultados, ruta):
+    with open(ruta) as archivo:
+        anteriores = json.load(archivo)
+    print(f"\nContra {ruta} (commit {anteriores.get('commit')}, {anteriores.get('filas')} filas):")
+    for nombre, actual in resultados['escenarios'].items():
+        anterior = anteriores['escenarios'].get(nombre)
+        if not anterior or not anterior['p50_ms']:
+            continue
+        cambio = actual['p50_ms'] / anterior['p50_ms']
+        marca = '  <-- más lento' if cambio > 1.2 else ''
+        print(f"{nombre:28} p50 {anterior['p50_ms']:9.2f} -> {actual['p50_ms']:9.2f} ms ({cambio:5.2f}x){marca}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--filas', type=int, default=100000, help="Transacciones del libro sintético.")
+    parser.add_argument('--repeticiones', type=int, default=50, help="Operaciones por escenario.")
+    parser.add_argument('--semilla', type=int, default=1234)
+    parser.add_argument('--escenarios', nargs='+', default=None, help="Sólo estos escenarios (prefijos).")
+    parser.add_argument('--salida', default='bench_resultados.json', help="Archivo JSON de resultados.")
+    parser.add_argument('--comparar', default=None, help="JSON de una corrida anterior para comparar.")
+    args = parser.parse_args()
+
+    from ..src.app import create_app
+    from ..src.cotizaciones import ProveedorFijo
+    from ..src.models import db, Transaction
+    from ..src.resumenes import reconstruir_resumen
+    from .generador import generar_libro
+
+    directorio = tempfile.mkdtemp(prefix='bench_suite_')
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(directorio, "database.db")}',
+        'SECRET_KEY': 'bench', 'DEFAULT_USERNAME': 'bench', 'DEFAULT_PASSWORD': 'bench',
+        'COTIZACION_PROVEEDOR': ProveedorFijo(1000, 1020),
+        'COTIZACION_CACHE_PATH': os.path.join(directorio, 'cotizacion.db'),
+        'METRICAS_DIR': os.path.join(directorio, 'metricas'),
+        'METRICAS_SQL_LENTA_MS': float('inf'),
+    })
+
+    t0 = time.perf_counter()
+    with app.app_context():
+        generar_libro(args.filas, semilla=args.semilla)
+        ids = [fila.id for fila in db.session.query(Transaction.id)]
+        reconstruir_resumen()
+        db.session.commit()
+    print(f"Libro de {args.filas} transacciones generado en {time.perf_counter() - t0:.1f}s")
+
+    resultados = {
+        'commit': _commit_actual(),
+        'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'filas': args.filas,
+        'repeticiones': args.repeticiones,
+        'semilla': args.semilla,
+        'escenarios': {},
+    }
+    cliente = Cliente(app)
+    rng = random.Random(args.semilla)
+    for nombre, correr in escenarios(cliente, rng, args.repeticiones, ids):
+        if args.escenarios and not any(nombre.startswith(prefijo) for prefijo in args.escenarios):
+            continue
+        resumen = resultados['escenarios'][nombre] = _resumir(correr())
+        print(f"{nombre:28} {resumen['ops_por_segundo']:9.1f} ops/s  p50 {resumen['p50_ms']:8.2f} ms  "
+              f"p99 {resumen['p99_ms']:8.2f} ms  sql {resumen['consultas_sql']}  errores {resumen['errores']}")
+
+    with open(args.salida, 'w') as archivo:
+        json.dump(resultados, archivo, indent=2)
+    print(f"Resultados en {args.salida}")
+    if args.comparar:
+        _comparar(resultados, args.comparar)
+
+
+if __name__ == '__main__':
+    main()
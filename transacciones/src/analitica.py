@@ -0,0 +1,191 @@
+# analitica.py
+"""
+Estadísticas y series por período calculadas en memoria.
+
+Las columnas se leen con un cursor de la DB-API, sin objetos del ORM ni un Decimal por campo,
+a arreglos tipados (`array('q')`) de enteros en unidades mínimas. Con NumPy instalado las sumas
+se hacen vectorizadas sobre esos mismos buffers; sin NumPy se recorren en Python.
+
+Hay dos fuentes con las mismas columnas: el resumen diario (una fila por día y tipo) y el libro
+(una fila por transacción, con cantidad 1 y los importes que calcula importes_por_fila).
+"""
+import datetime
+from array import array
+
+from .dinero import ESCALA_TASA, desde_entero
+from .models import db
+from .operaciones import TIPOS_VALIDOS
+
+PERIODOS = ('daily', 'weekly', 'monthly')
+FUENTES = ('resumen', 'libro')
+ESTADISTICAS = (
+    'total_dolares_vendidos', 'total_pesos_vendidos', 'total_ganancias',
+    'total_perdidas', 'total_comisiones', 'total_descuentos_cheques',
+)
+COLUMNAS = ('dia', 'tipo', 'cantidad', 'volumen', 'volumen_usd', 'comisiones', 'descuentos', 'ganancias', 'perdidas')
+LOTE_LECTURA = 10000
+
+# El tipo viaja como su posición en TIPOS_VALIDOS para poder guardarlo en un arreglo de enteros
+CODIGOS = {tipo: codigo for codigo, tipo in enumerate(TIPOS_VALIDOS)}
+VENTA_DOLARES = CODIGOS['venta_dolares']
+VENTA_PESOS = CODIGOS['venta_pesos']
+CABLES = (CODIGOS['cable_subida'], CODIGOS['cable_bajada'])
+DESCUENTO_CHEQUE = CODIGOS['descuento_cheque']
+
+
+def _sql_codigo(columna):
+    return f"CASE {columna} " + " ".join(f"WHEN '{tipo}' THEN {codigo}" for tipo, codigo in CODIGOS.items()) + " END"
+
+
+def _sql_dia(columna):
+    # Ordinal de la fecha (date.toordinal). julianday() cuenta desde el mediodía, de ahí el .5
+    return f"CAST(julianday({columna}) - 1721424.5 AS INTEGER)"
+
+
+CONSULTAS = {
+    'resumen': (
+        f"SELECT {_sql_dia('r.fecha')}, {_sql_codigo('r.tipo')}, r.cantidad, r.volumen, r.volumen_usd,"
+        " r.comisiones, r.descuentos, r.ganancias, r.perdidas"
+        " FROM resumen_diario r WHERE r.fecha >= ?"
+    ),
+    # Mismos importes y redondeo que estadisticas.importes_por_fila
+    'libro': (
+        f"SELECT {_sql_dia('t.fecha_hora')}, {_sql_codigo('t.tipo')}, 1, t.monto,"
+        f" coalesce(CAST(round(t.monto * {float(10 ** ESCALA_TASA)} / nullif(t.tasa_cambio, 0)) AS INTEGER), 0),"
+        " coalesce(t.comision, 0),"
+        " coalesce(t.descuento_cheque, 0), max(coalesce(c.resultado, 0), 0), max(-coalesce(c.resultado, 0), 0)"
+        ' FROM "transaction" t LEFT OUTER JOIN costo_transaccion c ON c.transaction_id = t.id'
+        " WHERE t.fecha_hora >= ?"
+    ),
+}
+FILTRO_CAJA = {'resumen': " AND r.caja_id = ?", 'libro': " AND t.caja_id = ?"}
+
+
+def numpy_disponible():
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def leer_columnas(inicio, fuente='resumen', caja_id=None):
+    """
+    Columnas de `fuente` desde `inicio`, como {nombre: array('q')}, leídas en lotes con un cursor
+    crudo dentro de la transacción de la sesión. El resumen se filtra por días completos; con
+    `caja_id`, sólo las filas de esa sucursal.
+    """
+    desde = inicio.date().isoformat() if fuente == 'resumen' else inicio.isoformat(' ', 'microseconds')
+    consulta, parametros = CONSULTAS[fuente], (desde,)
+    if caja_id is not None:
+        consulta, parametros = consulta + FILTRO_CAJA[fuente], (desde, caja_id)
+    columnas = {nombre: array('q') for nombre in COLUMNAS}
+    destinos = [columnas[nombre] for nombre in COLUMNAS]
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.execute(consulta, parametros)
+        while True:
+            filas = cursor.fetchmany(LOTE_LECTURA)
+            if not filas:
+                break
+            for destino, valores in zip(destinos, zip(*filas)):
+                destino.extend(valores)
+    finally:
+        cursor.close()
+    return columnas
+
+
+def agrupar_python(columnas, por_dia=True):
+    """
+    {día: [cantidad, *ESTADISTICAS]} en unidades mínimas, recorriendo las filas en Python.
+    Con `por_dia` falso todo queda bajo la clave None.
+    """
+    grupos = {}
+    filas = zip(*(columnas[nombre] for nombre in COLUMNAS))
+    for dia, tipo, cantidad, volumen, volumen_usd, comisiones, descuentos, ganancias, perdidas in filas:
+        clave = dia if por_dia else None
+        fila = grupos.get(clave)
+        if fila is None:
+            fila = grupos[clave] = [0] * (len(ESTADISTICAS) + 1)
+        fila[0] += cantidad
+        if tipo == VENTA_DOLARES:
+            fila[1] += volumen
+        elif tipo == VENTA_PESOS:
+            fila[2] += volumen_usd
+        elif tipo in CABLES:
+            fila[5] += comisiones
+        elif tipo == DESCUENTO_CHEQUE:
+            fila[6] += descuentos
+        fila[3] += ganancias
+        fila[4] += perdidas
+    return grupos
+
+
+def agrupar_numpy(columnas, por_dia=True):
+    """
+    Igual que `agrupar_python`, vectorizado con NumPy sobre los buffers de los arreglos (sin copiarlos).
+    """
+    import numpy as np
+
+    c = {nombre: np.frombuffer(columnas[nombre], dtype=np.int64) for nombre in COLUMNAS}
+    tipo = c['tipo']
+    if not len(tipo):
+        return {}
+    aportes = np.stack((
+        c['cantidad'],
+        np.where(tipo == VENTA_DOLARES, c['volumen'], 0),
+        np.where(tipo == VENTA_PESOS, c['volumen_usd'], 0),
+        c['ganancias'],
+        c['perdidas'],
+        np.where(np.isin(tipo, CABLES), c['comisiones'], 0),
+        np.where(tipo == DESCUENTO_CHEQUE, c['descuentos'], 0),
+    ))
+    if not por_dia:
+        return {None: aportes.sum(axis=1).tolist()}
+
+    # Las filas no vienen ordenadas: se ordenan por día para que cada día quede en un tramo contiguo
+    orden = np.argsort(c['dia'], kind='stable')
+    dias = c['dia'][orden]
+    inicios = np.flatnonzero(np.concatenate(([True], dias[1:] != dias[:-1])))
+    sumas = np.add.reduceat(aportes[:, orden], inicios, axis=1)
+    return dict(zip(dias[inicios].tolist(), sumas.T.tolist()))
+
+
+def _inicio_periodo(dia, periodo):
+    fecha = datetime.date.fromordinal(dia)
+    if periodo == 'weekly':
+        return fecha - datetime.timedelta(days=fecha.weekday())
+    if periodo == 'monthly':
+        return fecha.replace(day=1)
+    return fecha
+
+
+def _a_decimales(valores):
+    return {nombre: desde_entero(valor) for nombre, valor in zip(ESTADISTICAS, valores)}
+
+
+def analizar(inicio, periodo=None, fuente='resumen', usar_numpy=None, caja_id=None):
+    """
+    Devuelve (totales, serie) desde `inicio`, de todas las sucursales o sólo de `caja_id`. Los totales
+    tienen las mismas claves que `calcular_estadisticas`; la serie, si se pide un período (daily,
+    weekly o monthly), es una lista de {periodo: fecha de inicio, cantidad, *estadísticas} en orden
+    cronológico.
+    """
+    if usar_numpy is None:
+        usar_numpy = numpy_disponible()
+    agrupar = agrupar_numpy if usar_numpy else agrupar_python
+    grupos = agrupar(leer_columnas(inicio, fuente, caja_id), por_dia=periodo is not None)
+
+    # Los días se pliegan en semanas o meses en Python: son pocos comparados con las filas
+    acumulado = [0] * (len(ESTADISTICAS) + 1)
+    periodos = {}
+    for dia in sorted(grupos, key=lambda d: d or 0):
+        valores = grupos[dia]
+        acumulado = [a + v for a, v in zip(acumulado, valores)]
+        if periodo is not None:
+            clave = _inicio_periodo(dia, periodo)
+            anterior = periodos.get(clave)
+            periodos[clave] = valores if anterior is None else [a + v for a, v in zip(anterior, valores)]
+    serie = [{'periodo': clave, 'cantidad': valores[0], **_a_decimales(valores[1:])}
+             for clave, valores in periodos.items()]
+    return _a_decimales(acumulado[1:]), serie
@@ -0,0 +1,467 @@
+# api.py
+# API JSON versionada para terminales y clientes de alto volumen.
+import datetime
+import hmac
+from decimal import Decimal, InvalidOperation
+
+from flask import Blueprint, current_app, g, jsonify, request, send_file, url_for
+
+from .analitica import PERIODOS, analizar
+from .cierres import TOTALES, cerrar_dia, cierres_entre, leer_fecha, reporte_de, saldo_a_fecha
+from .escrituras import con_reintentos
+from .estadisticas import estadisticas_desde_resumen, inicio_de_rango
+from .exportacion import COLUMNAS_EXPORTACION, FORMATOS_EXPORTACION
+from .historial import filtrar_transacciones, obtener_pagina
+from .importacion import preparar_fila
+from .libro_caja import caja_actual, caja_de, saldo_caja
+from .models import db, Caja, Transaction
+from .operaciones import OperacionInvalida, agregar_transaccion, quitar_transaccion, validar_precio_costo
+from .resumenes import rango_afectado, reconstruir_resumen, unir_rangos
+from .serie_cotizaciones import FUENTE_BLUE, leer_fecha_hora, serie_cotizaciones
+from .sucursales import elegir_sucursal, estadisticas_consolidadas, saldos_por_sucursal
+from .trabajos import cola_trabajos
+from .valuacion import rango_valuacion, valuar_caja
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+class ErrorApi(Exception):
+    def __init__(self, mensaje, estado=400, detalle=None):
+        super().__init__(mensaje)
+        self.estado = estado
+        self.detalle = detalle
+
+
+@api.errorhandler(ErrorApi)
+def _error_api(error):
+    cuerpo = {'error': str(error)}
+    if error.detalle:
+        cuerpo['detalle'] = error.detalle
+    return jsonify(cuerpo), error.estado
+
+
+@api.before_request
+def _autenticar():
+    """
+    Autenticación por token en el header Authorization. No usa ni modifica la cookie de sesión.
+    """
+    esquema, _, token = request.headers.get('Authorization', '').partition(' ')
+    validos = current_app.config.get('API_TOKENS') or []
+    if esquema.lower() != 'bearer' or not any(
+        hmac.compare_digest(token.encode(), valido.encode()) for valido in validos
+    ):
+        raise ErrorApi("Token inválido o ausente.", 401)
+    # Sucursal con la que se opera: header X-Caja con el id de su caja
+    if not elegir_sucursal(request.headers.get('X-Caja')):
+        raise ErrorApi("Sucursal inexistente.", 404)
+
+
+def _valor_json(valor):
+    if isinstance(valor, Decimal):
+        return str(valor)  # Los montos viajan como texto para no perder precisión
+    if isinstance(valor, datetime.date):
+        return valor.isoformat()
+    return valor
+
+
+def transaccion_a_json(transaccion):
+    return {columna: _valor_json(getattr(transaccion, columna)) for columna in COLUMNAS_EXPORTACION}
+
+
+def _condicional(cuerpo):
+    """
+    Respuesta JSON con ETag; si el cliente ya tiene esa versión (If-None-Match) se responde 304.
+    """
+    respuesta = jsonify(cuerpo)
+    respuesta.add_etag()
+    return respuesta.make_conditional(request)
+
+
+def _cuerpo_json():
+    cuerpo = request.get_json(silent=True)
+    if cuerpo is None:
+        raise ErrorApi("Se esperaba un cuerpo JSON.")
+    return cuerpo
+
+
+def _lista(cuerpo, clave):
+    elementos = cuerpo.get(clave) if isinstance(cuerpo, dict) else None
+    if not isinstance(elementos, list) or not elementos:
+        raise ErrorApi(f"Se esperaba una lista no vacía en '{clave}'.")
+    if len(elementos) > current_app.config['API_MAX_LOTE']:
+        raise ErrorApi(f"El lote supera el máximo de {current_app.config['API_MAX_LOTE']} operaciones.", 413)
+    return elementos
+
+
+def _caja():
+    caja = caja_actual()
+    if not caja:
+        raise ErrorApi("Primero debes configurar la caja inicial.", 409)
+    return caja
+
+
+def _saldo_json(saldo):
+    return {'pesos': str(saldo.pesos), 'dolares': str(saldo.dolares)}
+
+
+def crear_transacciones(filas):
+    """
+    Aplica todas las altas en una única transacción de base de datos: si alguna falla no se guarda ninguna.
+    Devuelve (transacciones creadas, saldo final).
+    """
+    ahora = datetime.datetime.now()
+
+    def crear():
+        caja = _caja()
+        saldo = saldo_caja(caja)
+        creadas, errores, rangos = [], [], []
+        for indice, fila in enumerate(filas):
+            try:
+                valores, pesos_delta, dolares_delta = preparar_fila(fila, ahora)
+                validar_precio_costo(caja.id, valores['tipo'], valores['precio_compra'])
+                transaccion, saldo = agregar_transaccion(caja, saldo, valores, pesos_delta, dolares_delta)
+            except (ValueError, InvalidOperation) as e:
+                errores.append({'indice': indice, 'error': str(e)})
+                continue
+            creadas.append(transaccion)
+            rangos.append(rango_afectado(transaccion.tipo, transaccion.fecha_hora))
+        if errores:
+            db.session.rollback()
+            raise ErrorApi("No se aplicó ninguna operación.", 422, errores)
+        reconstruir_resumen(*unir_rangos(*rangos))
+        db.session.commit()
+        return [transaccion_a_json(t) for t in creadas], _saldo_json(saldo)
+
+    return con_reintentos(crear)
+
+
+def _transaccion(transaction_id):
+    """
+    Transacción de la sucursal elegida (de cualquiera si no se eligió, como el historial), o None.
+    """
+    transaccion = db.session.get(Transaction, transaction_id) if isinstance(transaction_id, int) else None
+    caja_id = g.get('caja_id')
+    if transaccion is None or (caja_id is not None and transaccion.caja_id != caja_id):
+        return None
+    return transaccion
+
+
+def eliminar_transacciones(ids):
+    """
+    Elimina todas las transacciones en una única transacción de base de datos, o ninguna.
+    """
+    def eliminar():
+        _caja()
+        saldos = {}  # Saldo de cada caja afectada, que las reversiones van actualizando
+        errores, rangos = [], []
+        for indice, transaction_id in enumerate(ids):
+            transaccion = _transaccion(transaction_id)
+            if not transaccion:
+                errores.append({'indice': indice, 'error': "Transacción no encontrada."})
+                continue
+            caja = caja_de(transaccion)
+            if caja.id not in saldos:
+                saldos[caja.id] = saldo_caja(caja)
+            try:
+                rango, saldos[caja.id] = quitar_transaccion(caja, saldos[caja.id], transaccion)
+            except OperacionInvalida as e:
+                errores.append({'indice': indice, 'error': str(e)})
+                continue
+            rangos.append(rango)
+        if errores:
+            db.session.rollback()
+            raise ErrorApi("No se aplicó ninguna operación.", 422, errores)
+        reconstruir_resumen(*unir_rangos(*rangos))
+        db.session.commit()
+        # Saldo de la caja que cambió; sin sucursal elegida puede haber varias y se informa la actual
+        caja_id = next(iter(saldos)) if len(saldos) == 1 else _caja().id
+        return _saldo_json(saldos.get(caja_id) or saldo_caja(db.session.get(Caja, caja_id)))
+
+    return con_reintentos(eliminar)
+
+
+@api.route('/transactions', methods=['GET'])
+def listar_transacciones():
+    """
+    Historial con los mismos filtros que la vista HTML, paginado por cursor.
+    """
+    query, errores = filtrar_transacciones(request.args, g.get('caja_id'))
+    if errores:
+        raise ErrorApi(" ".join(errores))
+    por_pagina = request.args.get('per_page', type=int, default=current_app.config['HISTORIAL_POR_PAGINA'])
+    por_pagina = min(max(por_pagina, 1), current_app.config['HISTORIAL_MAX_POR_PAGINA'])
+    transacciones, cursor_siguiente = obtener_pagina(query, request.args.get('cursor'), por_pagina)
+    return _condicional({
+        'transacciones': [transaccion_a_json(t) for t in transacciones],
+        'cursor_siguiente': cursor_siguiente,
+    })
+
+
+@api.route('/transactions/<int:transaction_id>', methods=['GET'])
+def ver_transaccion(transaction_id):
+    transaccion = _transaccion(transaction_id)
+    if not transaccion:
+        raise ErrorApi("Transacción no encontrada.", 404)
+    return _condicional(transaccion_a_json(transaccion))
+
+
+@api.route('/transactions', methods=['POST'])
+def crear_transaccion():
+    creadas, saldo = crear_transacciones([_cuerpo_json()])
+    return jsonify({'transaccion': creadas[0], 'caja': saldo}), 201
+
+
+@api.route('/transactions/batch', methods=['POST'])
+def crear_lote():
+    """
+    Cuerpo: {"transacciones": [{tipo, monto, concepto, comision, descuento_cheque,
+    precio_compra, precio_venta, fecha_hora}, ...]}. Todo o nada.
+    """
+    creadas, saldo = crear_transacciones(_lista(_cuerpo_json(), 'transacciones'))
+    return jsonify({'transacciones': creadas, 'caja': saldo}), 201
+
+
+@api.route('/transactions/<int:transaction_id>', methods=['DELETE'])
+def eliminar_transaccion(transaction_id):
+    if not _transaccion(transaction_id):
+        raise ErrorApi("Transacción no encontrada.", 404)
+    return jsonify({'caja': eliminar_transacciones([transaction_id])})
+
+
+@api.route('/transactions/batch-delete', methods=['POST'])
+def eliminar_lote():
+    """
+    Cuerpo: {"ids": [1, 2, ...]}. Todo o nada.
+    """
+    return jsonify({'caja': eliminar_transacciones(_lista(_cuerpo_json(), 'ids'))})
+
+
+@api.route('/impacto', methods=['POST'])
+def simular_impacto():
+    """
+    Calcula el efecto de una transacción sobre la caja sin guardarla.
+    """
+    try:
+        valores, pesos_delta, dolares_delta = preparar_fila(_cuerpo_json(), datetime.datetime.now())
+    except (ValueError, InvalidOperation) as e:
+        raise ErrorApi(str(e), 422)
+    return jsonify({
+        'pesos': str(pesos_delta), 'dolares': str(dolares_delta),
+        'comision': str(valores['comision']), 'descuento_cheque': str(valores['descuento_cheque']),
+    })
+
+
+@api.route('/caja', methods=['GET'])
+def ver_caja():
+    """
+    Saldo actual o, con `fecha` (AAAA-MM-DD), el saldo al final de ese día según los cierres.
+    """
+    fecha = request.args.get('fecha')
+    if not fecha:
+        return _condicional(_saldo_json(saldo_caja(_caja())))
+    try:
+        return _condicional(dict(_saldo_json(saldo_a_fecha(_caja(), leer_fecha(fecha))), fecha=fecha))
+    except ValueError as e:
+        raise ErrorApi(str(e))
+
+
+def cierre_a_json(cierre, por_tipo=None):
+    campos = ('fecha', 'pesos', 'dolares', 'cantidad', 'comisiones', 'descuentos', 'ganancias', 'perdidas', 'cerrado_en')
+    cuerpo = {campo: _valor_json(getattr(cierre, campo)) for campo in campos}
+    if por_tipo is not None:
+        cuerpo['por_tipo'] = {
+            fila.tipo: {total: _valor_json(getattr(fila, total)) for total in TOTALES} for fila in por_tipo
+        }
+    return cuerpo
+
+
+@api.route('/caja/cierres', methods=['GET'])
+def listar_cierres():
+    """
+    Cierres entre desde y hasta (por defecto, los últimos 30 días), del más reciente al más viejo.
+    """
+    desde, hasta, errores = rango_valuacion(request.args)
+    if errores:
+        raise ErrorApi(" ".join(errores))
+    return _condicional({'cierres': [cierre_a_json(c) for c in cierres_entre(_caja().id, desde, hasta)]})
+
+
+@api.route('/caja/cierres', methods=['POST'])
+def cerrar_caja():
+    """
+    Cierra el día {"fecha": "AAAA-MM-DD"} (por defecto, hoy). Volver a cerrar un día lo reemplaza.
+    """
+    cuerpo = request.get_json(silent=True) or {}
+    try:
+        fecha = leer_fecha(cuerpo['fecha']) if cuerpo.get('fecha') else None
+    except ValueError as e:
+        raise ErrorApi(str(e))
+
+    def cerrar():
+        cierre = cerrar_dia(_caja(), fecha)
+        db.session.commit()
+        return reporte_de(cierre.caja_id, cierre.fecha)
+
+    try:
+        reporte = con_reintentos(cerrar)
+    except ValueError as e:
+        raise ErrorApi(str(e), 422)
+    return jsonify(cierre_a_json(*reporte)), 201
+
+
+@api.route('/caja/cierres/<fecha>', methods=['GET'])
+def ver_cierre(fecha):
+    try:
+        reporte = reporte_de(_caja().id, leer_fecha(fecha))
+    except ValueError as e:
+        raise ErrorApi(str(e))
+    if reporte is None:
+        raise ErrorApi("Ese día no se cerró.", 404)
+    return _condicional(cierre_a_json(*reporte))
+
+
+@api.route('/caja/valuacion', methods=['GET'])
+def ver_valuacion_caja():
+    """
+    Saldo al cierre de cada día entre desde y hasta, con los dólares a la cotización histórica.
+    """
+    desde, hasta, errores = rango_valuacion(request.args)
+    if errores:
+        raise ErrorApi(" ".join(errores))
+    fuente = request.args.get('fuente', FUENTE_BLUE)
+    valuaciones = valuar_caja(_caja(), desde, hasta, serie_cotizaciones(), fuente)
+    return _condicional({
+        'fuente': fuente,
+        'valuaciones': [{campo: _valor_json(valor) for campo, valor in v._asdict().items()} for v in valuaciones],
+    })
+
+
+def trabajo_a_json(trabajo):
+    cuerpo = {clave: _valor_json(valor) for clave, valor in trabajo.items() if clave not in ('archivo', 'latido')}
+    if trabajo['archivo'] and trabajo['estado'] == 'terminado':
+        cuerpo['archivo'] = url_for('api.descargar_trabajo', trabajo_id=trabajo['id'])
+    return cuerpo
+
+
+def _trabajo(trabajo_id):
+    trabajo = cola_trabajos().ver(trabajo_id)
+    if not trabajo or trabajo['caja_id'] != g.get('caja_id', trabajo['caja_id']):
+        raise ErrorApi("Trabajo no encontrado.", 404)
+    return trabajo
+
+
+@api.route('/trabajos', methods=['POST'])
+def encolar_trabajo():
+    """
+    Encola un trabajo en segundo plano: {"tipo": ..., "parametros": {...}}. Responde 202 enseguida;
+    el estado y el avance se consultan en la URL de Location.
+    """
+    cuerpo = _cuerpo_json()
+    parametros = cuerpo.get('parametros') or {}
+    if not isinstance(parametros, dict):
+        raise ErrorApi("'parametros' debe ser un objeto.")
+    if cuerpo.get('tipo') == 'importar':
+        raise ErrorApi("Las importaciones en segundo plano se cargan desde el formulario de transacciones.")
+    try:
+        trabajo_id = cola_trabajos().encolar(cuerpo.get('tipo'), parametros, g.get('caja_id'))
+    except ValueError as e:
+        raise ErrorApi(str(e))
+    respuesta = jsonify(trabajo_a_json(cola_trabajos().ver(trabajo_id)))
+    respuesta.status_code = 202
+    respuesta.headers['Location'] = url_for('api.ver_trabajo', trabajo_id=trabajo_id)
+    return respuesta
+
+
+@api.route('/trabajos', methods=['GET'])
+def listar_trabajos():
+    return jsonify({'trabajos': [trabajo_a_json(t) for t in cola_trabajos().listar(caja_id=g.get('caja_id'))]})
+
+
+@api.route('/trabajos/<int:trabajo_id>', methods=['GET'])
+def ver_trabajo(trabajo_id):
+    return jsonify(trabajo_a_json(_trabajo(trabajo_id)))
+
+
+@api.route('/trabajos/<int:trabajo_id>/archivo', methods=['GET'])
+def descargar_trabajo(trabajo_id):
+    trabajo = _trabajo(trabajo_id)
+    if trabajo['estado'] != 'terminado' or not trabajo['archivo']:
+        raise ErrorApi("El trabajo no tiene un archivo para descargar.", 409)
+    mimetype, _ = FORMATOS_EXPORTACION[trabajo['parametros']['formato']]
+    return send_file(cola_trabajos().ruta(trabajo['archivo']), mimetype=mimetype, as_attachment=True,
+                     download_name=trabajo['archivo'])
+
+
+@api.route('/cotizacion', methods=['GET'])
+def ver_cotizacion():
+    """
+    Cotización vigente en `fecha` (ISO 8601; por defecto, ahora) según la serie histórica.
+    """
+    fecha = request.args.get('fecha')
+    try:
+        fecha_hora = leer_fecha_hora(fecha) if fecha else None
+    except ValueError:
+        raise ErrorApi("Fecha inválida. Use el formato ISO 8601.")
+    punto = serie_cotizaciones().en(fecha_hora, request.args.get('fuente', FUENTE_BLUE))
+    if punto is None:
+        raise ErrorApi("No hay una cotización registrada para esa fecha.", 404)
+    return _condicional({campo: _valor_json(valor) for campo, valor in punto._asdict().items()})
+
+
+@api.route('/cajas', methods=['GET'])
+def listar_cajas():
+    """
+    Saldo de cada sucursal, consultadas en paralelo.
+    """
+    return _condicional({'cajas': [
+        {'id': caja.id, 'nombre': caja.nombre, **(_saldo_json(saldo) if saldo else {'pesos': None, 'dolares': None})}
+        for caja, saldo in saldos_por_sucursal()
+    ]})
+
+
+@api.route('/stats/consolidado', methods=['GET'])
+def ver_estadisticas_consolidadas():
+    rango = request.args.get('range', 'daily')
+    por_sucursal, total = estadisticas_consolidadas(inicio_de_rango(rango))
+
+    def a_texto(estadisticas):
+        return {clave: str(valor) for clave, valor in estadisticas.items()}
+
+    return _condicional({
+        'rango': rango,
+        'total': a_texto(total),
+        'sucursales': [{'id': caja.id, 'nombre': caja.nombre, **a_texto(estadisticas)}
+                       for caja, estadisticas in por_sucursal],
+    })
+
+
+@api.route('/stats', methods=['GET'])
+def ver_estadisticas():
+    rango = request.args.get('range', 'daily')
+    # caja_id None: sin sucursal elegida (X-Caja), son las estadísticas de todo el negocio
+    caja_id = g.get('caja_id')
+    estadisticas = estadisticas_desde_resumen(inicio_de_rango(rango), caja_id)
+    return _condicional({
+        'rango': rango, 'caja_id': caja_id, **{clave: str(valor) for clave, valor in estadisticas.items()}
+    })
+
+
+@api.route('/stats/series', methods=['GET'])
+def ver_series():
+    """
+    Totales y serie por período (period: daily, weekly o monthly) para gráficos, calculados
+    en memoria sobre el resumen diario, de la sucursal elegida o de todo el negocio.
+    """
+    rango = request.args.get('range', 'monthly')
+    periodo = request.args.get('period', 'daily')
+    if periodo not in PERIODOS:
+        raise ErrorApi(f"Período inválido; se espera uno de: {', '.join(PERIODOS)}.")
+    caja_id = g.get('caja_id')
+    totales, serie = analizar(inicio_de_rango(rango), periodo, caja_id=caja_id)
+    return _condicional({
+        'rango': rango,
+        'periodo': periodo,
+        'caja_id': caja_id,
+        'totales': {clave: str(valor) for clave, valor in totales.items()},
+        'serie': [{clave: _valor_json(valor) for clave, valor in punto.items()} for punto in serie],
+    })
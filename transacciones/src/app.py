@@ -1,175 +1,365 @@
 # app.py
-from flask import Flask, render_template, request, redirect, url_for, session, flash
-from flask_sqlalchemy import SQLAlchemy
-from .config import SQLALCHEMY_DATABASE_URI, DEFAULT_USERNAME, DEFAULT_PASSWORD, SECRET_KEY
-from .models import db, Transaction, Caja
-from flask import jsonify
-import requests
-from .utils import get_dollar_price
+from flask import Flask, Blueprint, current_app, g, render_template, request, redirect, url_for, session, flash
+from flask import Response, send_file, stream_template, stream_with_context
+from . import config as configuracion
+from .models import db, Transaction
+from .cotizaciones import ServicioCotizacion
+from .estadisticas import estadisticas_desde_resumen, inicio_de_rango
+from .resumenes import rango_afectado, unir_rangos, reconstruir_resumen
+from .comandos import registrar_comandos
+from .api import api
+from .migraciones import aplicar_migraciones
+from .impactos import calcular_impacto, revertir_impacto
+from .costos import actualizar_costos
+from .operaciones import OperacionInvalida, exigir_sentido, validar_operacion, agregar_transaccion, quitar_transaccion
+from .libro_caja import caja_actual, caja_de, saldo_caja, saldo_actual, registrar_movimiento, crear_caja
+from .escrituras import configurar_transacciones, con_reintentos, escritura
+from .importacion import importar_transacciones, formato_desde_nombre
+from .exportacion import exportar, parquet_disponible, FORMATOS_EXPORTACION
+from .perfil_sqlite import configurar_sqlite
+from .metricas import configurar_metricas
+from .cache_vistas import CacheVistas, fragmento
+from .historial import filtrar_transacciones, ordenar_recientes, obtener_pagina
+from .serie_cotizaciones import SerieCotizaciones, serie_cotizaciones
+from .valuacion import rango_valuacion, valuar_caja
+from .cierres import cerrar_dia, cierres_entre, leer_fecha, reporte_de
+from .trabajos import TIPOS, cola_trabajos, configurar_trabajos
+from .sucursales import (configurar_sucursales, crear_sucursal, elegir_sucursal, estadisticas_consolidadas,
+                         nombre_sucursal, por_archivo, saldos_por_sucursal, sucursal_elegida)
 import datetime
+import inspect
+import io
+import uuid
 from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
 from markupsafe import Markup
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = SQLALCHEMY_DATABASE_URI
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = SECRET_KEY
-db.init_app(app)
+vistas = Blueprint('vistas', __name__)
+
+
+def configuracion_por_defecto():
+    """
+    Valores de config.py que usa la app.
+    """
+    valores = dict(
+        SQLALCHEMY_DATABASE_URI=configuracion.SQLALCHEMY_DATABASE_URI,
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        SQLITE_PRAGMAS=configuracion.SQLITE_PERFILES[configuracion.SQLITE_PERFIL],
+        SECRET_KEY=configuracion.SECRET_KEY,
+        DEFAULT_USERNAME=configuracion.DEFAULT_USERNAME,
+        DEFAULT_PASSWORD=configuracion.DEFAULT_PASSWORD,
+        MIGRAR_AL_INICIAR=configuracion.MIGRAR_AL_INICIAR,
+        COTIZACION_URL=configuracion.COTIZACION_URL,
+        COTIZACION_TTL=configuracion.COTIZACION_TTL,
+        COTIZACION_TIMEOUT=configuracion.COTIZACION_TIMEOUT,
+        COTIZACION_CACHE_PATH=configuracion.COTIZACION_CACHE_PATH,
+        HISTORIAL_POR_PAGINA=configuracion.HISTORIAL_POR_PAGINA,
+        HISTORIAL_MAX_POR_PAGINA=configuracion.HISTORIAL_MAX_POR_PAGINA,
+        HISTORIAL_LOTE_STREAM=configuracion.HISTORIAL_LOTE_STREAM,
+        IMPORTACION_LOTE=configuracion.IMPORTACION_LOTE,
+        EXPORTACION_LOTE=configuracion.EXPORTACION_LOTE,
+        REPRODUCCION_LOTE=configuracion.REPRODUCCION_LOTE,
+        API_TOKENS=configuracion.API_TOKENS,
+        API_MAX_LOTE=configuracion.API_MAX_LOTE,
+        ASGI_HILOS=configuracion.ASGI_HILOS,
+        METRICAS_HABILITADAS=configuracion.METRICAS_HABILITADAS,
+        METRICAS_DIR=configuracion.METRICAS_DIR,
+        METRICAS_INTERVALO=configuracion.METRICAS_INTERVALO,
+        METRICAS_TOKEN=configuracion.METRICAS_TOKEN,
+        METRICAS_PUBLICAS=configuracion.METRICAS_PUBLICAS,
+        METRICAS_SQL_LENTA_MS=configuracion.METRICAS_SQL_LENTA_MS,
+        METRICAS_SQL_LENTA_LOG=configuracion.METRICAS_SQL_LENTA_LOG,
+        METRICAS_SQL_LENTA_PARAMETROS=configuracion.METRICAS_SQL_LENTA_PARAMETROS,
+        CACHE_VISTAS_HABILITADA=configuracion.CACHE_VISTAS_HABILITADA,
+        CACHE_VISTAS_PATH=configuracion.CACHE_VISTAS_PATH,
+        CACHE_VISTAS_MAX=configuracion.CACHE_VISTAS_MAX,
+        SUCURSALES_DB_PLANTILLA=configuracion.SUCURSALES_DB_PLANTILLA,
+        SUCURSALES_HILOS=configuracion.SUCURSALES_HILOS,
+        TRABAJOS_DIR=configuracion.TRABAJOS_DIR,
+        TRABAJOS_PROCESOS=configuracion.TRABAJOS_PROCESOS,
+        TRABAJOS_INTERVALO=configuracion.TRABAJOS_INTERVALO,
+        TRABAJOS_VENCIDO=configuracion.TRABAJOS_VENCIDO,
+        TRABAJOS_INTENTOS=configuracion.TRABAJOS_INTENTOS,
+        TRABAJOS_RETENCION_DIAS=configuracion.TRABAJOS_RETENCION_DIAS,
+    )
+    if configuracion.SQLALCHEMY_DATABASE_URI.startswith('sqlite:///'):
+        valores['SQLALCHEMY_ENGINE_OPTIONS'] = configuracion.SQLALCHEMY_ENGINE_OPTIONS
+    return valores
+
+
+def create_app(config=None):
+    """
+    Crea y configura la app. `config` pisa los valores de config.py.
+
+    El esquema se migra una sola vez al crear la app y no en cada request; con
+    `gunicorn --preload` esto corre en el proceso maestro antes del fork. Con
+    MIGRAR_AL_INICIAR=0 queda a cargo de `flask --app transacciones.src.app bd migrar`.
+    """
+    app = Flask(__name__)
+    app.config.update(configuracion_por_defecto())
+    app.config.update(config or {})
+    db.init_app(app)
+    # Antes de cualquier consulta: la sesión pregunta al enrutador a qué base va cada una
+    configurar_sucursales(app)
+    with app.app_context():
+        configurar_sqlite(db.engine, app.config['SQLITE_PRAGMAS'])
+        configurar_transacciones(db.engine)
+        configurar_metricas(app, db.engine)
+        if app.config['MIGRAR_AL_INICIAR']:
+            # BEGIN IMMEDIATE: si varios workers arrancan a la vez, migra uno y los demás esperan
+            with escritura():
+                aplicar_migraciones()
+        # Los workers no heredan conexiones abiertas en el maestro
+        db.engine.dispose()
+        app.extensions['serie_cotizaciones'] = SerieCotizaciones(db.engine)
+        configurar_trabajos(app, db.engine)
+
+    # La cotización se sirve desde cache; un hilo la refresca en segundo plano y la agrega a la serie
+    app.extensions['cotizacion'] = ServicioCotizacion.desde_config(
+        app.config, app.extensions['serie_cotizaciones']
+    )
+    # Estadísticas e historial renderizados, válidos mientras no cambie el libro
+    if app.config['CACHE_VISTAS_HABILITADA']:
+        app.extensions['cache_vistas'] = CacheVistas(
+            app.config['CACHE_VISTAS_PATH'], app.config['CACHE_VISTAS_MAX']
+        )
+
+    registrar_comandos(app)
+    app.register_blueprint(vistas)
+    app.register_blueprint(api)
+    return app
+
+
+def __getattr__(nombre):
+    # `from transacciones.src.app import app` y `flask --app transacciones.src.app`
+    # crean la app recién al pedirla, una sola vez por proceso
+    if nombre == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
+
+
+@vistas.before_request
+def _elegir_sucursal():
+    # La sucursal elegida se guarda en la sesión; si ya no existe se vuelve a la de por defecto
+    if not elegir_sucursal(session.get('caja_id')):
+        session.pop('caja_id', None)
+        elegir_sucursal(None)
+
+
+@vistas.context_processor
+def _sucursales():
+    return dict(
+        sucursales=g.get('sucursales', []),
+        sucursal_actual=g.get('caja_id'),
+        sucursales_por_archivo=por_archivo(),
+        nombre_sucursal=nombre_sucursal,
+    )
+
 
 def login_required(f):
-    def wrapper(*args, **kwargs):
-        if not session.get('logged_in'):
-            return redirect(url_for('login'))
-        return f(*args, **kwargs)
+    # Las vistas async (modo ASGI, ver asgi.py) necesitan un wrapper async para que Flask las espere
+    if inspect.iscoroutinefunction(f):
+        async def wrapper(*args, **kwargs):
+            if not session.get('logged_in'):
+                return redirect(url_for('vistas.login'))
+            return await f(*args, **kwargs)
+    else:
+        def wrapper(*args, **kwargs):
+            if not session.get('logged_in'):
+                return redirect(url_for('vistas.login'))
+            return f(*args, **kwargs)
     wrapper.__name__ = f.__name__
     return wrapper
 
-@app.route('/')
+@vistas.route('/')
 @login_required
 def index():
-    dollar_prices = get_dollar_price()
+    return pagina_inicio(current_app.extensions['cotizacion'].obtener(), saldo_actual())
+
+
+def pagina_inicio(dollar_prices, cajas):
     if dollar_prices is None:
         flash("No se pudo obtener el precio del dólar blue. Intente nuevamente más tarde.", "error")
-    cajas = Caja.query.order_by(Caja.fecha_hora.desc()).first()
     return render_template('index.html', 
                            dollar_prices=dollar_prices, 
                            cajas=cajas)
 
 
+@vistas.app_template_filter('format_currency')
 def format_currency(value):
     """
     Formatea un número como moneda.
     """
     return Markup(f"${value:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."))
 
-app.jinja_env.filters['format_currency'] = format_currency
-
 
-@app.route('/caja/inicial', methods=['POST'])
+@vistas.route('/caja/inicial', methods=['POST'])
 @login_required
 def set_initial_cash():
     """
     Configura la caja inicial o agrega fondos a una caja existente.
     """
     # Obtener los valores del formulario
-    pesos = request.form.get('pesos', type=float, default=0.0)
-    dolares = request.form.get('dolares', type=float, default=0.0)
+    pesos = safe_decimal(request.form.get('pesos'))
+    dolares = safe_decimal(request.form.get('dolares'))
 
-    # Verificar si ya existe una caja
-    caja_existente = Caja.query.order_by(Caja.id.desc()).first()
+    def guardar():
+        # Verificar si ya existe una caja
+        caja_existente = caja_actual()
 
-    if caja_existente:
-        # Agregar fondos a la caja existente
-        caja_existente.pesos += pesos
-        caja_existente.dolares += dolares
-        db.session.commit()
-        flash("Fondos agregados correctamente a la caja.", "success")
-    else:
-        # Configurar una nueva caja
-        nueva_caja = Caja(pesos=pesos, dolares=dolares, fecha_hora=datetime.datetime.now())
-        db.session.add(nueva_caja)
+        if caja_existente:
+            # Agregar fondos a la caja existente
+            registrar_movimiento(caja_existente, pesos, dolares, 'fondos')
+            db.session.commit()
+            return "Fondos agregados correctamente a la caja."
+        if g.get('caja_id') is None:
+            return None
+        # Sucursal del catálogo cuyo archivo todavía no tiene caja
+        crear_caja(pesos, dolares, caja_id=g.caja_id)
         db.session.commit()
-        flash("Caja inicial configurada correctamente.", "success")
+        return "Caja inicial configurada correctamente."
 
-    return redirect(url_for('manage_caja'))
+    mensaje = con_reintentos(guardar)
+    if mensaje is None:
+        # Configurar la primera caja
+        crear_sucursal(None, pesos, dolares)
+        mensaje = "Caja inicial configurada correctamente."
+    flash(mensaje, "success")
+    return redirect(url_for('vistas.manage_caja'))
 
 
-@app.route('/caja', methods=['GET'])
+@vistas.route('/sucursales', methods=['POST'])
 @login_required
-def manage_caja():
+def crear_sucursal_vista():
     """
-    Renderiza la página de gestión de la caja.
+    Agrega una sucursal con su caja y sus fondos iniciales, y la deja elegida.
     """
-    # Obtener el estado actual de la caja
-    caja = Caja.query.order_by(Caja.id.desc()).first()
-    return render_template('caja.html', caja=caja)
+    nombre = request.form.get('nombre', '').strip()
+    if not nombre:
+        flash("Ingrese el nombre de la sucursal.", "error")
+        return redirect(url_for('vistas.manage_caja'))
+    caja_id = crear_sucursal(
+        nombre, safe_decimal(request.form.get('pesos')), safe_decimal(request.form.get('dolares'))
+    )
+    session['caja_id'] = caja_id
+    flash(f"Sucursal {nombre} creada correctamente.", "success")
+    return redirect(url_for('vistas.manage_caja'))
 
 
-def redondear(valor, precision=2):
+@vistas.route('/sucursales/elegir', methods=['POST'])
+@login_required
+def elegir_sucursal_vista():
     """
-    Redondea un valor Decimal a la precisión especificada.
+    Cambia la sucursal con la que se opera. Vacío, con la base compartida, muestra todas.
     """
-    return float(Decimal(valor).quantize(Decimal(f'1.{"0" * precision}'), rounding=ROUND_HALF_UP))
-
+    caja_id = request.form.get('caja_id')
+    if caja_id:
+        session['caja_id'] = caja_id
+    else:
+        session.pop('caja_id', None)
+    return redirect(request.referrer or url_for('vistas.index'))
 
-def calcular_impacto(tipo, monto, tasa_cambio, precio_compra=None, precio_venta=None, comision=0.0, descuento_cheque=0.0):
-    monto = Decimal(monto)
-    comision = Decimal(comision)  # Ya debería ser un valor decimal (0.01 para 1%)
-    descuento_cheque = Decimal(descuento_cheque) / 100
 
-    if tipo == 'compra_dolares':
-        pesos_delta = -monto * tasa_cambio
-        dolares_delta = monto
-        return round(pesos_delta, 2), round(dolares_delta, 2), Decimal(0), Decimal(0)  # ✅ Agregado 4to valor
+@vistas.route('/caja', methods=['GET'])
+@login_required
+def manage_caja():
+    """
+    Renderiza la página de gestión de la caja.
+    """
+    # Obtener el estado actual de la caja
+    caja = caja_actual()
+    return render_template('caja.html', caja=saldo_caja(caja) if caja else None,
+                           saldos=saldos_por_sucursal())
 
-    elif tipo == 'venta_dolares':
-        pesos_delta = monto * tasa_cambio
-        dolares_delta = -monto
-        return round(pesos_delta, 2), round(dolares_delta, 2), Decimal(0), Decimal(0)  # ✅
-
-    elif tipo == 'cable_subida':
-        comision_dolares = monto * comision
-        dolares_recibidos = monto + comision_dolares  # Cliente entrega más dólares
-        return Decimal(0), round(dolares_recibidos, 2), round(comision_dolares, 2), Decimal(0)  # ✅
-
-    elif tipo == 'cable_bajada':
-        comision_dolares = monto * comision
-        dolares_entregados = monto - comision_dolares  # Cliente recibe menos dólares
-        return Decimal(0), round(-dolares_entregados, 2), round(comision_dolares, 2), Decimal(0)  # ✅
-
-    elif tipo == 'cash_to_cash':
-        if comision > 0:
-            dolares_delta = -(monto + (monto * comision))  # Si pago comisión
-        else:
-            dolares_delta = monto - (monto * abs(comision))  # Si recibo comisión
-        return Decimal(0), round(dolares_delta, 2), round(monto * abs(comision), 2), Decimal(0)  # ✅
 
-    elif tipo == 'descuento_cheque':
-        descuento_aplicado = monto * descuento_cheque
-        monto_final = monto - descuento_aplicado  # Lo que realmente sale de caja
-        pesos_delta = -monto_final
-        return round(pesos_delta, 2), Decimal(0), Decimal(0), round(descuento_aplicado, 2)  # ✅
+@vistas.route('/caja/valuacion', methods=['GET'])
+@login_required
+def valuacion_caja():
+    """
+    Saldo de la caja al cierre de cada día con los dólares valuados a la cotización histórica.
+    """
+    caja = caja_actual()
+    if not caja:
+        flash("Primero debes configurar la caja inicial.", "error")
+        return redirect(url_for('vistas.manage_caja'))
+    desde, hasta, errores = rango_valuacion(request.args)
+    for error in errores:
+        flash(error, "error")
+    valuaciones = [] if errores else valuar_caja(caja, desde, hasta, serie_cotizaciones())
+    return render_template('valuacion.html', valuaciones=valuaciones, desde=desde, hasta=hasta)
 
-    return Decimal(0), Decimal(0), Decimal(0), Decimal(0) 
 
-def revertir_impacto(tipo, monto, tasa_cambio, comision=0.0, descuento_cheque=0.0):
-    monto = Decimal(monto)
-    comision = Decimal(comision) / 100  # Convertimos a porcentaje
-    descuento_cheque = Decimal(descuento_cheque) / 100
+@vistas.route('/caja/cierres', methods=['GET'])
+@login_required
+def cierres_caja():
+    """
+    Cierres diarios de la caja entre dos fechas, con el formulario para cerrar un día.
+    """
+    caja = caja_actual()
+    if not caja:
+        flash("Primero debes configurar la caja inicial.", "error")
+        return redirect(url_for('vistas.manage_caja'))
+    desde, hasta, errores = rango_valuacion(request.args)
+    for error in errores:
+        flash(error, "error")
+    cierres = [] if errores else cierres_entre(caja.id, desde, hasta)
+    return render_template('cierres.html', cierres=cierres, desde=desde, hasta=hasta,
+                           hoy=datetime.date.today())
 
-    if tipo == 'compra_dolares':
-        pesos_delta = monto * tasa_cambio  # Devolvemos los pesos usados en la compra
-        dolares_delta = -monto  # Se eliminan los dólares obtenidos
-        return round(pesos_delta, 2), round(dolares_delta, 2), Decimal(0), Decimal(0)
 
-    elif tipo == 'venta_dolares':
-        pesos_delta = -monto * tasa_cambio  # Se eliminan los pesos ganados
-        dolares_delta = monto  # Se devuelven los dólares vendidos
-        return round(pesos_delta, 2), round(dolares_delta, 2), Decimal(0), Decimal(0)
+@vistas.route('/caja/cierres', methods=['POST'])
+@login_required
+def cerrar_caja():
+    """
+    Cierra el día indicado (por defecto, hoy). Volver a cerrar un día reemplaza su cierre.
+    """
+    try:
+        fecha = leer_fecha(request.form['fecha']) if request.form.get('fecha') else None
 
-    elif tipo == 'cash_to_cash':
-        if comision > 0:
-            dolares_delta = -(monto + (monto * comision))  # Devolvemos el monto total con comisión
-        else:
-            dolares_delta = monto - (monto * abs(comision))  # Si fue negativa, sumamos la comisión
-        return Decimal(0), round(dolares_delta, 2), round(-monto * abs(comision), 2), Decimal(0)
+        def cerrar():
+            caja = caja_actual()
+            if not caja:
+                return None
+            cierre = cerrar_dia(caja, fecha)
+            db.session.commit()
+            return cierre.fecha
 
-    elif tipo == 'descuento_cheque':
-        descuento_aplicado = monto * (descuento_cheque / 100)
-        monto_final = monto - descuento_aplicado # Lo que realmente sale de caja
-        pesos_delta = monto_final
-        return round(pesos_delta, 2), Decimal(0), Decimal(0), round(descuento_aplicado, 2)
+        fecha = con_reintentos(cerrar)
+    except ValueError as e:
+        db.session.rollback()
+        flash(str(e), "error")
+        return redirect(url_for('vistas.cierres_caja'))
+    if fecha is None:
+        flash("Primero debes configurar la caja inicial.", "error")
+        return redirect(url_for('vistas.manage_caja'))
+    flash(f"Caja cerrada al {fecha.isoformat()}.", "success")
+    return redirect(url_for('vistas.ver_cierre', fecha=fecha.isoformat()))
 
 
-    elif tipo == 'cable_subida':
-        dolares_recuperados = monto + (monto * comision)  # Devolvemos el monto enviado con comisión
-        return Decimal(0), round(-dolares_recuperados, 2), round(-monto * comision, 2), Decimal(0)
+@vistas.route('/caja/cierres/<fecha>', methods=['GET'])
+@login_required
+def ver_cierre(fecha):
+    """
+    Reporte de un día cerrado: saldo al cierre y totales por tipo, leídos del cierre guardado.
+    """
+    caja = caja_actual()
+    try:
+        reporte = reporte_de(caja.id, leer_fecha(fecha)) if caja else None
+    except ValueError as e:
+        flash(str(e), "error")
+        return redirect(url_for('vistas.cierres_caja'))
+    if reporte is None:
+        flash("Ese día no se cerró.", "error")
+        return redirect(url_for('vistas.cierres_caja'))
+    return render_template('cierre.html', cierre=reporte.cierre, por_tipo=reporte.por_tipo)
 
-    elif tipo == 'cable_bajada':
-        dolares_recuperados = -(monto - (monto * comision))  # Reponemos los dólares entregados
-        return Decimal(0), round(dolares_recuperados, 2), round(-monto * comision, 2), Decimal(0)
 
-    return Decimal(0), Decimal(0), Decimal(0), Decimal(0)
+def redondear(valor, precision=2):
+    """
+    Redondea un valor Decimal a la precisión especificada.
+    """
+    return float(Decimal(valor).quantize(Decimal(f'1.{"0" * precision}'), rounding=ROUND_HALF_UP))
 
 
 def aplicar_descuento_cheque(monto, descuento_cheque):
@@ -206,19 +396,6 @@ def procesar_transaccion_basica(tipo, monto, buy_price, sell_price):
     return 0, 0
 
 
-def obtener_precio_compra_previo(tipo):
-    """
-    Obtiene el precio de compra previo para calcular el margen en transacciones de venta.
-    Se basa en la transacción más reciente del mismo tipo.
-    """
-    if tipo == 'venta_dolares':
-        transaccion_compra = Transaction.query.filter_by(tipo='compra_dolares').order_by(Transaction.fecha_hora.desc()).first()
-        return Decimal(transaccion_compra.tasa_cambio) if transaccion_compra else None
-    elif tipo == 'venta_pesos':
-        transaccion_compra = Transaction.query.filter_by(tipo='compra_pesos').order_by(Transaction.fecha_hora.desc()).first()
-        return Decimal(transaccion_compra.tasa_cambio) if transaccion_compra else None
-    return None
-
 def safe_decimal(value, default=Decimal(0)):
     """
     Convierte un valor a Decimal de manera segura.
@@ -229,7 +406,15 @@ def safe_decimal(value, default=Decimal(0)):
     except (ValueError, TypeError, InvalidOperation):
         return default
 
-# @app.route('/transactions', methods=['GET', 'POST'])
+def porcentaje_de(valor, monto):
+    """
+    Porcentaje que representa `valor` sobre `monto`, con dos decimales.
+    """
+    if not monto:
+        return Decimal(0)
+    return ((valor or 0) * 100 / monto).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+# @vistas.route('/transactions', methods=['GET', 'POST'])
 # @login_required
 # def transactions():
 #     if request.method == 'POST':
@@ -290,7 +475,7 @@ def safe_decimal(value, default=Decimal(0)):
     
 #     return render_template('transactions.html')
 
-@app.route('/transactions', methods=['GET', 'POST'])
+@vistas.route('/transactions', methods=['GET', 'POST'])
 @login_required
 def transactions():
     if request.method == 'POST':
@@ -304,117 +489,140 @@ def transactions():
             precio_venta = safe_decimal(request.form.get('precio_venta'), Decimal(0))
             fecha_hora = datetime.datetime.now()
 
-            if monto <= 0:
-                flash("El monto debe ser mayor a cero.", "error")
-                return redirect(url_for('transactions'))
-
-            caja = Caja.query.order_by(Caja.id.desc()).first()
-            if not caja:
-                flash("Primero debes configurar la caja inicial.", "error")
-                return redirect(url_for('manage_caja'))
-
-            caja_pesos = safe_decimal(caja.pesos)
-            caja_dolares = safe_decimal(caja.dolares)
-            
-            # 🔹 Obtener el precio de compra previo (si existe)
-            precio_compra_prev = obtener_precio_compra_previo(tipo)
-
-            if tipo in ['venta_dolares', 'venta_pesos']:
-                if precio_compra_prev <= 0:
-                    if precio_compra <= 0:
-                        flash("Debe ingresar un precio de compra válido, ya que no hay uno previo.", "error")
-                        return redirect(url_for('transactions'))
-                    precio_compra_prev = precio_compra  # Se usa el precio ingresado manualmente
-
-            # ✅ Pasamos el descuento_cheque a calcular_impacto
-            pesos_delta, dolares_delta, comision_calculada, descuento_aplicado = calcular_impacto(
-                tipo, monto, precio_compra if tipo in ['compra_dolares', 'compra_pesos'] else precio_venta,
-                precio_compra_prev, precio_venta, comision, descuento_cheque
-            )
-
-            if caja_pesos + pesos_delta < 0 or caja_dolares + dolares_delta < 0:
-                flash("Fondos insuficientes en la caja.", "error")
-                return redirect(url_for('transactions'))
-
-            caja.pesos += float(pesos_delta)
-            caja.dolares += float(dolares_delta)
-
-            # ✅ Se guarda el monto final con el descuento aplicado
-            transaccion = Transaction(
-                tipo=tipo,
-                monto=float(monto),  
-                concepto=concepto,
-                fecha_hora=fecha_hora,
-                tasa_cambio=float(precio_compra if tipo in ['compra_dolares', 'compra_pesos'] else precio_venta),
-                comision=float(comision_calculada),
-                descuento_cheque=float(descuento_aplicado)
-            )
-            db.session.add(transaccion)
-            db.session.commit()
-            flash("Transacción registrada correctamente.", "success")
+            def registrar():
+                caja = caja_actual()
+                if not caja:
+                    flash("Primero debes configurar la caja inicial.", "error")
+                    return redirect(url_for('vistas.manage_caja'))
+
+                try:
+                    # 🔹 Tipo, monto y, para una venta sin compras previas, el precio de compra ingresado
+                    validar_operacion(caja.id, tipo, monto, precio_compra > 0)
+
+                    # ✅ Pasamos el descuento_cheque a calcular_impacto
+                    pesos_delta, dolares_delta, comision_calculada, descuento_aplicado = calcular_impacto(
+                        tipo, monto, precio_compra if tipo in ['compra_dolares', 'compra_pesos'] else precio_venta,
+                        precio_compra, precio_venta, comision, descuento_cheque
+                    )
+
+                    # ✅ Se guarda el monto final con el descuento aplicado
+                    transaccion, _ = agregar_transaccion(caja, saldo_caja(caja), dict(
+                        tipo=tipo,
+                        monto=monto,
+                        concepto=concepto,
+                        fecha_hora=fecha_hora,
+                        tasa_cambio=precio_compra if tipo in ['compra_dolares', 'compra_pesos'] else precio_venta,
+                        comision=comision_calculada,
+                        descuento_cheque=descuento_aplicado,
+                        precio_compra=precio_compra if precio_compra > 0 else None
+                    ), pesos_delta, dolares_delta)
+                except OperacionInvalida as e:
+                    db.session.rollback()
+                    flash(str(e), "error")
+                    return redirect(url_for('vistas.transactions'))
+
+                reconstruir_resumen(*rango_afectado(transaccion.tipo, transaccion.fecha_hora))
+                db.session.commit()
+                flash("Transacción registrada correctamente.", "success")
+                return redirect(url_for('vistas.transactions'))
+
+            # Lectura del saldo, validación y alta bajo el mismo lock de escritura
+            return con_reintentos(registrar)
 
         except Exception as e:
             db.session.rollback()
             flash(f"Error al registrar la transacción: {str(e)}", "error")
 
-        return redirect(url_for('transactions'))
+        return redirect(url_for('vistas.transactions'))
     
     return render_template('transactions.html')
 
 
 
-@app.route('/transactions/delete/<int:transaction_id>', methods=['POST'])
+@vistas.route('/transactions/import', methods=['POST'])
+@login_required
+def import_transactions():
+    """
+    Importa un archivo CSV o JSON lines con muchas transacciones.
+    """
+    archivo = request.files.get('archivo')
+    formato = request.form.get('formato') or formato_desde_nombre(archivo.filename if archivo else None)
+    if not archivo or not formato:
+        flash("Seleccione un archivo .csv o .jsonl para importar.", "error")
+        return redirect(url_for('vistas.transactions'))
+
+    if request.form.get('segundo_plano'):
+        # El archivo se guarda y lo importa el worker de trabajos; la request vuelve enseguida
+        nombre = f"entrada_{uuid.uuid4().hex}.{formato}"
+        archivo.save(cola_trabajos().ruta(nombre))
+        trabajo_id = cola_trabajos().encolar(
+            'importar', {'archivo': nombre, 'formato': formato, 'nombre': archivo.filename}, g.get('caja_id')
+        )
+        flash(f"Importación encolada (trabajo {trabajo_id}).", "success")
+        return redirect(url_for('vistas.trabajos'))
+
+    try:
+        flujo = io.TextIOWrapper(archivo.stream, encoding='utf-8-sig', newline='')
+        resultado = importar_transacciones(flujo, formato, lote=current_app.config['IMPORTACION_LOTE'])
+    except (ValueError, UnicodeDecodeError) as e:
+        db.session.rollback()
+        flash(f"Error al importar: {str(e)}", "error")
+        return redirect(url_for('vistas.transactions'))
+
+    flash(f"Se importaron {resultado.importadas} transacciones.", "success")
+    for numero, mensaje in resultado.errores[:20]:
+        flash(f"Fila {numero}: {mensaje}", "error")
+    if len(resultado.errores) > 20:
+        flash(f"... y {len(resultado.errores) - 20} filas más con errores.", "error")
+    return redirect(url_for('vistas.transactions'))
+
+
+@vistas.route('/transactions/delete/<int:transaction_id>', methods=['POST'])
 @login_required
 def delete_transaction(transaction_id):
     transaction = Transaction.query.get(transaction_id)
     if not transaction:
         flash('Transacción no encontrada.', 'error')
-        return redirect(url_for('transactions'))
+        return redirect(url_for('vistas.transactions'))
 
-    caja = Caja.query.order_by(Caja.id.desc()).first()
+    caja = caja_actual()
     if not caja:
         flash("Error: No hay una caja configurada.", "error")
-        return redirect(url_for('transactions'))
+        return redirect(url_for('vistas.transactions'))
 
     try:
-        transaction_monto = safe_decimal(transaction.monto)
-        transaction_comision = safe_decimal(transaction.comision) / 100
-        transaction_descuento = safe_decimal(transaction.descuento_cheque) / 100  # Se incluye descuento
-
-        caja_pesos = safe_decimal(caja.pesos)
-        caja_dolares = safe_decimal(caja.dolares)
-
-        # 📌 Revertimos el impacto correctamente con descuento cheque
-        pesos_delta, dolares_delta, comision_revertida, descuento_revertido = revertir_impacto(
-            transaction.tipo, transaction_monto, safe_decimal(transaction.tasa_cambio),
-            comision=transaction_comision, descuento_cheque=transaction_descuento
-        )
-
-        # Validamos fondos antes de eliminar
-        if caja_pesos + pesos_delta < 0 or caja_dolares + dolares_delta < 0:
-            flash("Error: Fondos insuficientes para revertir esta transacción.", "error")
-            return redirect(url_for('transactions'))
-
-        # Aplicamos la reversión en la caja
-        caja.pesos += float(pesos_delta)
-        caja.dolares += float(dolares_delta)
-        
-        # 📌 Guardamos cambios en la caja antes de eliminar la transacción
-        db.session.commit()
+        def eliminar():
+            transaction = db.session.get(Transaction, transaction_id)
+            if not transaction:
+                flash('Transacción no encontrada.', 'error')
+                return redirect(url_for('vistas.transactions'))
+            caja = caja_de(transaction)
+
+            # 📌 Revertimos el impacto (con descuento cheque) validando fondos antes de eliminar
+            try:
+                rango, _ = quitar_transaccion(caja, saldo_caja(caja), transaction)
+            except OperacionInvalida as e:
+                db.session.rollback()
+                flash(f"Error: {e}", "error")
+                return redirect(url_for('vistas.transactions'))
+
+            # Actualizamos el resumen en la misma transacción
+            reconstruir_resumen(*rango)
+            db.session.commit()
+            flash('Transacción eliminada correctamente.', 'success')
+            return redirect(url_for('vistas.transactions'))
 
-        # Eliminamos la transacción
-        db.session.delete(transaction)
-        db.session.commit()
-        flash('Transacción eliminada correctamente.', 'success')
+        # La reversión se valida contra el saldo leído bajo el lock de escritura
+        return con_reintentos(eliminar)
 
     except Exception as e:
         db.session.rollback()
         flash(f'Error al eliminar la transacción: {str(e)}', 'error')
 
-    return redirect(url_for('transactions'))
+    return redirect(url_for('vistas.transactions'))
 
 
-@app.route('/transactions/edit/<int:transaction_id>', methods=['GET', 'POST'])
+@vistas.route('/transactions/edit/<int:transaction_id>', methods=['GET', 'POST'])
 @login_required
 def edit_transaction(transaction_id):
     """
@@ -423,205 +631,286 @@ def edit_transaction(transaction_id):
     transaction = Transaction.query.get(transaction_id)
     if not transaction:
         flash('Transacción no encontrada.', 'error')
-        return redirect(url_for('historial'))
+        return redirect(url_for('vistas.historial'))
 
-    caja = Caja.query.order_by(Caja.id.desc()).first()
+    caja = caja_actual()
     if not caja:
         flash("Error: No hay una caja configurada.", "error")
-        return redirect(url_for('historial'))
+        return redirect(url_for('vistas.historial'))
 
     if request.method == 'POST':
         try:
-            # Convertir valores de la caja a Decimal
-            caja_pesos = safe_decimal(caja.pesos)
-            caja_dolares = safe_decimal(caja.dolares)
-
-            # Revertir impacto de la transacción original
-            pesos_delta_original, dolares_delta_original, _ = calcular_impacto(
-                transaction.tipo, -transaction.monto, transaction.tasa_cambio,
-                comision=transaction.comision
-            )
-
-            # Aplicar la reversión
-            caja_pesos += pesos_delta_original
-            caja_dolares += dolares_delta_original
-
-            # Validar fondos tras revertir
-            if caja_pesos < 0 or caja_dolares < 0:
-                flash("Error: No se puede revertir la transacción. Fondos insuficientes.", "error")
-                return redirect(url_for('historial'))
-
-            # Obtener nuevos valores del formulario
-            nuevo_tipo = request.form.get('type')
-            nuevo_monto = safe_decimal(request.form.get('amount'))
-            nuevo_tasa_cambio = safe_decimal(request.form.get('exchange_rate'))
-            nueva_comision = safe_decimal(request.form.get('comision')) / 100
-            comision_tipo = request.form.get('comision_tipo', '')
-            nuevo_descuento_cheque = safe_decimal(request.form.get('descuento_cheque')) / 100
-
-            # Calcular nuevo impacto
-            pesos_delta_nuevo, dolares_delta_nuevo, _ = calcular_impacto(
-                nuevo_tipo, nuevo_monto, nuevo_tasa_cambio,
-                comision=nueva_comision
-            )
-
-            # Validar fondos antes de aplicar el nuevo impacto
-            if caja_pesos + pesos_delta_nuevo < 0 or caja_dolares + dolares_delta_nuevo < 0:
-                flash("Error: No se puede actualizar la transacción. Fondos insuficientes en la caja.", "error")
-                return redirect(url_for('edit_transaction', transaction_id=transaction_id))
-
-            # Aplicar nuevos cambios a la caja
-            caja.pesos = float(caja_pesos + pesos_delta_nuevo)
-            caja.dolares = float(caja_dolares + dolares_delta_nuevo)
-
-            # Actualizar la transacción
-            transaction.tipo = nuevo_tipo
-            transaction.monto = float(nuevo_monto)
-            transaction.concepto = request.form['concept']
-            transaction.tasa_cambio = float(nuevo_tasa_cambio)
-            transaction.comision = float(nueva_comision)
-            transaction.fecha_hora = datetime.datetime.now()
-
-            # Guardar cambios en la base de datos
-            db.session.commit()
-            flash('Transacción actualizada correctamente y caja recalculada.', 'success')
-        except InvalidOperation as e:
+            def actualizar():
+                transaction = db.session.get(Transaction, transaction_id)
+                if not transaction:
+                    flash('Transacción no encontrada.', 'error')
+                    return redirect(url_for('vistas.historial'))
+                caja = caja_de(transaction)
+                try:
+                    exigir_sentido(transaction)
+                except OperacionInvalida as e:
+                    flash(str(e), "error")
+                    return redirect(url_for('vistas.historial'))
+                saldo = saldo_caja(caja)
+                caja_pesos, caja_dolares = saldo
+
+                # Revertir impacto de la transacción original con sus montos guardados
+                pesos_delta_original, dolares_delta_original, _, _ = revertir_impacto(
+                    transaction.tipo, transaction.monto, transaction.tasa_cambio,
+                    comision=transaction.comision, descuento_cheque=transaction.descuento_cheque,
+                )
+
+                # Aplicar la reversión
+                caja_pesos += pesos_delta_original
+                caja_dolares += dolares_delta_original
+
+                # Validar fondos tras revertir
+                if caja_pesos < 0 or caja_dolares < 0:
+                    flash("Error: No se puede revertir la transacción. Fondos insuficientes.", "error")
+                    return redirect(url_for('vistas.historial'))
+
+                # Obtener nuevos valores del formulario, con las mismas reglas que el alta
+                nuevo_tipo = request.form.get('type')
+                nuevo_monto = safe_decimal(request.form.get('amount'))
+                precio = request.form.get('exchange_rate') or request.form.get(
+                    'precio_compra' if nuevo_tipo in ['compra_dolares', 'compra_pesos'] else 'precio_venta'
+                )
+                nuevo_tasa_cambio = safe_decimal(precio, transaction.tasa_cambio)
+                nueva_comision = safe_decimal(request.form.get('comision')) / 100
+                nuevo_descuento_cheque = safe_decimal(request.form.get('descuento_cheque'))
+                nuevo_precio_compra = safe_decimal(request.form.get('precio_compra'), Decimal(0))
+
+                try:
+                    validar_operacion(caja.id, nuevo_tipo, nuevo_monto, nuevo_precio_compra > 0)
+                except OperacionInvalida as e:
+                    flash(str(e), "error")
+                    return redirect(url_for('vistas.edit_transaction', transaction_id=transaction_id))
+
+                # Calcular nuevo impacto
+                pesos_delta_nuevo, dolares_delta_nuevo, comision_calculada, descuento_aplicado = calcular_impacto(
+                    nuevo_tipo, nuevo_monto, nuevo_tasa_cambio,
+                    comision=nueva_comision, descuento_cheque=nuevo_descuento_cheque
+                )
+
+                # Validar fondos antes de aplicar el nuevo impacto
+                if caja_pesos + pesos_delta_nuevo < 0 or caja_dolares + dolares_delta_nuevo < 0:
+                    flash("Error: No se puede actualizar la transacción. Fondos insuficientes en la caja.", "error")
+                    return redirect(url_for('vistas.edit_transaction', transaction_id=transaction_id))
+
+                # Aplicar nuevos cambios a la caja como un único movimiento neto
+                registrar_movimiento(
+                    caja, pesos_delta_original + pesos_delta_nuevo,
+                    dolares_delta_original + dolares_delta_nuevo, 'edicion', transaction.id
+                )
+
+                # Actualizar la transacción
+                rango_original = rango_afectado(transaction.tipo, transaction.fecha_hora)
+                operacion_original = (transaction.caja_id, transaction.tipo, transaction.fecha_hora, transaction.id)
+                transaction.tipo = nuevo_tipo
+                transaction.monto = nuevo_monto
+                transaction.concepto = request.form['concept']
+                transaction.tasa_cambio = nuevo_tasa_cambio
+                transaction.comision = comision_calculada
+                transaction.descuento_cheque = descuento_aplicado
+                transaction.precio_compra = nuevo_precio_compra if nuevo_precio_compra > 0 else None
+                transaction.fecha_hora = datetime.datetime.now()
+                db.session.flush()
+                actualizar_costos(
+                    operacion_original, (transaction.caja_id, transaction.tipo, transaction.fecha_hora, transaction.id)
+                )
+                reconstruir_resumen(*unir_rangos(
+                    rango_original, rango_afectado(transaction.tipo, transaction.fecha_hora)
+                ))
+
+                # Guardar cambios en la base de datos
+                db.session.commit()
+                flash('Transacción actualizada correctamente y caja recalculada.', 'success')
+                return redirect(url_for('vistas.historial'))
+
+            return con_reintentos(actualizar)
+        except InvalidOperation:
             db.session.rollback()
             flash("Error al procesar valores numéricos. Verifique los campos ingresados.", "error")
         except Exception as e:
             db.session.rollback()
             flash(f'Error al actualizar la transacción: {str(e)}', 'error')
 
-        return redirect(url_for('historial'))
+        return redirect(url_for('vistas.historial'))
 
-    return render_template('edit_transactions.html', transaction=transaction)
+    # La comisión y el descuento se guardan como montos; el formulario los pide como porcentajes
+    return render_template(
+        'edit_transactions.html', transaction=transaction,
+        porcentaje_comision=porcentaje_de(transaction.comision, transaction.monto),
+        porcentaje_descuento=porcentaje_de(transaction.descuento_cheque, transaction.monto),
+    )
 
 
 
-@app.route('/historial')
+@vistas.route('/historial')
 @login_required
 def historial():
     """
     Vista del historial de transacciones con filtros opcionales.
+    Se pagina por cursor; con stream=1 se envía el historial completo a medida que se renderiza.
     """
-    tipo_filtro = request.args.get('type')
-    concepto_filtro = request.args.get('concept')
-    fecha_inicio_filtro = request.args.get('start_date')
-    fecha_fin_filtro = request.args.get('end_date')
-
-    # Construcción dinámica del query con filtros
-    query = Transaction.query
-    if tipo_filtro:
-        query = query.filter_by(tipo=tipo_filtro)
-    if concepto_filtro:
-        query = query.filter(Transaction.concepto.contains(concepto_filtro))
-    if fecha_inicio_filtro:
-        try:
-            fecha_inicio = datetime.datetime.strptime(fecha_inicio_filtro, '%Y-%m-%d')
-            query = query.filter(Transaction.fecha_hora >= fecha_inicio)
-        except ValueError:
-            flash("Formato de fecha de inicio inválido.", "error")
-    if fecha_fin_filtro:
-        try:
-            fecha_fin = datetime.datetime.strptime(fecha_fin_filtro, '%Y-%m-%d') + datetime.timedelta(days=1)
-            query = query.filter(Transaction.fecha_hora < fecha_fin)
-        except ValueError:
-            flash("Formato de fecha de fin inválido.", "error")
+    query, errores = filtrar_transacciones(request.args, g.get('caja_id'))
+    for error in errores:
+        flash(error, "error")
+
+    contexto = dict(
+        tipo_filtro=request.args.get('type'),
+        concepto_filtro=request.args.get('concept'),
+        fecha_inicio_filtro=request.args.get('start_date'),
+        fecha_fin_filtro=request.args.get('end_date'),
+    )
 
-    # Ordenar por fecha de transacción
-    transacciones = query.order_by(Transaction.fecha_hora.desc()).all()
+    if request.args.get('stream'):
+        # Se itera en lotes sin cargar todo el resultado en memoria
+        transacciones = ordenar_recientes(query).yield_per(current_app.config['HISTORIAL_LOTE_STREAM'])
+        return Response(stream_template('historial.html', transacciones=transacciones, **contexto))
+
+    por_pagina = request.args.get('per_page', type=int, default=current_app.config['HISTORIAL_POR_PAGINA'])
+    por_pagina = min(max(por_pagina, 1), current_app.config['HISTORIAL_MAX_POR_PAGINA'])
+
+    def renderizar_tabla():
+        transacciones, cursor_siguiente = obtener_pagina(query, request.args.get('cursor'), por_pagina)
+        return render_template(
+            '_historial_tabla.html',
+            transacciones=transacciones,
+            cursor_siguiente=cursor_siguiente,
+            por_pagina=por_pagina,
+            **contexto
+        )
 
-    return render_template(
-        'historial.html',
-        transacciones=transacciones,
-        tipo_filtro=tipo_filtro,
-        concepto_filtro=concepto_filtro,
-        fecha_inicio_filtro=fecha_inicio_filtro,
-        fecha_fin_filtro=fecha_fin_filtro
+    # Con filtros inválidos no se guarda nada: la página depende de los mensajes de error
+    tabla = Markup(renderizar_tabla()) if errores else fragmento('historial', request.args, renderizar_tabla)
+    return render_template('historial.html', tabla=tabla, **contexto)
+
+
+@vistas.route('/historial/export')
+@login_required
+def export_historial():
+    """
+    Exporta el historial filtrado (mismos filtros que la vista) en CSV o Parquet, en streaming.
+    """
+    formato = request.args.get('formato', 'csv')
+    if formato not in FORMATOS_EXPORTACION:
+        flash("Formato de exportación inválido.", "error")
+        return redirect(url_for('vistas.historial'))
+    if formato == 'parquet' and not parquet_disponible():
+        flash("La exportación a Parquet requiere instalar pyarrow.", "error")
+        return redirect(url_for('vistas.historial'))
+
+    query, errores = filtrar_transacciones(request.args, g.get('caja_id'))
+    if errores:
+        for error in errores:
+            flash(error, "error")
+        return redirect(url_for('vistas.historial'))
+
+    mimetype, extension = FORMATOS_EXPORTACION[formato]
+    contenido = exportar(query, formato, lote=current_app.config['EXPORTACION_LOTE'])
+    nombre = f"transacciones_{datetime.date.today().isoformat()}.{extension}"
+    return Response(
+        stream_with_context(contenido),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{nombre}"'},
     )
 
 
-@app.route('/stats')
+@vistas.route('/trabajos', methods=['GET'])
+@login_required
+def trabajos():
+    """
+    Trabajos en segundo plano de la sucursal, con su estado y avance.
+    """
+    lista = cola_trabajos().listar(caja_id=g.get('caja_id'))
+    activos = any(trabajo['estado'] in ('pendiente', 'en_curso') for trabajo in lista)
+    return render_template('trabajos.html', trabajos=lista, activos=activos)
+
+
+@vistas.route('/trabajos', methods=['POST'])
+@login_required
+def encolar_trabajo():
+    """
+    Encola un trabajo; el tipo y sus parámetros vienen del formulario.
+    """
+    parametros = {clave: valor for clave, valor in request.form.items() if clave != 'tipo'}
+    tipo = request.form.get('tipo')
+    try:
+        trabajo_id = cola_trabajos().encolar(tipo, parametros, g.get('caja_id'))
+    except ValueError as e:
+        flash(str(e), "error")
+        return redirect(request.referrer or url_for('vistas.trabajos'))
+    flash(f"Trabajo {trabajo_id} encolado: {TIPOS[tipo].descripcion}.", "success")
+    return redirect(url_for('vistas.trabajos'))
+
+
+@vistas.route('/trabajos/<int:trabajo_id>/archivo', methods=['GET'])
+@login_required
+def descargar_trabajo(trabajo_id):
+    """
+    Descarga el archivo generado por un trabajo terminado (exportaciones).
+    """
+    trabajo = cola_trabajos().ver(trabajo_id)
+    if not trabajo or trabajo['estado'] != 'terminado' or not trabajo['archivo']:
+        flash("El trabajo no tiene un archivo para descargar.", "error")
+        return redirect(url_for('vistas.trabajos'))
+    mimetype, extension = FORMATOS_EXPORTACION[trabajo['parametros']['formato']]
+    return send_file(
+        cola_trabajos().ruta(trabajo['archivo']), mimetype=mimetype, as_attachment=True,
+        download_name=f"transacciones_{trabajo['creado_en'].date().isoformat()}.{extension}",
+    )
+
+
+@vistas.route('/stats')
 @login_required
 def stats():
     """
-    Genera estadísticas de transacciones filtradas por rango de tiempo.
+    Genera estadísticas de transacciones filtradas por rango de tiempo, de la sucursal elegida
+    o, si no se eligió ninguna, de todo el negocio.
     """
     rango = request.args.get('range', 'daily')  # Rango por defecto: diario
-    hoy = datetime.datetime.utcnow()
-
-    # Determinar rango de tiempo según el filtro
-    if rango == 'daily':
-        inicio = hoy.replace(hour=0, minute=0, second=0, microsecond=0)
-    elif rango == 'weekly':
-        inicio = hoy - datetime.timedelta(days=hoy.weekday())  # Inicio de la semana
-    elif rango == 'monthly':
-        inicio = hoy.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    elif rango == 'yearly':
-        inicio = hoy.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-    else:
-        inicio = datetime.datetime.min  # Sin límite inferior
 
-    # Obtener las transacciones dentro del rango
-    transacciones = Transaction.query.filter(Transaction.fecha_hora >= inicio).all()
+    # Las estadísticas se leen del resumen diario, no del libro completo
+    inicio = inicio_de_rango(rango)
+    tabla = fragmento('stats', {'range': rango, 'desde': inicio.date().isoformat()}, lambda: render_template(
+        '_stats_tabla.html', estadisticas=estadisticas_desde_resumen(inicio, g.get('caja_id'))
+    ))
 
-    # Asegurar que las operaciones usan Decimal
-    total_dolares_vendidos = sum(Decimal(t.monto) for t in transacciones if t.tipo == "venta_dolares")
-    total_pesos_vendidos = sum(Decimal(t.monto) / Decimal(t.tasa_cambio) for t in transacciones if t.tipo == "venta_pesos")
-    total_ganancias = sum(
-        max(Decimal(0), (Decimal(t.tasa_cambio) - Decimal(obtener_precio_compra_previo(t.tipo))) * Decimal(t.monto))
-        for t in transacciones if t.tipo in ["venta_dolares", "venta_pesos"]
-    )
-    total_perdidas = sum(
-        max(Decimal(0), (Decimal(obtener_precio_compra_previo(t.tipo)) - Decimal(t.tasa_cambio)) * Decimal(t.monto))
-        for t in transacciones if t.tipo in ["venta_dolares", "venta_pesos"]
-    )
-    total_comisiones = sum(
-        Decimal(t.monto) * Decimal(t.comision) for t in transacciones if t.tipo in ["cable_subida", "cable_bajada"]
-    )
-    total_descuentos_cheques = sum(
-        Decimal(t.descuento_cheque) for t in transacciones if t.tipo == "descuento_cheque"
-    )
+    return render_template('stats.html', tabla=tabla, rango=rango, sucursal=sucursal_elegida())
 
-    # Crear el diccionario de estadísticas
-    estadisticas = {
-        "total_dolares_vendidos": total_dolares_vendidos,
-        "total_pesos_vendidos": total_pesos_vendidos,
-        "total_ganancias": total_ganancias,
-        "total_perdidas": total_perdidas,
-        "total_comisiones": total_comisiones,
-        "total_descuentos_cheques": total_descuentos_cheques,
-    }
 
-    return render_template('stats.html', estadisticas=estadisticas, rango=rango)
+@vistas.route('/stats/consolidado')
+@login_required
+def stats_consolidado():
+    """
+    Estadísticas de todas las sucursales; con una base por sucursal se consultan en paralelo.
+    """
+    rango = request.args.get('range', 'daily')
+    por_sucursal, total = estadisticas_consolidadas(inicio_de_rango(rango))
+    return render_template('stats_consolidado.html', por_sucursal=por_sucursal, total=total, rango=rango)
 
 
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@vistas.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
 
-        if username == DEFAULT_USERNAME and password == DEFAULT_PASSWORD:
+        if username == current_app.config['DEFAULT_USERNAME'] and password == current_app.config['DEFAULT_PASSWORD']:
             session['logged_in'] = True
-            return redirect(url_for('index'))  # Redirige al historial o página principal
+            return redirect(url_for('vistas.index'))  # Redirige al historial o página principal
         else:
             flash('Usuario o contraseña incorrectos.', 'error')
 
     return render_template('login.html')
 
-@app.route('/logout', methods=['POST'])
+@vistas.route('/logout', methods=['POST'])
 def logout():
     session.clear()
-    return redirect(url_for('login'))
-
-@app.before_request
-def inicializar_bd():
-    if not hasattr(app, 'db_creada'):  # Comprueba si la BD ya se creó
-        db.create_all()
-        app.db_creada = True  # Marca que la BD ya está inicializada
+    return redirect(url_for('vistas.login'))
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,101 @@
+# asgi.py
+"""
+Punto de entrada ASGI opcional. El modo por defecto sigue siendo WSGI con gunicorn (procFile);
+este módulo sólo se importa al servir la app con un servidor ASGI:
+
+    uvicorn transacciones.src.asgi:aplicacion --host 0.0.0.0 --port 8000
+
+Requiere asgiref y un servidor ASGI como uvicorn (ver requirements.txt).
+La app Flask corre en un pool de `ASGI_HILOS` hilos y la página de inicio lee la cotización
+y el saldo de la caja a la vez en lugar de una después de la otra.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from flask import current_app
+
+from .app import create_app, login_required, pagina_inicio
+from .libro_caja import saldo_actual
+
+class _InstanciaEnHilos(WsgiToAsgiInstance):
+    """
+    WsgiToAsgi corre la app con sync_to_async sensible al hilo: todas las requests comparten un
+    único hilo. Acá la llamada a la app va con thread_sensitive=False, en un hilo del pool.
+    """
+
+    def __init__(self, wsgi_application, hilos, duplicate_header_limit=100):
+        super().__init__(wsgi_application, duplicate_header_limit)
+        self.hilos = hilos
+
+    async def run_wsgi_app(self, body):
+        await sync_to_async(self._atender, thread_sensitive=False, executor=self.hilos)(body)
+
+    def _atender(self, body):
+        try:
+            environ = self.build_environ(self.scope, body)
+        except ValueError:  # Demasiados encabezados repetidos
+            self.sync_send({'type': 'http.response.start', 'status': 400,
+                            'headers': [(b'content-type', b'text/plain')]})
+            self.sync_send({'type': 'http.response.body', 'body': b'Bad Request'})
+            return
+        respuesta = self.wsgi_application(environ, self.start_response)
+        try:
+            for parte in respuesta:
+                if not self.response_started:
+                    self.response_started = True
+                    self.sync_send(self.response_start)
+                self.sync_send({'type': 'http.response.body', 'body': parte, 'more_body': True})
+        finally:
+            if hasattr(respuesta, 'close'):
+                respuesta.close()
+        if not self.response_started:
+            self.response_started = True
+            self.sync_send(self.response_start)
+        self.sync_send({'type': 'http.response.body'})
+
+
+class WsgiEnHilos(WsgiToAsgi):
+    """
+    Adaptador WSGI -> ASGI que atiende varias requests a la vez, una por hilo del pool.
+    """
+
+    def __init__(self, wsgi_application, hilos):
+        super().__init__(wsgi_application)
+        self.hilos = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await _ciclo_de_vida(receive, send)
+        await _InstanciaEnHilos(self.wsgi_application, self.hilos, self.duplicate_header_limit)(
+            scope, receive, send
+        )
+
+
+async def _ciclo_de_vida(receive, send):
+    # Sin tareas de arranque ni cierre; se responde para que el servidor no lo reporte como error
+    while True:
+        mensaje = await receive()
+        if mensaje['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif mensaje['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+@login_required
+async def index():
+    """
+    Igual que la vista WSGI, pero la cotización y el saldo se leen en paralelo.
+    """
+    dollar_prices, cajas = await asyncio.gather(
+        asyncio.to_thread(current_app.extensions['cotizacion'].obtener),
+        asyncio.to_thread(saldo_actual),
+    )
+    return pagina_inicio(dollar_prices, cajas)
+
+
+app = create_app()
+app.view_functions['vistas.index'] = index
+aplicacion = WsgiEnHilos(app, app.config['ASGI_HILOS'])
@@ -0,0 +1,56 @@
+# busqueda.py
+# Índice de texto completo (SQLite FTS5) sobre Transaction.concepto.
+import re
+
+from sqlalchemy import DDL, column, event, text
+
+from .models import Transaction
+
+# La tabla FTS no guarda copia del texto (content=) y los triggers la mantienen sincronizada
+SENTENCIAS_FTS = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS transaction_fts USING fts5("
+    "concepto, content='transaction', content_rowid='id')",
+    'CREATE TRIGGER IF NOT EXISTS transaction_fts_ai AFTER INSERT ON "transaction" BEGIN '
+    "INSERT INTO transaction_fts(rowid, concepto) VALUES (new.id, new.concepto); END",
+    'CREATE TRIGGER IF NOT EXISTS transaction_fts_ad AFTER DELETE ON "transaction" BEGIN '
+    "INSERT INTO transaction_fts(transaction_fts, rowid, concepto) VALUES ('delete', old.id, old.concepto); END",
+    'CREATE TRIGGER IF NOT EXISTS transaction_fts_au AFTER UPDATE OF concepto ON "transaction" BEGIN '
+    "INSERT INTO transaction_fts(transaction_fts, rowid, concepto) VALUES ('delete', old.id, old.concepto); "
+    "INSERT INTO transaction_fts(rowid, concepto) VALUES (new.id, new.concepto); END",
+)
+
+for _sentencia in SENTENCIAS_FTS:
+    event.listen(Transaction.__table__, 'after_create', DDL(_sentencia).execute_if(dialect='sqlite'))
+
+
+def crear_indice_texto(conexion):
+    """
+    Crea la tabla FTS y sus triggers, y la llena con las transacciones existentes.
+    """
+    for sentencia in SENTENCIAS_FTS:
+        conexion.exec_driver_sql(sentencia)
+    conexion.exec_driver_sql("INSERT INTO transaction_fts(transaction_fts) VALUES ('rebuild')")
+
+
+def consulta_fts(texto):
+    """
+    Convierte lo que escribe el usuario en una consulta FTS5: todas las palabras deben aparecer,
+    cada una como prefijo ("jua per" encuentra "Juan Pérez"). Devuelve None si no hay palabras.
+    """
+    palabras = re.findall(r'\w+', texto or '')
+    if not palabras:
+        return None
+    return ' '.join(f'"{palabra}"*' for palabra in palabras)
+
+
+def filtro_concepto(texto):
+    """
+    Condición sobre Transaction que usa el índice FTS en lugar de LIKE '%texto%'.
+    """
+    consulta = consulta_fts(texto)
+    if consulta is None:
+        return None
+    coincidencias = text(
+        "SELECT rowid FROM transaction_fts WHERE transaction_fts MATCH :consulta_fts"
+    ).bindparams(consulta_fts=consulta).columns(column('rowid'))
+    return Transaction.id.in_(coincidencias)
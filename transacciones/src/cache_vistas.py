@@ -0,0 +1,124 @@
+# cache_vistas.py
+# Cache de fragmentos renderizados (estadísticas, historial) invalidada por una versión del libro.
+import sqlite3
+import time
+from urllib.parse import urlencode
+
+from flask import current_app, g
+from markupsafe import Markup
+from sqlalchemy import DDL, event, text
+
+from .metricas import registro
+from .models import db
+
+# Un contador en la base que los triggers incrementan con cada cambio del libro o del resumen,
+# sin importar quién escriba (vistas, API, importación o comandos de consola)
+SENTENCIAS_VERSION = (
+    "CREATE TABLE IF NOT EXISTS version_libro ("
+    " id INTEGER NOT NULL PRIMARY KEY CHECK (id = 1),"
+    " version INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO version_libro (id, version) VALUES (1, 0)",
+    *(
+        f'CREATE TRIGGER IF NOT EXISTS {tabla}_version_{sufijo} AFTER {evento} ON "{tabla}" BEGIN '
+        "UPDATE version_libro SET version = version + 1 WHERE id = 1; END"
+        for tabla in ('transaction', 'resumen_diario')
+        for sufijo, evento in (('ai', 'INSERT'), ('ad', 'DELETE'), ('au', 'UPDATE'))
+    ),
+)
+
+for _sentencia in SENTENCIAS_VERSION:
+    event.listen(db.metadata, 'after_create', DDL(_sentencia).execute_if(dialect='sqlite'))
+
+
+def crear_version_libro(conexion):
+    for sentencia in SENTENCIAS_VERSION:
+        conexion.exec_driver_sql(sentencia)
+
+
+def version_libro():
+    """
+    Versión actual del libro. Se lee en la misma transacción que las consultas de la vista,
+    así el fragmento guardado corresponde a esa versión.
+    """
+    return db.session.execute(text("SELECT version FROM version_libro WHERE id = 1")).scalar()
+
+
+class CacheVistas:
+    """
+    Fragmentos HTML en un archivo SQLite compartido por todos los workers.
+    Una entrada sólo vale para la versión del libro con la que se generó; al guardar
+    se borran las de versiones anteriores de la misma sucursal (con una base por sucursal
+    cada una tiene su propio contador). Si el archivo está ocupado se renderiza sin cache.
+    """
+
+    def __init__(self, ruta, maximo=1000):
+        self.ruta = ruta
+        self.maximo = maximo
+        with self._conectar() as conexion:
+            conexion.execute("PRAGMA journal_mode = WAL")
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS fragmento ("
+                " clave TEXT PRIMARY KEY,"
+                " version INTEGER NOT NULL,"
+                " contenido TEXT NOT NULL,"
+                " creado REAL NOT NULL)"
+            )
+            conexion.execute("CREATE INDEX IF NOT EXISTS ix_fragmento_version ON fragmento (version)")
+
+    def _conectar(self):
+        return sqlite3.connect(self.ruta, timeout=0.2)
+
+    def leer(self, clave, version):
+        try:
+            with self._conectar() as conexion:
+                fila = conexion.execute(
+                    "SELECT contenido FROM fragmento WHERE clave = ? AND version = ?", (clave, version)
+                ).fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return fila[0] if fila else None
+
+    def guardar(self, clave, version, contenido):
+        sucursal = clave.partition(':')[0]
+        try:
+            with self._conectar() as conexion:
+                conexion.execute(
+                    "DELETE FROM fragmento WHERE clave LIKE ? AND version < ?", (f"{sucursal}:%", version)
+                )
+                conexion.execute(
+                    "INSERT OR REPLACE INTO fragmento (clave, version, contenido, creado) VALUES (?, ?, ?, ?)",
+                    (clave, version, contenido, time.time()),
+                )
+                conexion.execute(
+                    "DELETE FROM fragmento WHERE clave IN ("
+                    " SELECT clave FROM fragmento ORDER BY creado DESC LIMIT -1 OFFSET ?)",
+                    (self.maximo,),
+                )
+        except sqlite3.OperationalError:
+            pass
+
+    def fragmento(self, vista, parametros, renderizar):
+        """
+        Devuelve el fragmento de `vista` para `parametros`, renderizándolo con `renderizar()`
+        sólo si no hay uno guardado para la versión actual del libro.
+        """
+        parametros = urlencode(sorted((k, str(v)) for k, v in parametros.items() if v))
+        clave = f"{g.get('caja_id') or ''}:{vista}?{parametros}"
+        version = version_libro()
+        contenido = self.leer(clave, version)
+        registro.sumar('transacciones_cache_vistas_total', vista=vista,
+                       resultado='acierto' if contenido is not None else 'fallo')
+        if contenido is None:
+            contenido = renderizar()
+            self.guardar(clave, version, contenido)
+        return Markup(contenido)
+
+
+def fragmento(vista, parametros, renderizar):
+    """
+    Fragmento desde la cache de la app, o renderizado en el momento si la cache está deshabilitada.
+    """
+    cache = current_app.extensions.get('cache_vistas')
+    if cache is None:
+        return Markup(renderizar())
+    return cache.fragmento(vista, parametros, renderizar)
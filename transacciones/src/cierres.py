@@ -0,0 +1,183 @@
+# cierres.py
+"""
+Cierre de caja diario. Cerrar un día guarda en una fila el saldo de la caja al final del día y
+los totales del día por tipo (cantidad, volumen, comisiones, descuentos y resultado realizado).
+Desde entonces el reporte de ese día y el saldo a esa fecha son una búsqueda por (caja_id, fecha)
+en lugar de un recorrido del libro.
+
+El saldo se arma sobre el cierre anterior: saldo del cierre previo más los movimientos
+posteriores a su último movimiento hasta el final del día. Los movimientos se agregan en orden
+de fecha, así que el rango de ids alcanza y se lee por el índice (caja_id, id).
+
+Un cierre queda congelado: si después se edita una transacción de ese día, el cierre no cambia
+hasta volver a cerrar el día, que reemplaza la fila. Sólo una migración que corrige un cálculo
+vuelve a armar los totales de los cierres existentes (recalcular_cierres); el saldo no se toca.
+"""
+import datetime
+from collections import namedtuple
+from decimal import Decimal
+
+from sqlalchemy import delete, func, insert, select, update
+
+from .estadisticas import columnas_resumen, filas_con_costo
+from .libro_caja import Saldo
+from .models import db, CierreCaja, CierreTipo, MovimientoCaja
+
+TOTALES = ('cantidad', 'volumen', 'volumen_usd', 'comisiones', 'descuentos', 'ganancias', 'perdidas')
+
+Reporte = namedtuple('Reporte', 'cierre por_tipo')
+
+
+def leer_fecha(valor):
+    """
+    Fecha AAAA-MM-DD. Lanza ValueError con un mensaje para el usuario.
+    """
+    try:
+        return datetime.date.fromisoformat(str(valor).strip())
+    except ValueError:
+        raise ValueError("Fecha inválida. Use el formato AAAA-MM-DD.")
+
+
+def _fin_del_dia(fecha):
+    return datetime.datetime.combine(fecha + datetime.timedelta(days=1), datetime.time())
+
+
+def cierre_de(caja_id, fecha):
+    """
+    Cierre de `fecha`, o None si ese día no se cerró.
+    """
+    return CierreCaja.query.filter_by(caja_id=caja_id, fecha=fecha).first()
+
+
+def ultimo_cierre(caja_id, hasta):
+    """
+    Cierre más reciente con fecha <= `hasta`, o None.
+    """
+    return (
+        CierreCaja.query.filter(CierreCaja.caja_id == caja_id, CierreCaja.fecha <= hasta)
+        .order_by(CierreCaja.fecha.desc())
+        .first()
+    )
+
+
+def cierres_entre(caja_id, desde, hasta):
+    """
+    Cierres entre las fechas `desde` y `hasta` inclusive, del más reciente al más viejo.
+    """
+    return (
+        CierreCaja.query.filter(CierreCaja.caja_id == caja_id, CierreCaja.fecha >= desde, CierreCaja.fecha <= hasta)
+        .order_by(CierreCaja.fecha.desc())
+        .all()
+    )
+
+
+def por_tipo(cierre):
+    return CierreTipo.query.filter_by(cierre_id=cierre.id).order_by(CierreTipo.tipo).all()
+
+
+def reporte_de(caja_id, fecha):
+    """
+    Reporte del día cerrado: Reporte(cierre, [CierreTipo]), o None si ese día no se cerró.
+    """
+    cierre = cierre_de(caja_id, fecha)
+    return Reporte(cierre, por_tipo(cierre)) if cierre else None
+
+
+def _saldo_desde(caja_id, base, fin):
+    """
+    (pesos, dolares, último movimiento) sumando a `base` (un cierre o None) los movimientos
+    posteriores a su último movimiento registrados antes de `fin`.
+    """
+    pesos, dolares, desde_id = (base.pesos, base.dolares, base.movimiento_id) if base else (Decimal(0), Decimal(0), 0)
+    m = MovimientoCaja.__table__.c
+    suma_pesos, suma_dolares, ultimo = db.session.execute(
+        select(func.coalesce(func.sum(m.pesos), 0), func.coalesce(func.sum(m.dolares), 0), func.max(m.id))
+        .where(m.caja_id == caja_id, m.id > desde_id, m.fecha_hora < fin)
+    ).one()
+    return pesos + Decimal(suma_pesos), dolares + Decimal(suma_dolares), ultimo or desde_id
+
+
+def saldo_a_fecha(caja, fecha):
+    """
+    Saldo de la caja al final de `fecha`. Si el día se cerró es la fila del cierre; si no, el
+    último cierre anterior más los movimientos desde entonces.
+    """
+    base = ultimo_cierre(caja.id, fecha)
+    if base and base.fecha == fecha:
+        return Saldo(base.pesos, base.dolares)
+    pesos, dolares, _ = _saldo_desde(caja.id, base, _fin_del_dia(fecha))
+    return Saldo(pesos, dolares)
+
+
+def _totales_por_tipo(caja_id, fecha, ejecutor):
+    """
+    Totales del día por tipo, con las mismas cuentas que el resumen diario.
+    """
+    inicio = datetime.datetime.combine(fecha, datetime.time())
+    filas = filas_con_costo(inicio, _fin_del_dia(fecha), caja_id)
+    tipos = [dict(fila) for fila in ejecutor.execute(
+        select(filas.c.tipo, *columnas_resumen(filas)).group_by(filas.c.tipo)
+    ).mappings()]
+    for fila in tipos:
+        for total in TOTALES:
+            fila[total] = fila[total] or 0
+    return tipos
+
+
+def _totales_del_cierre(tipos):
+    return dict(
+        cantidad=sum(fila['cantidad'] for fila in tipos),
+        # Como en las estadísticas: comisiones de los cables y descuentos de los cheques
+        comisiones=sum(fila['comisiones'] for fila in tipos if fila['tipo'] in ('cable_subida', 'cable_bajada')),
+        descuentos=sum(fila['descuentos'] for fila in tipos if fila['tipo'] == 'descuento_cheque'),
+        ganancias=sum(fila['ganancias'] for fila in tipos),
+        perdidas=sum(fila['perdidas'] for fila in tipos),
+    )
+
+
+def cerrar_dia(caja, fecha=None):
+    """
+    Cierra `fecha` (por defecto, hoy) y devuelve el CierreCaja. Volver a cerrar un día reemplaza
+    su cierre. No hace commit. Lanza ValueError si la fecha es futura.
+    """
+    fecha = fecha or datetime.date.today()
+    if fecha > datetime.date.today():
+        raise ValueError("No se puede cerrar un día futuro.")
+    pesos, dolares, movimiento_id = _saldo_desde(
+        caja.id, ultimo_cierre(caja.id, fecha - datetime.timedelta(days=1)), _fin_del_dia(fecha)
+    )
+    tipos = _totales_por_tipo(caja.id, fecha, db.session)
+
+    anterior = cierre_de(caja.id, fecha)
+    if anterior:
+        db.session.execute(delete(CierreTipo).where(CierreTipo.cierre_id == anterior.id))
+        db.session.delete(anterior)
+        db.session.flush()
+
+    cierre = CierreCaja(
+        caja_id=caja.id, fecha=fecha, movimiento_id=movimiento_id, pesos=pesos, dolares=dolares,
+        cerrado_en=datetime.datetime.now(), **_totales_del_cierre(tipos),
+    )
+    db.session.add(cierre)
+    db.session.flush()
+    if tipos:
+        db.session.execute(insert(CierreTipo.__table__), [dict(fila, cierre_id=cierre.id) for fila in tipos])
+    return cierre
+
+
+def recalcular_cierres(conexion=None):
+    """
+    Vuelve a calcular los totales de todos los cierres con las cuentas actuales, después de
+    corregir un cálculo del resumen. El saldo al cierre sigue congelado; los totales toman el libro
+    tal como está hoy. No hace commit. Devuelve la cantidad de cierres recalculados.
+    """
+    ejecutor = conexion or db.session
+    c = CierreCaja.__table__.c
+    cierres = ejecutor.execute(select(c.id, c.caja_id, c.fecha)).all()
+    ejecutor.execute(delete(CierreTipo.__table__))
+    for cierre_id, caja_id, fecha in cierres:
+        tipos = _totales_por_tipo(caja_id, fecha, ejecutor)
+        ejecutor.execute(update(CierreCaja.__table__).where(c.id == cierre_id).values(**_totales_del_cierre(tipos)))
+        if tipos:
+            ejecutor.execute(insert(CierreTipo.__table__), [dict(fila, cierre_id=cierre_id) for fila in tipos])
+    return len(cierres)
@@ -0,0 +1,366 @@
+# comandos.py
+# Comandos de consola. Ejemplo: flask --app transacciones.src.app resumen reconstruir
+import datetime
+import functools
+
+import click
+from flask import current_app, g
+from flask.cli import AppGroup
+
+from .cierres import cerrar_dia, leer_fecha
+from .costos import recalcular_costos_desde
+from .escrituras import con_reintentos
+from .exportacion import exportar, parquet_disponible
+from .historial import filtrar_transacciones
+from .importacion import importar_transacciones, formato_desde_nombre
+from .libro_caja import caja_actual, saldo_caja, tomar_snapshot, verificar_saldos
+from .migraciones import aplicar_migraciones, explicar_consultas, version_actual
+from .models import db, Transaction
+from .operaciones import OperacionInvalida, fijar_sentido
+from .reproduccion import reproducir_caja, verificar_simetria
+from .resumenes import reconstruir_resumen
+from .serie_cotizaciones import FORMATOS_SERIE, FUENTE_BLUE, leer_fecha_hora, leer_volcado, serie_cotizaciones
+from .trabajos import Worker, cola_trabajos
+from .sucursales import elegir_sucursal, en_sucursal, listar_cajas, por_archivo
+
+resumen_cli = AppGroup('resumen', help="Mantenimiento del resumen diario de estadísticas.")
+bd_cli = AppGroup('bd', help="Esquema de la base de datos.")
+transacciones_cli = AppGroup('transacciones', help="Operaciones masivas sobre el libro de transacciones.")
+caja_cli = AppGroup('caja', help="Libro de movimientos de la caja.")
+costos_cli = AppGroup('costos', help="Costo promedio ponderado por moneda.")
+cotizaciones_cli = AppGroup('cotizaciones', help="Serie histórica de la cotización del dólar.")
+trabajos_cli = AppGroup('trabajos', help="Cola de trabajos en segundo plano.")
+
+
+def con_sucursal(comando):
+    """
+    Agrega --sucursal (id de su caja) a un comando y la fija antes de ejecutarlo.
+    """
+    @click.option('--sucursal', type=int, default=None, help="Id de la caja de la sucursal.")
+    @functools.wraps(comando)
+    def envoltura(sucursal, **kwargs):
+        if not elegir_sucursal(sucursal):
+            raise click.ClickException(f"No existe la sucursal {sucursal}.")
+        return comando(**kwargs)
+    return envoltura
+
+
+@transacciones_cli.command('importar')
+@click.argument('archivo', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--formato', type=click.Choice(['csv', 'jsonl']), default=None,
+              help="Por defecto se deduce de la extensión del archivo.")
+@click.option('--lote', type=int, default=1000, show_default=True, help="Filas por lote.")
+@con_sucursal
+def importar_comando(archivo, formato, lote):
+    """
+    Importa transacciones desde un archivo CSV o JSON lines.
+    """
+    formato = formato or formato_desde_nombre(archivo.name)
+    if not formato:
+        raise click.ClickException("No se pudo deducir el formato; use --formato.")
+    try:
+        resultado = importar_transacciones(archivo, formato, lote=lote)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for numero, mensaje in resultado.errores:
+        click.echo(f"Fila {numero}: {mensaje}", err=True)
+    click.echo(f"Importadas: {resultado.importadas}. Con errores: {len(resultado.errores)}.")
+
+
+@bd_cli.command('migrar')
+def migrar_comando():
+    """
+    Aplica las migraciones pendientes.
+    """
+    aplicadas = aplicar_migraciones()
+    for numero, descripcion in aplicadas:
+        click.echo(f"Aplicada migración {numero}: {descripcion}")
+    with db.engine.connect() as conexion:
+        click.echo(f"Esquema en versión {version_actual(conexion)}.")
+    if por_archivo():
+        # La base de cada sucursal se migra al abrirla
+        for caja in listar_cajas():
+            version = en_sucursal(caja.id, lambda: version_actual(db.session.connection()))
+            click.echo(f"Sucursal {caja.id}: esquema en versión {version}.")
+
+
+@bd_cli.command('explicar')
+def explicar_comando():
+    """
+    Muestra el plan de las consultas frecuentes y falla si alguna recorre la tabla completa.
+    """
+    with db.engine.connect() as conexion:
+        planes = explicar_consultas(conexion)
+    sin_indice = [nombre for nombre, (usa_indice, _) in planes.items() if not usa_indice]
+    for nombre, (usa_indice, plan) in planes.items():
+        click.echo(f"{'OK ' if usa_indice else 'MAL'} {nombre}: {' / '.join(plan)}")
+    if sin_indice:
+        raise click.ClickException(f"Consultas sin índice: {', '.join(sin_indice)}")
+
+
+@transacciones_cli.command('exportar')
+@click.argument('salida', type=click.Path(dir_okay=False, writable=True))
+@click.option('--formato', type=click.Choice(['csv', 'parquet']), default='csv', show_default=True)
+@click.option('--tipo', default=None, help="Filtrar por tipo de transacción.")
+@click.option('--concepto', default=None, help="Filtrar por concepto.")
+@click.option('--desde', default=None, help="Fecha de inicio (YYYY-MM-DD).")
+@click.option('--hasta', default=None, help="Fecha de fin inclusive (YYYY-MM-DD).")
+@click.option('--lote', type=int, default=5000, show_default=True, help="Filas leídas por lote.")
+@con_sucursal
+def exportar_comando(salida, formato, tipo, concepto, desde, hasta, lote):
+    """
+    Exporta el libro de transacciones con los mismos filtros que el historial.
+    """
+    if formato == 'parquet' and not parquet_disponible():
+        raise click.ClickException("La exportación a Parquet requiere instalar pyarrow.")
+    query, errores = filtrar_transacciones(
+        {'type': tipo, 'concept': concepto, 'start_date': desde, 'end_date': hasta}, g.get('caja_id')
+    )
+    if errores:
+        raise click.ClickException(" ".join(errores))
+    modo, codificacion = ('w', 'utf-8') if formato == 'csv' else ('wb', None)
+    with open(salida, modo, encoding=codificacion, newline='' if formato == 'csv' else None) as archivo:
+        for bloque in exportar(query, formato, lote=lote):
+            archivo.write(bloque)
+    click.echo(f"Exportado a {salida}.")
+
+
+@resumen_cli.command('reconstruir')
+@click.option('--desde', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help="Reconstruir sólo desde esta fecha (YYYY-MM-DD).")
+@con_sucursal
+def reconstruir_resumen_comando(desde):
+    """
+    Recalcula el resumen diario a partir del libro de transacciones.
+    """
+    filas = reconstruir_resumen(desde.date() if desde else None)
+    db.session.commit()
+    click.echo(f"Resumen reconstruido: {filas} filas.")
+
+
+@caja_cli.command('verificar')
+@con_sucursal
+def verificar_caja_comando():
+    """
+    Recalcula los saldos desde los movimientos y los compara con los snapshots.
+    """
+    diferencias = verificar_saldos()
+    for diferencia in diferencias:
+        click.echo(diferencia, err=True)
+    if diferencias:
+        raise click.ClickException(f"{len(diferencias)} diferencias encontradas.")
+    caja = caja_actual()
+    if caja:
+        saldo = saldo_caja(caja)
+        click.echo(f"Caja {caja.id}: {saldo.pesos} pesos, {saldo.dolares} dólares.")
+    click.echo("Saldos verificados.")
+
+
+@caja_cli.command('snapshot')
+@con_sucursal
+def snapshot_caja_comando():
+    """
+    Guarda un snapshot del saldo actual de la caja.
+    """
+    caja = caja_actual()
+    if not caja:
+        raise click.ClickException("No hay una caja configurada.")
+    snapshot = tomar_snapshot(caja)
+    db.session.commit()
+    if snapshot:
+        click.echo(f"Snapshot hasta el movimiento {snapshot.movimiento_id}.")
+
+
+@caja_cli.command('cerrar')
+@click.option('--fecha', default=None, help="Día a cerrar (AAAA-MM-DD); por defecto, hoy.")
+@click.option('--desde', default=None, help="Cierra cada día desde esta fecha hasta --fecha.")
+@con_sucursal
+def cerrar_caja_comando(fecha, desde):
+    """
+    Cierra la caja del día: guarda el saldo y los totales por tipo. Pensado para correr cada noche.
+    """
+    caja = caja_actual()
+    if not caja:
+        raise click.ClickException("No hay una caja configurada.")
+    try:
+        hasta = leer_fecha(fecha) if fecha else datetime.date.today()
+        dia = leer_fecha(desde) if desde else hasta
+        if dia > hasta:
+            raise ValueError("La fecha de inicio es posterior a la de fin.")
+        while dia <= hasta:
+            cierre = con_reintentos(lambda: _cerrar_y_guardar(caja, dia))
+            click.echo(f"{cierre.fecha}: {cierre.pesos} pesos, {cierre.dolares} dólares, "
+                       f"{cierre.cantidad} transacciones.")
+            dia += datetime.timedelta(days=1)
+    except ValueError as e:
+        db.session.rollback()
+        raise click.ClickException(str(e))
+
+
+def _cerrar_y_guardar(caja, fecha):
+    cierre = cerrar_dia(caja, fecha)
+    db.session.commit()
+    return cierre
+
+
+@caja_cli.command('reproducir')
+@click.option('--lote', type=int, default=10000, show_default=True, help="Filas leídas por lote.")
+@con_sucursal
+def reproducir_caja_comando(lote):
+    """
+    Recalcula la caja desde sus fondos con la tabla de impactos y muestra los desvíos por transacción.
+    """
+    caja = caja_actual()
+    if not caja:
+        raise click.ClickException("No hay una caja configurada.")
+    reproduccion = reproducir_caja(caja, lote)
+    for desvio in reproduccion.desvios:
+        origen = desvio.tipo or "eliminada"
+        click.echo(f"Transacción {desvio.transaction_id} ({origen}): esperado {desvio.esperado.pesos}/"
+                   f"{desvio.esperado.dolares}, registrado {desvio.registrado.pesos}/{desvio.registrado.dolares}",
+                   err=True)
+    click.echo(f"Caja {caja.id}: {reproduccion.transacciones} transacciones reproducidas"
+               f" ({reproduccion.sin_movimientos} anteriores al libro de movimientos).")
+    click.echo(f"Esperado {reproduccion.esperado.pesos} pesos, {reproduccion.esperado.dolares} dólares; "
+               f"registrado {reproduccion.registrado.pesos} pesos, {reproduccion.registrado.dolares} dólares.")
+    if reproduccion.sin_sentido:
+        click.echo(f"{len(reproduccion.sin_sentido)} cash_to_cash sin sentido de la comisión (fijarlo con "
+                   f"'flask caja sentido'): {', '.join(map(str, reproduccion.sin_sentido))}.", err=True)
+    if reproduccion.cantidad_desvios:
+        raise click.ClickException(f"{reproduccion.cantidad_desvios} transacciones con desvíos.")
+
+
+@caja_cli.command('sentido')
+@click.argument('transaction_id', type=int)
+@click.argument('sentido', type=click.Choice(['pagada', 'recibida']))
+@con_sucursal
+def sentido_comando(transaction_id, sentido):
+    """
+    Fija si se pagó o se recibió la comisión de una cash_to_cash heredada.
+    """
+    def fijar():
+        transaccion = db.session.get(Transaction, transaction_id)
+        if not transaccion:
+            raise click.ClickException("Transacción no encontrada.")
+        fijar_sentido(transaccion, sentido == 'pagada')
+        db.session.commit()
+        return transaccion
+
+    try:
+        transaccion = con_reintentos(fijar)
+    except OperacionInvalida as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Transacción {transaccion.id}: comisión {sentido}.")
+
+
+@caja_cli.command('simetria')
+@click.option('--casos', type=int, default=1000, show_default=True, help="Casos al azar por tipo.")
+@click.option('--semilla', type=int, default=None)
+def simetria_comando(casos, semilla):
+    """
+    Comprueba que aplicar y revertir cada tipo de transacción deja la caja en cero.
+    """
+    fallas = verificar_simetria(casos, semilla)
+    for falla in fallas[:20]:
+        click.echo(falla, err=True)
+    if fallas:
+        raise click.ClickException(f"{len(fallas)} casos no vuelven a cero.")
+    click.echo("Aplicar y revertir vuelve a cero en todos los casos.")
+
+
+@costos_cli.command('recalcular')
+@click.option('--desde', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help="Recalcular sólo desde esta fecha (YYYY-MM-DD).")
+@con_sucursal
+def recalcular_costos_comando(desde):
+    """
+    Recalcula la posición de cada moneda y el resultado de las ventas, y luego el resumen diario.
+    """
+    filas = recalcular_costos_desde(desde)
+    reconstruir_resumen(desde.date() if desde else None)
+    db.session.commit()
+    click.echo(f"Costos recalculados: {filas} operaciones.")
+
+
+@cotizaciones_cli.command('importar')
+@click.argument('archivo', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--formato', type=click.Choice(FORMATOS_SERIE), default=None,
+              help="Por defecto se deduce de la extensión: .csv, .jsonl o .json (lista).")
+@click.option('--fuente', default=FUENTE_BLUE, show_default=True,
+              help="Fuente de las filas que no la indican.")
+@click.option('--lote', type=int, default=1000, show_default=True, help="Filas por lote.")
+def importar_cotizaciones_comando(archivo, formato, fuente, lote):
+    """
+    Carga cotizaciones históricas desde un volcado local (fecha, compra, venta y opcionalmente fuente).
+    También acepta la evolución de bluelytics (date, source, value_buy, value_sell).
+    """
+    formato = formato or archivo.name.rsplit('.', 1)[-1].lower()
+    if formato not in FORMATOS_SERIE:
+        raise click.ClickException("No se pudo deducir el formato; use --formato.")
+    try:
+        importadas, errores = serie_cotizaciones().importar(leer_volcado(archivo, formato), fuente, lote)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for numero, mensaje in errores:
+        click.echo(f"Fila {numero}: {mensaje}", err=True)
+    click.echo(f"Importadas: {importadas}. Con errores: {len(errores)}.")
+
+
+@cotizaciones_cli.command('ver')
+@click.option('--fecha', default=None, help="Fecha y hora ISO 8601; por defecto, ahora.")
+@click.option('--fuente', default=FUENTE_BLUE, show_default=True)
+def ver_cotizacion_comando(fecha, fuente):
+    """
+    Muestra la cotización vigente en una fecha según la serie histórica.
+    """
+    try:
+        fecha_hora = leer_fecha_hora(fecha) if fecha else None
+    except ValueError:
+        raise click.ClickException(f"Fecha inválida: {fecha}.")
+    punto = serie_cotizaciones().en(fecha_hora, fuente)
+    if punto is None:
+        raise click.ClickException("No hay una cotización registrada para esa fecha.")
+    click.echo(f"{fuente} desde {punto.fecha_hora}: compra {punto.compra}, venta {punto.venta}.")
+
+
+@trabajos_cli.command('worker')
+@click.option('--procesos', type=int, default=None, help="Trabajos en paralelo (por defecto TRABAJOS_PROCESOS).")
+def worker_comando(procesos):
+    """
+    Atiende la cola de trabajos hasta recibir SIGTERM. Se inicia junto a gunicorn (ver procFile).
+    """
+    procesos = procesos or current_app.config['TRABAJOS_PROCESOS']
+    click.echo(f"Atendiendo la cola de trabajos con {procesos} procesos.")
+    Worker(current_app._get_current_object(), procesos).atender()
+
+
+@trabajos_cli.command('listar')
+@click.option('--limite', type=int, default=20, show_default=True)
+def listar_trabajos_comando(limite):
+    """
+    Muestra los últimos trabajos con su estado y avance.
+    """
+    for trabajo in cola_trabajos().listar(limite):
+        avance = f"{trabajo['avance']}/{trabajo['total']}" if trabajo['total'] else trabajo['avance']
+        click.echo(f"{trabajo['id']:>6} {trabajo['estado']:<10} {avance!s:>15}  {trabajo['descripcion']}"
+                   f"{': ' + trabajo['error'] if trabajo['error'] else ''}")
+
+
+@trabajos_cli.command('limpiar')
+@click.option('--dias', type=int, default=None, help="Por defecto TRABAJOS_RETENCION_DIAS.")
+def limpiar_trabajos_comando(dias):
+    """
+    Borra los trabajos terminados hace más de `dias` días y sus archivos.
+    """
+    borrados = cola_trabajos().limpiar(dias if dias is not None else current_app.config['TRABAJOS_RETENCION_DIAS'])
+    click.echo(f"Trabajos borrados: {borrados}.")
+
+
+def registrar_comandos(app):
+    app.cli.add_command(resumen_cli)
+    app.cli.add_command(bd_cli)
+    app.cli.add_command(transacciones_cli)
+    app.cli.add_command(caja_cli)
+    app.cli.add_command(costos_cli)
+    app.cli.add_command(cotizaciones_cli)
+    app.cli.add_command(trabajos_cli)
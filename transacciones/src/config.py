@@ -2,8 +2,90 @@
 import os
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(BASE_DIR, "database.db")}'
+SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', f'sqlite:///{os.path.join(BASE_DIR, "database.db")}')
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Perfiles de SQLite. "produccion" permite leer mientras otro worker escribe (WAL)
+# y espera al lock en lugar de fallar con "database is locked".
+SQLITE_PERFILES = {
+    'produccion': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',  # Con WAL no se pierden datos ante un corte del proceso
+        'busy_timeout': 5000,  # Milisegundos
+        'mmap_size': 268435456,  # 256 MB
+        'cache_size': -65536,  # 64 MB (negativo = KiB)
+        'temp_store': 'MEMORY',
+    },
+    'compatible': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'busy_timeout': 5000,
+    },
+}
+SQLITE_PERFIL = os.getenv('SQLITE_PERFIL', 'produccion')
+SQLALCHEMY_ENGINE_OPTIONS = {
+    'pool_size': int(os.getenv('SQLITE_POOL_SIZE', 5)),
+    'max_overflow': int(os.getenv('SQLITE_POOL_OVERFLOW', 5)),
+    'pool_timeout': 10,
+    'pool_recycle': 3600,
+    'connect_args': {'timeout': 5, 'check_same_thread': False},
+}
 DEFAULT_USERNAME = os.getenv('DEFAULT_USERNAME')
 DEFAULT_PASSWORD = os.getenv('DEFAULT_PASSWORD')
-SECRET_KEY = os.getenv('SECRET_KEY')
\ No newline at end of file
+SECRET_KEY = os.getenv('SECRET_KEY')
+# Migrar el esquema al crear la app. Con 0 se migra aparte: flask --app transacciones.src.app bd migrar
+MIGRAR_AL_INICIAR = os.getenv('MIGRAR_AL_INICIAR', '1') != '0'
+
+# Cotización del dólar
+COTIZACION_URL = os.getenv('COTIZACION_URL', 'https://api.bluelytics.com.ar/v2/latest')
+COTIZACION_TTL = int(os.getenv('COTIZACION_TTL', 300))  # Segundos antes de considerar vencida la cotización
+COTIZACION_TIMEOUT = float(os.getenv('COTIZACION_TIMEOUT', 5))
+COTIZACION_CACHE_PATH = os.getenv('COTIZACION_CACHE_PATH', os.path.join(BASE_DIR, "cotizacion.db"))
+
+# Historial
+HISTORIAL_POR_PAGINA = int(os.getenv('HISTORIAL_POR_PAGINA', 100))
+HISTORIAL_MAX_POR_PAGINA = int(os.getenv('HISTORIAL_MAX_POR_PAGINA', 1000))
+HISTORIAL_LOTE_STREAM = int(os.getenv('HISTORIAL_LOTE_STREAM', 500))  # Filas por lote con stream=1
+
+# Importación masiva
+IMPORTACION_LOTE = int(os.getenv('IMPORTACION_LOTE', 1000))  # Filas por executemany / commit
+EXPORTACION_LOTE = int(os.getenv('EXPORTACION_LOTE', 5000))  # Filas leídas por lote al exportar
+REPRODUCCION_LOTE = int(os.getenv('REPRODUCCION_LOTE', 10000))  # Filas leídas por lote al reproducir el libro
+
+# API JSON (/api/v1). Tokens separados por comas; se envían como "Authorization: Bearer <token>"
+API_TOKENS = [token.strip() for token in os.getenv('API_TOKENS', '').split(',') if token.strip()]
+API_MAX_LOTE = int(os.getenv('API_MAX_LOTE', 1000))  # Operaciones por request en los endpoints batch
+
+# Modo ASGI opcional (uvicorn transacciones.src.asgi:aplicacion). Hilos que atienden la parte WSGI de la app
+ASGI_HILOS = int(os.getenv('ASGI_HILOS', 10))
+
+# Métricas (/metrics en formato Prometheus). Cada worker vuelca las suyas en METRICAS_DIR
+METRICAS_HABILITADAS = os.getenv('METRICAS_HABILITADAS', '1') != '0'
+METRICAS_DIR = os.getenv('METRICAS_DIR', os.path.join(BASE_DIR, "metricas"))
+METRICAS_INTERVALO = float(os.getenv('METRICAS_INTERVALO', 1))  # Segundos entre volcados de cada worker
+METRICAS_TOKEN = os.getenv('METRICAS_TOKEN')  # /metrics pide "Authorization: Bearer <token>"
+# Sin token /metrics responde 403, salvo que se la exponga a propósito (p. ej. sólo en una red interna)
+METRICAS_PUBLICAS = os.getenv('METRICAS_PUBLICAS', '0') == '1'
+METRICAS_SQL_LENTA_MS = float(os.getenv('METRICAS_SQL_LENTA_MS', 100))  # Umbral del log de consultas lentas
+METRICAS_SQL_LENTA_LOG = os.getenv('METRICAS_SQL_LENTA_LOG')  # Archivo del log; por defecto va a stderr
+# Escribir también los parámetros (montos, conceptos) de las consultas lentas; sólo para depurar
+METRICAS_SQL_LENTA_PARAMETROS = os.getenv('METRICAS_SQL_LENTA_PARAMETROS', '0') == '1'
+
+# Cache de fragmentos de estadísticas e historial, compartida por los workers e invalidada al cambiar el libro
+CACHE_VISTAS_HABILITADA = os.getenv('CACHE_VISTAS_HABILITADA', '1') != '0'
+CACHE_VISTAS_PATH = os.getenv('CACHE_VISTAS_PATH', os.path.join(BASE_DIR, "cache_vistas.db"))
+CACHE_VISTAS_MAX = int(os.getenv('CACHE_VISTAS_MAX', 1000))  # Fragmentos guardados como máximo
+
+# Sucursales. Sin plantilla todas comparten la base principal; con una plantilla de URL con {caja_id}
+# (p. ej. sqlite:////datos/sucursal_{caja_id}.db) cada sucursal escribe en su propio archivo
+# y la base principal queda como catálogo de sucursales
+SUCURSALES_DB_PLANTILLA = os.getenv('SUCURSALES_DB_PLANTILLA') or None
+SUCURSALES_HILOS = int(os.getenv('SUCURSALES_HILOS', 8))  # Consultas en paralelo de la vista consolidada
+
+# Cola de trabajos en segundo plano, atendida por `flask --app transacciones.src.app trabajos worker` (procFile)
+TRABAJOS_DIR = os.getenv('TRABAJOS_DIR', os.path.join(BASE_DIR, "trabajos"))  # Archivos subidos y generados
+TRABAJOS_PROCESOS = int(os.getenv('TRABAJOS_PROCESOS', 2))  # Trabajos en paralelo, uno por proceso
+TRABAJOS_INTERVALO = float(os.getenv('TRABAJOS_INTERVALO', 1))  # Segundos entre consultas a la cola
+TRABAJOS_VENCIDO = int(os.getenv('TRABAJOS_VENCIDO', 120))  # Segundos sin latido para dar por caído un trabajo
+TRABAJOS_INTENTOS = int(os.getenv('TRABAJOS_INTENTOS', 3))
+TRABAJOS_RETENCION_DIAS = int(os.getenv('TRABAJOS_RETENCION_DIAS', 7))  # Días que se guardan los terminados
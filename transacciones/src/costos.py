@@ -0,0 +1,140 @@
+# costos.py
+# Costo promedio ponderado por sucursal y moneda, persistido operación por operación.
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+
+from sqlalchemy import delete, insert, select, tuple_, union
+
+from .dinero import ESCALA_DINERO, ESCALA_TASA
+from .models import db, Transaction, CostoTransaccion
+
+MONEDAS = {
+    'compra_dolares': 'dolares', 'venta_dolares': 'dolares',
+    'compra_pesos': 'pesos', 'venta_pesos': 'pesos',
+}
+TIPOS_POR_MONEDA = {
+    'dolares': ('compra_dolares', 'venta_dolares'),
+    'pesos': ('compra_pesos', 'venta_pesos'),
+}
+
+Posicion = namedtuple('Posicion', 'cantidad costo_promedio')
+POSICION_VACIA = Posicion(Decimal(0), None)
+
+LOTE_COSTOS = 10000  # Filas por insert al recalcular
+
+
+def _cuantizar(valor, escala):
+    return valor.quantize(Decimal(1).scaleb(-escala), rounding=ROUND_HALF_UP)
+
+
+def aplicar_operacion(posicion, tipo, monto, tasa, precio_manual=None):
+    """
+    Posición después de una compra o venta. Devuelve (posicion, precio_costo, resultado);
+    en las compras precio_costo y resultado son None.
+
+    Una compra promedia su tasa con la tenencia. Una venta se costea al promedio vigente
+    (o a `precio_manual` si nunca hubo compras) y descuenta la tenencia sin cambiar el promedio.
+    """
+    cantidad, promedio = posicion
+    if tipo in ('compra_dolares', 'compra_pesos'):
+        if cantidad <= 0 or promedio is None:
+            return Posicion(monto, tasa), None, None
+        total = cantidad + monto
+        return Posicion(total, _cuantizar((cantidad * promedio + monto * tasa) / total, ESCALA_TASA)), None, None
+
+    costo = promedio if promedio is not None else precio_manual
+    resultado = _cuantizar((tasa - costo) * monto, ESCALA_DINERO) if costo is not None else None
+    return Posicion(max(cantidad - monto, Decimal(0)), promedio), costo, resultado
+
+
+def posicion_previa(caja_id, moneda, fecha_hora=None, transaction_id=0, conexion=None):
+    """
+    Posición de `moneda` en la caja `caja_id` justo antes de la operación (fecha_hora, transaction_id).
+    Sin fecha devuelve la posición actual. Es una sola lectura por índice.
+    """
+    c = CostoTransaccion.__table__.c
+    consulta = select(c.cantidad, c.costo_promedio).where(c.caja_id == caja_id, c.moneda == moneda)
+    if fecha_hora is not None:
+        consulta = consulta.where(tuple_(c.fecha_hora, c.transaction_id) < tuple_(fecha_hora, transaction_id))
+    consulta = consulta.order_by(c.fecha_hora.desc(), c.transaction_id.desc()).limit(1)
+    fila = (conexion or db.session).execute(consulta).first()
+    return Posicion(*fila) if fila else POSICION_VACIA
+
+
+def precio_costo_vigente(caja_id, tipo):
+    """
+    Costo promedio actual de la moneda de `tipo` en la caja, o None si no hay compras registradas.
+    """
+    moneda = MONEDAS.get(tipo)
+    return posicion_previa(caja_id, moneda).costo_promedio if moneda else None
+
+
+def recalcular_costos(caja_id, moneda, fecha_hora=None, transaction_id=0, conexion=None):
+    """
+    Rehace la posición de `moneda` en la caja `caja_id` desde la operación (fecha_hora, transaction_id)
+    en adelante.
+    Un alta al final del libro recalcula sólo esa fila; una baja o edición en el pasado,
+    las operaciones posteriores de la misma moneda. No hace commit. Devuelve las filas escritas.
+    """
+    ejecutor = conexion or db.session
+    c = CostoTransaccion.__table__.c
+    t = Transaction.__table__.c
+
+    borrado = delete(CostoTransaccion.__table__).where(c.caja_id == caja_id, c.moneda == moneda)
+    operaciones = select(
+        t.id, t.tipo, t.fecha_hora, t.monto, t.tasa_cambio, t.precio_compra
+    ).where(t.caja_id == caja_id, t.tipo.in_(TIPOS_POR_MONEDA[moneda]))
+    if fecha_hora is not None:
+        posicion = posicion_previa(caja_id, moneda, fecha_hora, transaction_id, conexion)
+        borrado = borrado.where(tuple_(c.fecha_hora, c.transaction_id) >= tuple_(fecha_hora, transaction_id))
+        operaciones = operaciones.where(tuple_(t.fecha_hora, t.id) >= tuple_(fecha_hora, transaction_id))
+    else:
+        posicion = POSICION_VACIA
+    ejecutor.execute(borrado)
+
+    nuevas, escritas = [], 0
+    for fila in ejecutor.execute(operaciones.order_by(t.fecha_hora, t.id)):
+        escritas += 1
+        posicion, precio_costo, resultado = aplicar_operacion(
+            posicion, fila.tipo, fila.monto, fila.tasa_cambio, fila.precio_compra
+        )
+        nuevas.append({
+            'transaction_id': fila.id, 'caja_id': caja_id, 'moneda': moneda, 'fecha_hora': fila.fecha_hora,
+            'cantidad': posicion.cantidad, 'costo_promedio': posicion.costo_promedio,
+            'precio_costo': precio_costo, 'resultado': resultado,
+        })
+        if len(nuevas) >= LOTE_COSTOS:
+            ejecutor.execute(insert(CostoTransaccion.__table__), nuevas)
+            nuevas = []
+    if nuevas:
+        ejecutor.execute(insert(CostoTransaccion.__table__), nuevas)
+    return escritas
+
+
+def actualizar_costos(*operaciones):
+    """
+    Actualiza las posiciones afectadas por las operaciones dadas como (caja_id, tipo, fecha_hora, id):
+    por cada caja y moneda se recalcula una sola vez desde la operación más antigua.
+    """
+    desde = {}
+    for caja_id, tipo, fecha_hora, transaction_id in operaciones:
+        clave = (caja_id, MONEDAS.get(tipo))
+        if clave[1] and (clave not in desde or (fecha_hora, transaction_id) < desde[clave]):
+            desde[clave] = (fecha_hora, transaction_id)
+    return sum(recalcular_costos(caja_id, moneda, *punto) for (caja_id, moneda), punto in desde.items())
+
+
+def recalcular_costos_desde(fecha_hora=None, conexion=None):
+    """
+    Recalcula todas las cajas y monedas desde `fecha_hora` (o desde el principio). No hace commit.
+    """
+    t = Transaction.__table__.c
+    cajas = union(
+        select(t.caja_id).where(t.tipo.in_(MONEDAS)),
+        select(CostoTransaccion.__table__.c.caja_id),  # Cajas cuyas compras y ventas ya se eliminaron
+    )
+    return sum(
+        recalcular_costos(caja_id, moneda, fecha_hora, 0, conexion)
+        for caja_id in (conexion or db.session).execute(cajas).scalars().all()
+        for moneda in TIPOS_POR_MONEDA
+    )
@@ -0,0 +1,190 @@
+# cotizaciones.py
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from .metricas import medir_cotizacion
+from .utils import get_dollar_price
+
+log = logging.getLogger(__name__)
+
+
+class ProveedorCotizacion:
+    """
+    Interfaz de las fuentes de cotización del dólar.
+    Las subclases implementan `obtener()` y devuelven {'buy': float, 'sell': float} o None.
+    """
+    nombre = 'base'
+
+    def obtener(self):
+        raise NotImplementedError
+
+
+class ProveedorBluelytics(ProveedorCotizacion):
+    """
+    Cotización del dólar blue desde bluelytics (o un servidor compatible, p. ej. un stub local).
+    """
+    nombre = 'bluelytics'
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def obtener(self):
+        return get_dollar_price(self.url, timeout=self.timeout)
+
+
+class ProveedorFijo(ProveedorCotizacion):
+    """
+    Devuelve siempre la misma cotización. Útil para desarrollo sin red.
+    """
+    nombre = 'fijo'
+
+    def __init__(self, compra, venta):
+        self.cotizacion = {"buy": float(compra), "sell": float(venta)}
+
+    def obtener(self):
+        return dict(self.cotizacion)
+
+
+class CacheCotizacion:
+    """
+    Última cotización válida guardada en un archivo SQLite compartido por todos los workers.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        with self._conectar() as conexion:
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS cotizacion_cache ("
+                " clave TEXT PRIMARY KEY,"
+                " compra REAL, venta REAL,"
+                " obtenida_en REAL,"
+                " refrescando_hasta REAL NOT NULL DEFAULT 0)"
+            )
+            conexion.execute(
+                "INSERT OR IGNORE INTO cotizacion_cache (clave) VALUES ('blue')"
+            )
+
+    def _conectar(self):
+        return sqlite3.connect(self.ruta, timeout=1)
+
+    def leer(self):
+        """
+        Devuelve (cotizacion, obtenida_en). Si nunca se obtuvo una cotización devuelve (None, None).
+        """
+        with self._conectar() as conexion:
+            fila = conexion.execute(
+                "SELECT compra, venta, obtenida_en FROM cotizacion_cache WHERE clave = 'blue'"
+            ).fetchone()
+        if not fila or fila[2] is None:
+            return None, None
+        return {"buy": fila[0], "sell": fila[1]}, fila[2]
+
+    def guardar(self, cotizacion):
+        with self._conectar() as conexion:
+            conexion.execute(
+                "UPDATE cotizacion_cache SET compra = ?, venta = ?, obtenida_en = ?, refrescando_hasta = 0 "
+                "WHERE clave = 'blue'",
+                (cotizacion["buy"], cotizacion["sell"], time.time()),
+            )
+
+    def tomar_turno(self, duracion):
+        """
+        Reserva el refresco para este proceso durante `duracion` segundos.
+        Evita que los workers de gunicorn consulten la API todos a la vez.
+        """
+        ahora = time.time()
+        with self._conectar() as conexion:
+            cursor = conexion.execute(
+                "UPDATE cotizacion_cache SET refrescando_hasta = ? "
+                "WHERE clave = 'blue' AND refrescando_hasta < ?",
+                (ahora + duracion, ahora),
+            )
+        return cursor.rowcount == 1
+
+    def liberar_turno(self):
+        with self._conectar() as conexion:
+            conexion.execute("UPDATE cotizacion_cache SET refrescando_hasta = 0 WHERE clave = 'blue'")
+
+
+class ServicioCotizacion:
+    """
+    Sirve la cotización desde la cache sin bloquear la request.
+    Un hilo en segundo plano la refresca cada `ttl` segundos; si una request encuentra
+    un valor vencido lo devuelve igual (stale-while-revalidate) y despierta al hilo.
+    Cada cotización obtenida se agrega a `serie` (ver serie_cotizaciones.py) si se indica.
+    """
+
+    def __init__(self, proveedor, cache, ttl=300, timeout_refresco=10, serie=None):
+        self.proveedor = proveedor
+        self.cache = cache
+        self.serie = serie
+        self.ttl = ttl
+        self.timeout_refresco = timeout_refresco
+        self._despertar = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    @classmethod
+    def desde_config(cls, config, serie=None):
+        proveedor = config.get('COTIZACION_PROVEEDOR') or ProveedorBluelytics(
+            config['COTIZACION_URL'], timeout=config.get('COTIZACION_TIMEOUT', 5)
+        )
+        cache = CacheCotizacion(config['COTIZACION_CACHE_PATH'])
+        return cls(proveedor, cache, ttl=config.get('COTIZACION_TTL', 300), serie=serie)
+
+    def obtener(self):
+        """
+        Devuelve la última cotización conocida o None. Nunca espera a la red.
+        """
+        self._iniciar_refresco()
+        cotizacion, obtenida_en = self.cache.leer()
+        if obtenida_en is None or time.time() - obtenida_en >= self.ttl:
+            self._despertar.set()
+        return cotizacion
+
+    def refrescar(self):
+        """
+        Consulta al proveedor y actualiza la cache. Devuelve la cotización nueva o None.
+        """
+        if not self.cache.tomar_turno(self.timeout_refresco):
+            return None
+        cotizacion = None
+        try:
+            cotizacion = medir_cotizacion(self.proveedor.nombre, self.proveedor.obtener)
+        finally:
+            if cotizacion:
+                self.cache.guardar(cotizacion)
+            else:
+                self.cache.liberar_turno()
+        if cotizacion and self.serie is not None:
+            self.serie.registrar(cotizacion)
+        return cotizacion
+
+    def _iniciar_refresco(self):
+        # Un hilo por proceso: tras el fork de gunicorn el hilo del padre no existe.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._despertar = threading.Event()
+            self._despertar.set()
+            hilo = threading.Thread(target=self._bucle_refresco, name='refresco-cotizacion', daemon=True)
+            hilo.start()
+
+    def _bucle_refresco(self):
+        while True:
+            self._despertar.wait(timeout=max(self.ttl / 2, 1))
+            self._despertar.clear()
+            _, obtenida_en = self.cache.leer()
+            if obtenida_en is not None and time.time() - obtenida_en < self.ttl:
+                continue
+            try:
+                self.refrescar()
+            except Exception:
+                log.exception("Error al refrescar la cotización")
@@ -0,0 +1,60 @@
+# dinero.py
+# Montos en punto fijo: se guardan como enteros en unidades mínimas y se leen como Decimal.
+from decimal import Decimal, ROUND_HALF_UP
+
+from sqlalchemy import Integer
+from sqlalchemy.types import TypeDecorator
+
+ESCALA_DINERO = 2  # Centavos
+ESCALA_TASA = 4  # Tipos de cambio (0.0001)
+ESCALA_FRACCION = 8  # Porcentajes de comisión y descuento expresados como fracción
+
+
+def a_entero(valor, escala=ESCALA_DINERO):
+    """
+    Convierte un monto a entero en unidades mínimas, redondeando la mitad hacia arriba.
+    """
+    if isinstance(valor, float):
+        valor = str(valor)  # Evita arrastrar el error binario del float
+    return int((Decimal(valor) * (10 ** escala)).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def desde_entero(entero, escala=ESCALA_DINERO):
+    """
+    Convierte unidades mínimas a Decimal con exactamente `escala` decimales.
+    """
+    return Decimal(int(entero)).scaleb(-escala)
+
+
+def dividir_redondeando(numerador, denominador):
+    """
+    División entera con redondeo de la mitad hacia arriba (en valor absoluto), como ROUND_HALF_UP.
+    """
+    cociente, resto = divmod(abs(numerador), abs(denominador))
+    if resto * 2 >= abs(denominador):
+        cociente += 1
+    return cociente if (numerador >= 0) == (denominador > 0) else -cociente
+
+
+class Dinero(TypeDecorator):
+    """
+    Columna de punto fijo: INTEGER en la base, Decimal en Python.
+    Las sumas en SQL son exactas y no hay conversiones float <-> Decimal en cada request.
+    """
+    impl = Integer
+    cache_ok = True
+
+    def __init__(self, escala=ESCALA_DINERO):
+        super().__init__()
+        self.escala = escala
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return a_entero(value, self.escala)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        # Las expresiones con ROUND() de SQLite devuelven float con valor entero
+        return desde_entero(round(value), self.escala)
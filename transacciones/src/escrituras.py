@@ -0,0 +1,69 @@
+# escrituras.py
+# Escrituras serializadas entre workers: BEGIN IMMEDIATE y reintentos si la base está ocupada.
+import random
+import sqlite3
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from .models import db
+
+_inmediata = ContextVar('escritura_inmediata', default=False)
+
+
+def configurar_transacciones(engine):
+    """
+    Toma el control del BEGIN de pysqlite para poder abrir transacciones con BEGIN IMMEDIATE.
+    Por defecto pysqlite no emite BEGIN hasta la primera escritura, así que la lectura del saldo
+    y la escritura del movimiento quedaban en momentos distintos.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _desactivar_begin_implicito(conexion_dbapi, _registro):
+        conexion_dbapi.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def _emitir_begin(conexion):
+        conexion.exec_driver_sql("BEGIN IMMEDIATE" if _inmediata.get() else "BEGIN")
+
+
+@contextmanager
+def escritura():
+    """
+    Las transacciones que se abran dentro del bloque toman el lock de escritura al empezar,
+    de modo que lo que se lee (saldo, precio previo) no cambia hasta el commit.
+    """
+    token = _inmediata.set(True)
+    try:
+        yield
+    finally:
+        _inmediata.reset(token)
+
+
+def base_ocupada(error):
+    original = getattr(error, 'orig', None)
+    mensaje = str(original).lower()
+    return isinstance(original, sqlite3.OperationalError) and ('locked' in mensaje or 'busy' in mensaje)
+
+
+def con_reintentos(funcion, intentos=5, espera=0.05):
+    """
+    Ejecuta `funcion` dentro de una escritura. Si la base sigue ocupada después del busy_timeout,
+    deshace y reintenta con espera exponencial y jitter. `funcion` debe hacer toda la unidad
+    de trabajo, lecturas incluidas, y su commit.
+    """
+    for intento in range(intentos):
+        db.session.rollback()  # Cierra cualquier transacción de lectura para que el BEGIN sea IMMEDIATE
+        try:
+            with escritura():
+                return funcion()
+        except OperationalError as e:
+            db.session.rollback()
+            if not base_ocupada(e) or intento == intentos - 1:
+                raise
+        time.sleep(espera * 2 ** intento * random.uniform(0.5, 1.5))
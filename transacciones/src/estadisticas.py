@@ -0,0 +1,168 @@
+# estadisticas.py
+import datetime
+from decimal import Decimal
+
+from sqlalchemy import Integer, case, cast, func, select, type_coerce
+
+from .dinero import Dinero, ESCALA_TASA
+from .models import db, Transaction, CostoTransaccion, ResumenDiario
+
+TIPOS_COMPRA = ('compra_dolares', 'compra_pesos')
+TIPOS_VENTA = ('venta_dolares', 'venta_pesos')
+
+
+def filas_con_costo(desde=None, hasta=None, caja_id=None):
+    """
+    Subconsulta con cada transacción y, para las ventas, el costo y el resultado realizado
+    precalculados en costo_transaccion (ver costos.py). No hace falta leer compras anteriores.
+    `hasta` es exclusivo; con `caja_id`, sólo las transacciones de esa sucursal.
+    """
+    t = Transaction.__table__.c
+    c = CostoTransaccion.__table__.c
+    consulta = select(
+        t.id, t.caja_id, t.tipo, t.fecha_hora, t.monto, t.tasa_cambio, t.comision, t.descuento_cheque,
+        c.precio_costo, c.resultado,
+    ).select_from(Transaction.__table__.outerjoin(CostoTransaccion.__table__, c.transaction_id == t.id))
+    if desde is not None:
+        consulta = consulta.where(t.fecha_hora >= desde)
+    if hasta is not None:
+        consulta = consulta.where(t.fecha_hora < hasta)
+    if caja_id is not None:
+        consulta = consulta.where(t.caja_id == caja_id)
+    return consulta.subquery('filas')
+
+
+def _entero(columna):
+    """
+    Valor crudo de una columna Dinero (unidades mínimas), para operar en SQL sin convertir literales.
+    """
+    return type_coerce(columna, Integer)
+
+
+def _redondear(expresion):
+    return cast(func.round(expresion), Integer)
+
+
+def importes_por_fila(filas):
+    """
+    Importes de cada fila en centavos, calculados en SQL con aritmética entera.
+    """
+    monto = _entero(filas.c.monto)
+    tasa = _entero(filas.c.tasa_cambio)
+    resultado = _entero(filas.c.resultado)
+    escala_tasa = 10 ** ESCALA_TASA
+    return {
+        'monto': monto,
+        # monto / tasa, en centavos de dólar
+        'monto_usd': _redondear(monto * float(escala_tasa) / func.nullif(tasa, 0)),
+        # comision ya es el importe de la comisión, en centavos
+        'comision': func.coalesce(_entero(filas.c.comision), 0),
+        'descuento': func.coalesce(_entero(filas.c.descuento_cheque), 0),
+        'ganancia': case((resultado > 0, resultado), else_=0),
+        'perdida': case((resultado < 0, -resultado), else_=0),
+    }
+
+
+def _suma(expresion, condicion=None):
+    if condicion is not None:
+        expresion = case((condicion, expresion), else_=0)
+    return type_coerce(func.sum(expresion), Dinero())
+
+
+def columnas_agregadas(filas):
+    """
+    Expresiones SUM de cada estadística sobre la subconsulta `filas`.
+    """
+    importes = importes_por_fila(filas)
+    return (
+        _suma(importes['monto'], filas.c.tipo == 'venta_dolares').label('total_dolares_vendidos'),
+        _suma(importes['monto_usd'], filas.c.tipo == 'venta_pesos').label('total_pesos_vendidos'),
+        _suma(importes['ganancia']).label('total_ganancias'),
+        _suma(importes['perdida']).label('total_perdidas'),
+        _suma(importes['comision'], filas.c.tipo.in_(('cable_subida', 'cable_bajada'))).label('total_comisiones'),
+        _suma(importes['descuento'], filas.c.tipo == 'descuento_cheque').label('total_descuentos_cheques'),
+    )
+
+
+def columnas_resumen(filas):
+    """
+    Expresiones por tipo de transacción que guarda el resumen diario.
+    """
+    importes = importes_por_fila(filas)
+    return (
+        func.count().label('cantidad'),
+        _suma(importes['monto']).label('volumen'),
+        type_coerce(func.coalesce(func.sum(importes['monto_usd']), 0), Dinero()).label('volumen_usd'),
+        _suma(importes['comision']).label('comisiones'),
+        _suma(importes['descuento']).label('descuentos'),
+        _suma(importes['ganancia']).label('ganancias'),
+        _suma(importes['perdida']).label('perdidas'),
+    )
+
+
+def _a_decimal(valor):
+    return valor if valor is not None else Decimal(0)
+
+
+def calcular_estadisticas(inicio):
+    """
+    Calcula todas las estadísticas desde `inicio` en una única consulta sobre el libro.
+    """
+    filas = filas_con_costo(inicio)
+    consulta = select(*columnas_agregadas(filas))
+    resultado = db.session.execute(consulta).mappings().one()
+    return {clave: _a_decimal(valor) for clave, valor in resultado.items()}
+
+
+def _columnas_desde_resumen(r):
+    return (
+        _suma(_entero(r.volumen), r.tipo == 'venta_dolares').label('total_dolares_vendidos'),
+        _suma(_entero(r.volumen_usd), r.tipo == 'venta_pesos').label('total_pesos_vendidos'),
+        _suma(_entero(r.ganancias)).label('total_ganancias'),
+        _suma(_entero(r.perdidas)).label('total_perdidas'),
+        _suma(_entero(r.comisiones), r.tipo.in_(('cable_subida', 'cable_bajada'))).label('total_comisiones'),
+        _suma(_entero(r.descuentos), r.tipo == 'descuento_cheque').label('total_descuentos_cheques'),
+    )
+
+
+def estadisticas_desde_resumen(inicio, caja_id=None):
+    """
+    Mismas estadísticas que `calcular_estadisticas`, leídas del resumen diario.
+    Cuenta los días completos a partir de la fecha de `inicio`; con `caja_id`, sólo esa sucursal.
+    """
+    r = ResumenDiario.__table__.c
+    consulta = select(*_columnas_desde_resumen(r)).where(r.fecha >= inicio.date())
+    if caja_id is not None:
+        consulta = consulta.where(r.caja_id == caja_id)
+    resultado = db.session.execute(consulta).mappings().one()
+    return {clave: _a_decimal(valor) for clave, valor in resultado.items()}
+
+
+def estadisticas_por_caja(inicio):
+    """
+    {caja_id: estadísticas} desde el resumen diario, en una sola consulta agrupada por sucursal.
+    """
+    r = ResumenDiario.__table__.c
+    columnas = _columnas_desde_resumen(r)
+    consulta = select(r.caja_id, *columnas).where(r.fecha >= inicio.date()).group_by(r.caja_id)
+    por_caja = {}
+    for fila in db.session.execute(consulta).mappings():
+        por_caja[fila['caja_id']] = {c.name: _a_decimal(fila[c.name]) for c in columnas}
+    return por_caja
+
+
+def inicio_de_rango(rango, hoy=None):
+    """
+    Fecha de inicio de las estadísticas para un rango: daily, weekly, monthly, yearly
+    o cualquier otro valor para no poner límite inferior.
+    """
+    hoy = hoy or datetime.datetime.utcnow()
+    if rango == 'daily':
+        return hoy.replace(hour=0, minute=0, second=0, microsecond=0)
+    if rango == 'weekly':
+        return hoy - datetime.timedelta(days=hoy.weekday())  # Inicio de la semana
+    if rango == 'monthly':
+        return hoy.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if rango == 'yearly':
+        return hoy.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+    return datetime.datetime.min  # Sin límite inferior
@@ -0,0 +1,148 @@
+# exportacion.py
+# Exportación del libro en CSV o Parquet, en lotes y con memoria constante.
+import csv
+import io
+
+from .dinero import ESCALA_DINERO, ESCALA_TASA
+from .models import Transaction
+
+COLUMNAS_EXPORTACION = (
+    'id', 'fecha_hora', 'tipo', 'concepto', 'monto', 'tasa_cambio', 'comision', 'descuento_cheque',
+)
+FORMATOS_EXPORTACION = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+def lotes_exportacion(query, lote=5000, al_avanzar=None):
+    """
+    Itera listas de tuplas (en el orden de COLUMNAS_EXPORTACION) de a `lote` filas.
+    Se leen sólo las columnas exportadas, sin crear objetos del ORM.
+    `al_avanzar(filas leídas)` se llama con cada lote.
+    """
+    columnas = [getattr(Transaction, nombre) for nombre in COLUMNAS_EXPORTACION]
+    filas = (
+        query.with_entities(*columnas)
+        .order_by(None)
+        .order_by(Transaction.fecha_hora, Transaction.id)
+        .yield_per(lote)
+    )
+    actual, leidas = [], 0
+    for fila in filas:
+        actual.append(tuple(fila))
+        if len(actual) >= lote:
+            leidas += len(actual)
+            if al_avanzar:
+                al_avanzar(leidas)
+            yield actual
+            actual = []
+    if actual:
+        if al_avanzar:
+            al_avanzar(leidas + len(actual))
+        yield actual
+
+
+def exportar_csv(lotes):
+    """
+    Genera el CSV en bloques de texto, uno por lote.
+    """
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(COLUMNAS_EXPORTACION)
+    for filas in lotes:
+        escritor.writerows(filas)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+class _Tubo:
+    """
+    Archivo de sólo escritura que acumula bytes hasta que alguien los retira.
+    Permite emitir el Parquet por partes a medida que se escribe cada row group.
+    """
+
+    def __init__(self):
+        self.partes = []
+        self.posicion = 0
+        self.closed = False
+
+    def write(self, datos):
+        datos = bytes(datos)
+        self.partes.append(datos)
+        self.posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self.posicion
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def retirar(self):
+        datos = b''.join(self.partes)
+        self.partes = []
+        return datos
+
+
+def _esquema_parquet(pa):
+    return pa.schema([
+        ('id', pa.int64()),
+        ('fecha_hora', pa.timestamp('us')),
+        ('tipo', pa.dictionary(pa.int8(), pa.string())),
+        ('concepto', pa.string()),
+        ('monto', pa.decimal128(18, ESCALA_DINERO)),
+        ('tasa_cambio', pa.decimal128(18, ESCALA_TASA)),
+        ('comision', pa.decimal128(18, ESCALA_DINERO)),
+        ('descuento_cheque', pa.decimal128(18, ESCALA_DINERO)),
+    ])
+
+
+def exportar_parquet(lotes):
+    """
+    Genera un archivo Parquet en bloques de bytes, un row group por lote. Requiere pyarrow.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    esquema = _esquema_parquet(pa)
+    tubo = _Tubo()
+    escritor = pq.ParquetWriter(tubo, esquema, compression='zstd')
+    try:
+        for filas in lotes:
+            columnas = list(zip(*filas))
+            tabla = pa.Table.from_arrays(
+                [pa.array(valores, type=campo.type) for valores, campo in zip(columnas, esquema)],
+                schema=esquema,
+            )
+            escritor.write_table(tabla)
+            yield tubo.retirar()
+    finally:
+        escritor.close()
+    yield tubo.retirar()
+
+
+def exportar(query, formato, lote=5000, al_avanzar=None):
+    """
+    Devuelve un generador con el contenido exportado (str para CSV, bytes para Parquet).
+    """
+    lotes = lotes_exportacion(query, lote, al_avanzar)
+    if formato == 'csv':
+        return exportar_csv(lotes)
+    if formato == 'parquet':
+        return exportar_parquet(lotes)
+    raise ValueError(f"Formato de exportación desconocido: {formato}")
+
+
+def parquet_disponible():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
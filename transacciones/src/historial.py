@@ -0,0 +1,82 @@
+# historial.py
+import datetime
+
+from sqlalchemy import tuple_
+
+from .busqueda import filtro_concepto
+from .models import Transaction
+
+
+def filtrar_transacciones(args, caja_id=None):
+    """
+    Construye el query del historial a partir de los filtros de la request
+    (type, concept, start_date, end_date) y, si se indica, de la caja de la sucursal.
+    Devuelve (query, errores).
+    """
+    errores = []
+    tipo_filtro = args.get('type')
+    concepto_filtro = args.get('concept')
+    fecha_inicio_filtro = args.get('start_date')
+    fecha_fin_filtro = args.get('end_date')
+
+    query = Transaction.query
+    if caja_id is not None:
+        query = query.filter_by(caja_id=caja_id)
+    if tipo_filtro:
+        query = query.filter_by(tipo=tipo_filtro)
+    if concepto_filtro:
+        condicion = filtro_concepto(concepto_filtro)
+        if condicion is not None:
+            query = query.filter(condicion)
+    if fecha_inicio_filtro:
+        try:
+            fecha_inicio = datetime.datetime.strptime(fecha_inicio_filtro, '%Y-%m-%d')
+            query = query.filter(Transaction.fecha_hora >= fecha_inicio)
+        except ValueError:
+            errores.append("Formato de fecha de inicio inválido.")
+    if fecha_fin_filtro:
+        try:
+            fecha_fin = datetime.datetime.strptime(fecha_fin_filtro, '%Y-%m-%d') + datetime.timedelta(days=1)
+            query = query.filter(Transaction.fecha_hora < fecha_fin)
+        except ValueError:
+            errores.append("Formato de fecha de fin inválido.")
+
+    return query, errores
+
+
+def ordenar_recientes(query):
+    """
+    Orden estable del historial: más recientes primero, desempatando por id.
+    """
+    return query.order_by(Transaction.fecha_hora.desc(), Transaction.id.desc())
+
+
+def codificar_cursor(transaccion):
+    return f"{transaccion.fecha_hora.isoformat()}_{transaccion.id}"
+
+
+def decodificar_cursor(cursor):
+    """
+    Devuelve (fecha_hora, id) o None si el cursor no es válido.
+    """
+    try:
+        fecha, _, id_ = cursor.rpartition('_')
+        return datetime.datetime.fromisoformat(fecha), int(id_)
+    except (ValueError, AttributeError):
+        return None
+
+
+def obtener_pagina(query, cursor=None, por_pagina=100):
+    """
+    Paginación por cursor sobre (fecha_hora, id): cada página es un range scan acotado,
+    sin OFFSET, y su costo no depende de cuántas páginas haya antes.
+    Devuelve (transacciones, cursor_siguiente).
+    """
+    posicion = decodificar_cursor(cursor) if cursor else None
+    if posicion:
+        query = query.filter(tuple_(Transaction.fecha_hora, Transaction.id) < tuple_(*posicion))
+    transacciones = ordenar_recientes(query).limit(por_pagina + 1).all()
+    if len(transacciones) > por_pagina:
+        transacciones = transacciones[:por_pagina]
+        return transacciones, codificar_cursor(transacciones[-1])
+    return transacciones, None
@@ -0,0 +1,91 @@
+# impactos.py
+# Efecto de cada tipo de transacción sobre la caja.
+from decimal import Decimal
+
+from .dinero import a_entero, desde_entero, dividir_redondeando, ESCALA_TASA, ESCALA_FRACCION
+
+
+def _aplicar_fraccion(monto, fraccion):
+    """
+    monto (centavos) * fraccion (en unidades de 10^-ESCALA_FRACCION), redondeado a centavos.
+    """
+    return dividir_redondeando(monto * fraccion, 10 ** ESCALA_FRACCION)
+
+
+def _convertir(monto, tasa_cambio):
+    """
+    monto (centavos) * tasa (en unidades de 10^-ESCALA_TASA), redondeado a centavos.
+    """
+    return dividir_redondeando(monto * tasa_cambio, 10 ** ESCALA_TASA)
+
+
+def _a_decimales(*centavos):
+    return tuple(desde_entero(valor) for valor in centavos)
+
+
+# Tabla de impactos: lo que cada tipo mueve en la caja (pesos, dólares), en unidades mínimas, a
+# partir de los valores tal como se guardan en la transacción: monto, tasa de cambio y la comisión
+# y el descuento ya calculados como montos. El alta, la baja, la edición y la reproducción del
+# libro (ver reproduccion.py) usan esta misma tabla, así que revertir es siempre el opuesto exacto.
+# En cash_to_cash el signo de la comisión guardada indica el sentido: positiva si se paga.
+IMPACTOS = {
+    'compra_dolares': lambda monto, tasa, comision, descuento: (-_convertir(monto, tasa), monto),
+    'venta_dolares': lambda monto, tasa, comision, descuento: (_convertir(monto, tasa), -monto),
+    'cable_subida': lambda monto, tasa, comision, descuento: (0, monto + comision),  # Cliente entrega más dólares
+    'cable_bajada': lambda monto, tasa, comision, descuento: (0, -(monto - comision)),  # Cliente recibe menos dólares
+    'cash_to_cash': lambda monto, tasa, comision, descuento: (
+        (0, -(monto + comision)) if comision > 0 else (0, monto + comision)  # Pago o recibo comisión
+    ),
+    'descuento_cheque': lambda monto, tasa, comision, descuento: (-(monto - descuento), 0),  # Sale el neto
+}
+
+
+def impacto_en_caja(tipo, monto, tasa_cambio, comision=0, descuento_cheque=0):
+    """
+    (pesos, dolares) en unidades mínimas para valores ya en unidades mínimas. Los tipos sin
+    entrada en IMPACTOS (compra y venta de pesos) no mueven la caja.
+    """
+    impacto = IMPACTOS.get(tipo)
+    return impacto(monto, tasa_cambio, comision, descuento_cheque) if impacto else (0, 0)
+
+
+def calcular_impacto(tipo, monto, tasa_cambio, precio_compra=None, precio_venta=None, comision=0.0, descuento_cheque=0.0):
+    """
+    Impacto de una transacción en la caja: (pesos, dolares, comision, descuento) como Decimal.
+    `comision` es una fracción (0.01 para 1%) y `descuento_cheque` un porcentaje; se devuelven
+    como montos, que es como se guardan. Las cuentas se hacen en enteros (centavos) para que el
+    resultado sea exacto.
+    """
+    monto = a_entero(monto)
+    tasa_cambio = a_entero(tasa_cambio, ESCALA_TASA)
+    fraccion = a_entero(comision, ESCALA_FRACCION)
+    fraccion_descuento = a_entero(Decimal(descuento_cheque) / 100, ESCALA_FRACCION)
+
+    comision_monto = descuento_monto = 0
+    if tipo in ('cable_subida', 'cable_bajada'):
+        comision_monto = _aplicar_fraccion(monto, fraccion)
+    elif tipo == 'cash_to_cash':
+        comision_monto = _aplicar_fraccion(monto, abs(fraccion))
+        if fraccion > 0:
+            # Una comisión pagada no puede guardarse como cero: se leería como recibida
+            comision_monto = max(comision_monto, 1)
+        else:
+            comision_monto = -comision_monto
+    elif tipo == 'descuento_cheque':
+        descuento_monto = _aplicar_fraccion(monto, fraccion_descuento)
+
+    pesos, dolares = impacto_en_caja(tipo, monto, tasa_cambio, comision_monto, descuento_monto)
+    return _a_decimales(pesos, dolares, comision_monto, descuento_monto)
+
+
+def revertir_impacto(tipo, monto, tasa_cambio, comision=0, descuento_cheque=0):
+    """
+    Opuesto exacto del impacto de una transacción guardada: `comision` y `descuento_cheque` son
+    los montos guardados, no porcentajes. Devuelve (pesos, dolares, comision, descuento) como Decimal.
+    """
+    comision = a_entero(comision or 0)
+    descuento_cheque = a_entero(descuento_cheque or 0)
+    pesos, dolares = impacto_en_caja(
+        tipo, a_entero(monto), a_entero(tasa_cambio, ESCALA_TASA), comision, descuento_cheque
+    )
+    return _a_decimales(-pesos, -dolares, -comision, -descuento_cheque)
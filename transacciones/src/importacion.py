@@ -0,0 +1,219 @@
+# importacion.py
+# Importación masiva de transacciones desde CSV o JSON lines.
+import csv
+import datetime
+import json
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import insert
+
+from .costos import MONEDAS, actualizar_costos, posicion_previa
+from .escrituras import con_reintentos
+from .impactos import calcular_impacto
+from .libro_caja import caja_actual, saldo_caja, registrar_movimientos
+from .models import db, Transaction
+from .operaciones import TIPOS_VALIDOS, OperacionInvalida, validar_precio_costo
+from .resumenes import rango_afectado, reconstruir_resumen, unir_rangos
+
+TIPOS_CON_PRECIO_COMPRA = ('compra_dolares', 'compra_pesos')
+
+
+class ResultadoImportacion:
+    def __init__(self):
+        self.importadas = 0
+        self.errores = []  # (número de fila, mensaje)
+
+    def registrar_error(self, numero, mensaje):
+        self.errores.append((numero, mensaje))
+
+
+def leer_filas(flujo, formato):
+    """
+    Itera (número de fila, dict) sobre un flujo de texto sin cargarlo completo en memoria.
+    """
+    if formato == 'csv':
+        lector = csv.DictReader(flujo)
+        for numero, fila in enumerate(lector, start=2):  # La fila 1 es el encabezado
+            yield numero, fila
+    elif formato == 'jsonl':
+        for numero, linea in enumerate(flujo, start=1):
+            if not linea.strip():
+                continue
+            try:
+                fila = json.loads(linea)
+            except ValueError:
+                fila = None
+            yield numero, fila
+    else:
+        raise ValueError(f"Formato de importación desconocido: {formato}")
+
+
+def formato_desde_nombre(nombre):
+    """
+    Deduce el formato por la extensión del archivo. Devuelve None si no la reconoce.
+    """
+    extension = (nombre or '').rsplit('.', 1)[-1].lower()
+    if extension == 'csv':
+        return 'csv'
+    if extension in ('jsonl', 'ndjson', 'json'):
+        return 'jsonl'
+    return None
+
+
+def leer_fecha_hora(valor):
+    """
+    Fecha ISO 8601, con o sin hora. Una fecha con zona horaria se pasa a la hora local sin zona.
+    """
+    fecha_hora = datetime.datetime.fromisoformat(str(valor).strip())
+    if fecha_hora.tzinfo is not None:
+        # El libro guarda hora local sin zona
+        fecha_hora = fecha_hora.astimezone().replace(tzinfo=None)
+    return fecha_hora
+
+
+def _decimal(fila, campo, obligatorio=False):
+    valor = fila.get(campo)
+    if valor in (None, ''):
+        if obligatorio:
+            raise ValueError(f"Falta el campo '{campo}'.")
+        return Decimal(0)
+    try:
+        numero = Decimal(str(valor).strip())
+    except InvalidOperation:
+        raise ValueError(f"Valor numérico inválido en '{campo}': {valor!r}.")
+    if not numero.is_finite():  # Infinity, NaN o 1e999 en un JSON
+        raise ValueError(f"Valor numérico inválido en '{campo}': {valor!r}.")
+    return numero
+
+
+def preparar_fila(fila, ahora):
+    """
+    Valida una fila con las mismas reglas que el formulario de transacciones.
+    Devuelve (valores para insertar, pesos_delta, dolares_delta) o lanza ValueError.
+    """
+    if not isinstance(fila, dict):
+        raise ValueError("Fila ilegible.")
+    tipo = (fila.get('tipo') or '').strip()
+    if tipo not in TIPOS_VALIDOS:
+        raise ValueError(f"Tipo de transacción inválido: {tipo!r}.")
+    monto = _decimal(fila, 'monto', obligatorio=True)
+    if monto <= 0:
+        raise ValueError("El monto debe ser mayor a cero.")
+    comision = _decimal(fila, 'comision') / 100
+    descuento_cheque = _decimal(fila, 'descuento_cheque')
+    precio_compra = _decimal(fila, 'precio_compra')
+    precio_venta = _decimal(fila, 'precio_venta')
+
+    fecha_hora = fila.get('fecha_hora')
+    if fecha_hora:
+        try:
+            fecha_hora = leer_fecha_hora(fecha_hora)
+        except ValueError:
+            raise ValueError(f"Fecha inválida: {fecha_hora!r}.")
+    else:
+        fecha_hora = ahora
+
+    tasa_cambio = precio_compra if tipo in TIPOS_CON_PRECIO_COMPRA else precio_venta
+    pesos_delta, dolares_delta, comision_calculada, descuento_aplicado = calcular_impacto(
+        tipo, monto, tasa_cambio, precio_compra, precio_venta, comision, descuento_cheque
+    )
+    valores = {
+        'tipo': tipo,
+        'monto': monto,
+        'concepto': (fila.get('concepto') or '').strip(),
+        'fecha_hora': fecha_hora,
+        'tasa_cambio': tasa_cambio,
+        'comision': comision_calculada,
+        'descuento_cheque': descuento_aplicado,
+        'precio_compra': precio_compra if precio_compra > 0 else None,  # Costo manual para ventas sin compras
+    }
+    return valores, pesos_delta, dolares_delta
+
+
+def _guardar_lote(caja, pendientes, resultado):
+    """
+    Guarda un lote de filas ya validadas. Los fondos y el precio de costo de las ventas se controlan
+    contra el saldo y la posición leídos bajo el lock de escritura, avanzando fila por fila, así otro
+    worker no puede gastar el mismo saldo entre el control y el insert. Los costos y el resumen
+    diario se actualizan en la misma transacción que el lote, como en el alta individual.
+    """
+    def guardar():
+        saldo_pesos, saldo_dolares = saldo_caja(caja)
+        hay_compras = {
+            moneda: posicion_previa(caja.id, moneda).costo_promedio is not None for moneda in set(MONEDAS.values())
+        }
+        valores, deltas, rechazadas = [], [], []
+        for numero, valores_fila, pesos_delta, dolares_delta in pendientes:
+            tipo = valores_fila['tipo']
+            moneda = MONEDAS.get(tipo)
+            try:
+                validar_precio_costo(caja.id, tipo, valores_fila['precio_compra'], hay_compras.get(moneda))
+            except OperacionInvalida as e:
+                rechazadas.append((numero, str(e)))
+                continue
+            if saldo_pesos + pesos_delta < 0 or saldo_dolares + dolares_delta < 0:
+                rechazadas.append((numero, "Fondos insuficientes en la caja."))
+                continue
+            saldo_pesos += pesos_delta
+            saldo_dolares += dolares_delta
+            if tipo in TIPOS_CON_PRECIO_COMPRA:
+                hay_compras[moneda] = True
+            valores.append(dict(valores_fila, caja_id=caja.id))
+            deltas.append((pesos_delta, dolares_delta))
+        if valores:
+            # Un solo insert por lote; los ids vuelven en el orden de las filas para asociar cada movimiento
+            ids = db.session.execute(
+                insert(Transaction).returning(Transaction.id, sort_by_parameter_order=True), valores
+            ).scalars().all()
+            registrar_movimientos(
+                caja, [(id_, pesos, dolares) for id_, (pesos, dolares) in zip(ids, deltas)], 'alta'
+            )
+            operaciones = [(caja.id, fila['tipo'], fila['fecha_hora'], id_) for fila, id_ in zip(valores, ids)]
+            actualizar_costos(*operaciones)
+            reconstruir_resumen(*unir_rangos(*(rango_afectado(tipo, fecha) for _, tipo, fecha, _ in operaciones)))
+        db.session.commit()
+        return len(valores), rechazadas
+
+    importadas, rechazadas = con_reintentos(guardar)
+    for numero, mensaje in rechazadas:
+        resultado.registrar_error(numero, mensaje)
+    resultado.importadas += importadas
+
+
+def importar_transacciones(flujo, formato, lote=1000, al_avanzar=None):
+    """
+    Importa las filas válidas en lotes de `lote`. Cada lote se guarda en su propia transacción
+    junto con un movimiento de caja por transacción, sus costos y el resumen diario; las filas
+    inválidas, sin fondos o sin precio de costo se informan y se saltean.
+    `al_avanzar(filas leídas)` se llama después de cada lote.
+    """
+    resultado = ResultadoImportacion()
+    caja = caja_actual()
+    if not caja:
+        raise ValueError("Primero debes configurar la caja inicial.")
+
+    ahora = datetime.datetime.now()
+    pendientes = []
+    leidas = 0
+
+    for numero, fila in leer_filas(flujo, formato):
+        leidas += 1
+        try:
+            valores_fila, pesos_delta, dolares_delta = preparar_fila(fila, ahora)
+        except (ValueError, InvalidOperation) as e:
+            resultado.registrar_error(numero, str(e))
+            continue
+
+        pendientes.append((numero, valores_fila, pesos_delta, dolares_delta))
+        if len(pendientes) >= lote:
+            _guardar_lote(caja, pendientes, resultado)
+            pendientes = []
+            if al_avanzar:
+                al_avanzar(leidas)
+
+    if pendientes:
+        _guardar_lote(caja, pendientes, resultado)
+    if al_avanzar:
+        al_avanzar(leidas)
+    resultado.errores.sort()
+    return resultado
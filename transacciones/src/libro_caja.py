@@ -0,0 +1,179 @@
+# libro_caja.py
+# Saldo de la caja como libro de movimientos con snapshots periódicos.
+import datetime
+from collections import namedtuple
+from decimal import Decimal
+
+from flask import g, has_app_context
+from sqlalchemy import func, insert, select
+
+from .models import db, Caja, MovimientoCaja, SnapshotCaja
+
+Saldo = namedtuple('Saldo', 'pesos dolares')
+
+SNAPSHOT_CADA = 1000  # Movimientos entre snapshots
+
+
+def caja_actual():
+    """
+    Caja de la sucursal elegida para la request (ver sucursales.py) o, si no se eligió, la última creada.
+    """
+    caja_id = g.get('caja_id') if has_app_context() else None
+    if caja_id is not None:
+        return db.session.get(Caja, caja_id)
+    return Caja.query.order_by(Caja.id.desc()).first()
+
+
+def caja_de(transaccion):
+    """
+    Caja de la sucursal que registró la transacción; sus reversiones van a esa misma caja.
+    """
+    if transaccion.caja_id is not None:
+        return db.session.get(Caja, transaccion.caja_id)
+    return caja_actual()
+
+
+def ultimo_snapshot(caja_id):
+    return (
+        SnapshotCaja.query.filter_by(caja_id=caja_id)
+        .order_by(SnapshotCaja.movimiento_id.desc())
+        .first()
+    )
+
+
+def _sumar_movimientos(caja_id, desde_id=0, hasta_id=None):
+    """
+    Suma de los movimientos de la caja con desde_id < id <= hasta_id.
+    Devuelve (pesos, dolares, cantidad, último id).
+    """
+    m = MovimientoCaja.__table__.c
+    consulta = select(
+        func.coalesce(func.sum(m.pesos), 0), func.coalesce(func.sum(m.dolares), 0),
+        func.count(), func.max(m.id),
+    ).where(m.caja_id == caja_id, m.id > desde_id)
+    if hasta_id is not None:
+        consulta = consulta.where(m.id <= hasta_id)
+    pesos, dolares, cantidad, ultimo = db.session.execute(consulta).one()
+    return Decimal(pesos), Decimal(dolares), cantidad, ultimo
+
+
+def saldo_caja(caja):
+    """
+    Saldo actual: último snapshot más los movimientos posteriores (O(movimientos desde el snapshot)).
+    """
+    snapshot = ultimo_snapshot(caja.id)
+    base_pesos, base_dolares, desde_id = (
+        (snapshot.pesos, snapshot.dolares, snapshot.movimiento_id) if snapshot else (Decimal(0), Decimal(0), 0)
+    )
+    pesos, dolares, _, _ = _sumar_movimientos(caja.id, desde_id)
+    return Saldo(base_pesos + pesos, base_dolares + dolares)
+
+
+def saldo_actual():
+    """
+    Saldo de la caja actual, o None si todavía no se configuró.
+    """
+    caja = caja_actual()
+    return saldo_caja(caja) if caja else None
+
+
+def tomar_snapshot(caja):
+    """
+    Guarda el saldo acumulado hasta el último movimiento. No hace commit.
+    """
+    snapshot = ultimo_snapshot(caja.id)
+    base_pesos, base_dolares, desde_id = (
+        (snapshot.pesos, snapshot.dolares, snapshot.movimiento_id) if snapshot else (Decimal(0), Decimal(0), 0)
+    )
+    pesos, dolares, cantidad, ultimo = _sumar_movimientos(caja.id, desde_id)
+    if not cantidad:
+        return snapshot
+    nuevo = SnapshotCaja(
+        caja_id=caja.id, movimiento_id=ultimo,
+        pesos=base_pesos + pesos, dolares=base_dolares + dolares,
+        fecha_hora=datetime.datetime.now(),
+    )
+    db.session.add(nuevo)
+    return nuevo
+
+
+def registrar_movimiento(caja, pesos, dolares, motivo, transaction_id=None):
+    """
+    Agrega un movimiento a la caja y, cada SNAPSHOT_CADA movimientos, un snapshot. No hace commit.
+    """
+    movimiento = MovimientoCaja(
+        caja_id=caja.id, transaction_id=transaction_id, motivo=motivo,
+        pesos=pesos, dolares=dolares, fecha_hora=datetime.datetime.now(),
+    )
+    db.session.add(movimiento)
+    db.session.flush()
+    snapshot = ultimo_snapshot(caja.id)
+    if movimiento.id - (snapshot.movimiento_id if snapshot else 0) >= SNAPSHOT_CADA:
+        tomar_snapshot(caja)
+    return movimiento
+
+
+def registrar_movimientos(caja, movimientos, motivo):
+    """
+    Versión masiva de registrar_movimiento: `movimientos` es una lista de
+    (transaction_id, pesos, dolares). Se insertan con un único executemany. No hace commit.
+    """
+    ahora = datetime.datetime.now()
+    db.session.execute(insert(MovimientoCaja), [
+        {'caja_id': caja.id, 'transaction_id': transaction_id, 'motivo': motivo,
+         'pesos': pesos, 'dolares': dolares, 'fecha_hora': ahora}
+        for transaction_id, pesos, dolares in movimientos
+    ])
+    tomar_snapshot(caja)
+
+
+def crear_caja(pesos, dolares, nombre=None, caja_id=None):
+    """
+    Crea una caja con sus fondos iniciales. `caja_id` fija el id (el del catálogo cuando la
+    sucursal tiene su propia base). No hace commit.
+    """
+    caja = Caja(id=caja_id, nombre=nombre, fecha_hora=datetime.datetime.now())
+    db.session.add(caja)
+    db.session.flush()
+    registrar_movimiento(caja, pesos, dolares, 'fondos')
+    return caja
+
+
+def verificar_saldos():
+    """
+    Recalcula en bloque la suma de todos los movimientos de cada caja y la compara con
+    cada snapshot y con el saldo actual. Devuelve una lista de diferencias encontradas.
+    """
+    diferencias = []
+    movimientos, snapshots = MovimientoCaja.__table__, SnapshotCaja.__table__
+    m, s = movimientos.c, snapshots.c
+
+    # Suma acumulada de movimientos hasta cada snapshot, en una sola consulta
+    acumulado = (
+        select(
+            s.id, s.caja_id, s.movimiento_id, s.pesos, s.dolares,
+            func.coalesce(func.sum(m.pesos), 0).label('esperado_pesos'),
+            func.coalesce(func.sum(m.dolares), 0).label('esperado_dolares'),
+        )
+        .select_from(snapshots.outerjoin(movimientos, (m.caja_id == s.caja_id) & (m.id <= s.movimiento_id)))
+        .group_by(s.id)
+    )
+    for fila in db.session.execute(acumulado):
+        esperado = (Decimal(fila.esperado_pesos), Decimal(fila.esperado_dolares))
+        if (fila.pesos, fila.dolares) != esperado:
+            diferencias.append(
+                f"Snapshot {fila.id} (caja {fila.caja_id}, movimiento {fila.movimiento_id}): "
+                f"guardado {fila.pesos}/{fila.dolares}, recalculado {esperado[0]}/{esperado[1]}"
+            )
+
+    totales = db.session.execute(
+        select(m.caja_id, func.sum(m.pesos), func.sum(m.dolares)).group_by(m.caja_id)
+    ).all()
+    for caja_id, pesos, dolares in totales:
+        saldo = saldo_caja(db.session.get(Caja, caja_id))
+        if (saldo.pesos, saldo.dolares) != (Decimal(pesos), Decimal(dolares)):
+            diferencias.append(
+                f"Caja {caja_id}: saldo {saldo.pesos}/{saldo.dolares}, "
+                f"suma de movimientos {pesos}/{dolares}"
+            )
+    return diferencias
@@ -0,0 +1,318 @@
+# metricas.py
+"""
+Instrumentación de requests: duración por vista, cantidad y duración de consultas SQL por request,
+latencia de la cotización externa y log de consultas lentas.
+
+Cada proceso acumula sus métricas en memoria y un hilo las vuelca cada METRICAS_INTERVALO segundos
+a un archivo propio en METRICAS_DIR; /metrics suma los archivos de todos los workers de gunicorn
+y responde en el formato de texto de Prometheus.
+"""
+import bisect
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+from flask import Blueprint, current_app, g, has_request_context, request, Response
+from sqlalchemy import event
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 500, 1000)
+
+DESCRIPCIONES = {
+    'transacciones_request_segundos': ('histogram', "Duración de las requests por vista."),
+    'transacciones_request_consultas_sql': ('histogram', "Consultas SQL ejecutadas por request."),
+    'transacciones_sql_segundos_total': ('counter', "Tiempo total en consultas SQL por vista."),
+    'transacciones_sql_lentas_total': ('counter', "Consultas SQL que superaron el umbral de lentitud."),
+    'transacciones_cotizacion_segundos': ('histogram', "Duración de las consultas al proveedor de cotización."),
+    'transacciones_cache_vistas_total': ('counter', "Lecturas de la cache de vistas por resultado."),
+}
+
+log = logging.getLogger(__name__)
+log_sql_lentas = logging.getLogger('transacciones.sql_lentas')
+
+metricas = Blueprint('metricas', __name__)
+
+
+class Registro:
+    """
+    Contadores e histogramas de un proceso. Las claves son (nombre, etiquetas ordenadas).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.contadores = {}
+        self.histogramas = {}
+        self.version = 0  # Cambia con cada observación; el volcado sólo escribe si cambió
+
+    def sumar(self, nombre, valor=1, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            self.contadores[clave] = self.contadores.get(clave, 0) + valor
+            self.version += 1
+
+    def observar(self, nombre, valor, buckets=BUCKETS_SEGUNDOS, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            histograma = self.histogramas.get(clave)
+            if histograma is None:
+                # Un contador por bucket más uno para +Inf
+                histograma = self.histogramas[clave] = {
+                    'buckets': list(buckets), 'cuentas': [0] * (len(buckets) + 1), 'suma': 0,
+                }
+            histograma['cuentas'][bisect.bisect_left(histograma['buckets'], valor)] += 1
+            histograma['suma'] += valor
+            self.version += 1
+
+    def a_json(self):
+        with self._lock:
+            return {
+                'contadores': [[nombre, etiquetas, valor] for (nombre, etiquetas), valor in self.contadores.items()],
+                'histogramas': [[nombre, etiquetas, h] for (nombre, etiquetas), h in self.histogramas.items()],
+            }
+
+
+registro = Registro()
+
+
+class Volcado:
+    """
+    Archivo de métricas de este proceso, reescrito por un hilo cada `intervalo` segundos si hubo cambios.
+    El nombre lleva el pid y el momento de arranque para que un worker nuevo no pise el archivo
+    de uno anterior con el mismo pid.
+    """
+
+    def __init__(self, directorio, intervalo):
+        self.directorio = directorio
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._pid = None
+        self._ruta = None
+
+    def volcar(self):
+        with self._lock:
+            temporal = f"{self._ruta}.tmp"
+            with open(temporal, 'w') as archivo:
+                json.dump(registro.a_json(), archivo)
+            os.replace(temporal, self._ruta)
+
+    def iniciar(self):
+        # Un hilo por proceso: tras el fork de gunicorn el hilo del padre no existe.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._ruta = os.path.join(self.directorio, f"{self._pid}-{int(time.time() * 1000)}.json")
+            threading.Thread(target=self._bucle, name='volcado-metricas', daemon=True).start()
+
+    def _bucle(self):
+        volcada = None
+        while True:
+            time.sleep(self.intervalo)
+            if registro.version != volcada:
+                volcada = registro.version
+                try:
+                    self.volcar()
+                except OSError:
+                    log.exception("Error al volcar las métricas")
+
+    def limpiar_procesos_terminados(self):
+        """
+        Borra los archivos de procesos que ya no existen. Se llama al crear la app: los contadores
+        se reinician con cada deploy, pero no cuando gunicorn recicla un worker.
+        """
+        for pid, ruta in volcados(self.directorio):
+            if pid == os.getpid():
+                continue
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                os.remove(ruta)
+            except PermissionError:
+                pass
+
+
+def volcados(directorio):
+    """
+    (pid, ruta) de los archivos de métricas de `directorio`. Se ignoran los que no tienen el nombre
+    de un volcado (<pid>-<arranque>.json), así un archivo ajeno no impide arrancar ni leer /metrics.
+    """
+    for ruta in glob.glob(os.path.join(directorio, '*.json')):
+        try:
+            pid = int(os.path.basename(ruta).split('-', 1)[0])
+        except ValueError:
+            continue
+        yield pid, ruta
+
+
+def agregar_archivos(directorio):
+    """
+    Suma las métricas de todos los volcados de `directorio`.
+    """
+    contadores, histogramas = {}, {}
+    for _, ruta in volcados(directorio):
+        try:
+            with open(ruta) as archivo:
+                datos = json.load(archivo)
+        except (OSError, ValueError):
+            continue  # Un worker terminó entre el glob y la lectura
+        for nombre, etiquetas, valor in datos['contadores']:
+            clave = (nombre, tuple(map(tuple, etiquetas)))
+            contadores[clave] = contadores.get(clave, 0) + valor
+        for nombre, etiquetas, h in datos['histogramas']:
+            clave = (nombre, tuple(map(tuple, etiquetas)))
+            if clave not in histogramas:
+                histogramas[clave] = {'buckets': h['buckets'], 'cuentas': list(h['cuentas']), 'suma': h['suma']}
+            else:
+                acumulado = histogramas[clave]
+                acumulado['cuentas'] = [a + b for a, b in zip(acumulado['cuentas'], h['cuentas'])]
+                acumulado['suma'] += h['suma']
+    return contadores, histogramas
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(pares):
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in pares) + '}'
+
+
+def formato_prometheus(contadores, histogramas):
+    lineas, descritas = [], set()
+
+    def describir(nombre):
+        if nombre not in descritas:
+            descritas.add(nombre)
+            tipo, ayuda = DESCRIPCIONES.get(nombre, ('untyped', nombre))
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} {tipo}")
+
+    for (nombre, etiquetas), valor in sorted(contadores.items()):
+        describir(nombre)
+        lineas.append(f"{nombre}{_etiquetas(etiquetas)} {valor}")
+    for (nombre, etiquetas), h in sorted(histogramas.items(), key=lambda item: item[0]):
+        describir(nombre)
+        acumulado = 0
+        for limite, cuenta in zip([*h['buckets'], '+Inf'], h['cuentas']):
+            acumulado += cuenta
+            lineas.append(f"{nombre}_bucket{_etiquetas((*etiquetas, ('le', limite)))} {acumulado}")
+        lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {h['suma']}")
+        lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {acumulado}")
+    return '\n'.join(lineas) + '\n'
+
+
+def _vista():
+    return request.endpoint or 'sin_ruta'
+
+
+def _inicio_request():
+    g.metricas_inicio = time.perf_counter()
+    g.sql_consultas = 0
+    g.sql_segundos = 0.0
+
+
+def _fin_request(respuesta):
+    # En las respuestas en streaming (historial con stream=1, exportación) mide hasta el primer byte
+    inicio = g.pop('metricas_inicio', None)
+    if inicio is None:
+        return respuesta
+    duracion = time.perf_counter() - inicio
+    vista = _vista()
+    registro.observar('transacciones_request_segundos', duracion,
+                      vista=vista, metodo=request.method, estado=respuesta.status_code)
+    registro.observar('transacciones_request_consultas_sql', g.sql_consultas, BUCKETS_CONSULTAS, vista=vista)
+    registro.sumar('transacciones_sql_segundos_total', g.sql_segundos, vista=vista)
+    respuesta.headers['Server-Timing'] = (
+        f'app;dur={duracion * 1000:.1f}, sql;dur={g.sql_segundos * 1000:.1f};desc="{g.sql_consultas} consultas"'
+    )
+    current_app.extensions['metricas'].iniciar()
+    return respuesta
+
+
+def _instrumentar_sql(engine, umbral, con_parametros=False):
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _antes(_conexion, _cursor, _sentencia, _parametros, contexto, _executemany):
+        contexto._metricas_inicio = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _despues(_conexion, _cursor, sentencia, parametros, contexto, executemany):
+        duracion = time.perf_counter() - contexto._metricas_inicio
+        vista = None
+        if has_request_context() and 'sql_consultas' in g:
+            g.sql_consultas += 1
+            g.sql_segundos += duracion
+            vista = _vista()
+        if duracion >= umbral:
+            registro.sumar('transacciones_sql_lentas_total', vista=vista or 'fuera_de_request')
+            # Los parámetros llevan montos y conceptos: sólo se escriben con METRICAS_SQL_LENTA_PARAMETROS
+            detalle = ''
+            if con_parametros:
+                detalle = ' (executemany)' if executemany else f' {parametros}'
+            log_sql_lentas.warning(
+                "%.1f ms en %s: %s%s", duracion * 1000, vista or 'fuera_de_request',
+                ' '.join(sentencia.split()), detalle,
+            )
+
+
+def instrumentar_engine(app, engine):
+    """
+    Instrumenta un engine adicional (la base de cada sucursal, ver sucursales.py).
+    """
+    if app.config['METRICAS_HABILITADAS']:
+        _instrumentar_sql(engine, app.config['METRICAS_SQL_LENTA_MS'] / 1000, app.config['METRICAS_SQL_LENTA_PARAMETROS'])
+
+
+def medir_cotizacion(proveedor, obtener):
+    """
+    Ejecuta `obtener()` registrando su duración con el resultado (ok/error).
+    """
+    inicio = time.perf_counter()
+    cotizacion = None
+    try:
+        cotizacion = obtener()
+        return cotizacion
+    finally:
+        registro.observar('transacciones_cotizacion_segundos', time.perf_counter() - inicio,
+                          proveedor=proveedor, resultado='ok' if cotizacion else 'error')
+
+
+@metricas.route('/metrics')
+def exponer_metricas():
+    token = current_app.config.get('METRICAS_TOKEN')
+    if not token and not current_app.config['METRICAS_PUBLICAS']:
+        return Response("Defina METRICAS_TOKEN para consultar las métricas.\n", status=403, mimetype='text/plain')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response("No autorizado.\n", status=401, mimetype='text/plain')
+    volcado = current_app.extensions['metricas']
+    volcado.iniciar()
+    volcado.volcar()  # Lo de este worker, al día
+    return Response(formato_prometheus(*agregar_archivos(volcado.directorio)),
+                    mimetype='text/plain; version=0.0.4')
+
+
+def configurar_metricas(app, engine):
+    """
+    Registra los hooks de timing, los eventos de SQL y la ruta /metrics.
+    """
+    if not app.config['METRICAS_HABILITADAS']:
+        return
+    os.makedirs(app.config['METRICAS_DIR'], exist_ok=True)
+    volcado = Volcado(app.config['METRICAS_DIR'], app.config['METRICAS_INTERVALO'])
+    volcado.limpiar_procesos_terminados()
+    app.extensions['metricas'] = volcado
+
+    if app.config.get('METRICAS_SQL_LENTA_LOG'):
+        manejador = logging.FileHandler(app.config['METRICAS_SQL_LENTA_LOG'])
+        manejador.setFormatter(logging.Formatter('%(asctime)s [%(process)d] %(message)s'))
+        log_sql_lentas.addHandler(manejador)
+    _instrumentar_sql(engine, app.config['METRICAS_SQL_LENTA_MS'] / 1000, app.config['METRICAS_SQL_LENTA_PARAMETROS'])
+    app.before_request(_inicio_request)
+    app.after_request(_fin_request)
+    app.register_blueprint(metricas)
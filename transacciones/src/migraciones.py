@@ -0,0 +1,474 @@
+# migraciones.py
+# Migraciones versionadas del esquema SQLite. La versión aplicada se guarda en PRAGMA user_version.
+# Cada migración usa SQL explícito del esquema de su versión, no los modelos actuales. Los datos
+# derivados (costos, resumen, cierres) que una migración deja desactualizados se recalculan al
+# final, con el código actual y ya en la última versión: la migración sólo los declara en `reconstruir`.
+from sqlalchemy import inspect
+
+from .busqueda import crear_indice_texto
+from .cache_vistas import crear_version_libro
+from .cierres import recalcular_cierres
+from .costos import recalcular_costos_desde
+from .models import db
+from .resumenes import reconstruir_resumen
+
+MIGRACIONES = []
+
+# Recálculos que puede pedir una migración, en el orden en que se aplican (el resumen y los
+# cierres usan los costos)
+RECONSTRUCCIONES = {
+    'costos': lambda conexion: recalcular_costos_desde(conexion=conexion),
+    'resumen': lambda conexion: reconstruir_resumen(conexion=conexion),
+    'cierres': lambda conexion: recalcular_cierres(conexion=conexion),
+}
+
+
+def migracion(version, descripcion, reconstruir=()):
+    """
+    Registra una función como la migración `version`. Recibe una conexión dentro de una transacción.
+    `reconstruir` nombra los recálculos de RECONSTRUCCIONES que hacen falta después de aplicarla.
+    """
+    def registrar(funcion):
+        MIGRACIONES.append((version, descripcion, funcion, frozenset(reconstruir)))
+        MIGRACIONES.sort(key=lambda m: m[0])
+        return funcion
+    return registrar
+
+
+def version_actual(conexion):
+    return conexion.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def ultima_version():
+    return MIGRACIONES[-1][0] if MIGRACIONES else 0
+
+
+def _fijar_version(conexion, version):
+    conexion.exec_driver_sql(f"PRAGMA user_version = {int(version)}")
+
+
+def aplicar_migraciones(engine=None):
+    """
+    Lleva la base a la última versión. Una base vacía se crea directamente con los modelos.
+    Los recálculos pedidos por las migraciones aplicadas corren una vez al final, en la misma
+    transacción. Devuelve la lista de versiones aplicadas.
+    """
+    engine = engine or db.engine
+    aplicadas = []
+    pendientes = set()
+    with engine.begin() as conexion:
+        version = version_actual(conexion)
+        if version == 0 and not inspect(conexion).has_table('transaction'):
+            db.metadata.create_all(conexion)
+            _fijar_version(conexion, ultima_version())
+            return aplicadas
+
+        for numero, descripcion, funcion, reconstruir in MIGRACIONES:
+            if numero <= version:
+                continue
+            funcion(conexion)
+            _fijar_version(conexion, numero)
+            aplicadas.append((numero, descripcion))
+            pendientes |= reconstruir
+
+        for nombre, reconstruccion in RECONSTRUCCIONES.items():
+            if nombre in pendientes:
+                reconstruccion(conexion)
+    return aplicadas
+
+
+@migracion(1, "Tabla resumen_diario")
+def _resumen_diario(conexion):
+    conexion.exec_driver_sql(
+        "CREATE TABLE IF NOT EXISTS resumen_diario ("
+        " id INTEGER NOT NULL PRIMARY KEY,"
+        " fecha DATE NOT NULL,"
+        " tipo VARCHAR(20) NOT NULL,"
+        " cantidad INTEGER NOT NULL,"
+        " volumen FLOAT NOT NULL,"
+        " volumen_usd FLOAT NOT NULL,"
+        " comisiones FLOAT NOT NULL,"
+        " descuentos FLOAT NOT NULL,"
+        " ganancias FLOAT NOT NULL,"
+        " perdidas FLOAT NOT NULL,"
+        " CONSTRAINT uq_resumen_diario_fecha_tipo UNIQUE (fecha, tipo))"
+    )
+
+
+@migracion(2, "Índices de transaction por tipo y fecha")
+def _indices_transaction(conexion):
+    conexion.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_transaction_tipo_fecha_hora ON "transaction" (tipo, fecha_hora)'
+    )
+    conexion.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_transaction_fecha_hora ON "transaction" (fecha_hora)'
+    )
+
+
+@migracion(3, "Índice de texto completo sobre concepto")
+def _indice_texto_concepto(conexion):
+    crear_indice_texto(conexion)
+
+
+def _reconstruir_tabla(conexion, tabla, columnas, conversiones):
+    """
+    Recrea `tabla` con las definiciones `columnas` copiando los datos con `conversiones`
+    (expresiones SQL por columna). SQLite no permite cambiar el tipo de una columna con ALTER.
+    """
+    nueva = f"{tabla}_nueva"
+    conexion.exec_driver_sql(f'CREATE TABLE {nueva} ({", ".join(columnas)})')
+    nombres = ", ".join(conversiones)
+    valores = ", ".join(conversiones.values())
+    conexion.exec_driver_sql(f'INSERT INTO {nueva} ({nombres}) SELECT {valores} FROM "{tabla}"')
+    conexion.exec_driver_sql(f'DROP TABLE "{tabla}"')
+    conexion.exec_driver_sql(f'ALTER TABLE {nueva} RENAME TO "{tabla}"')
+
+
+def _a_unidades(columna, escala):
+    return f"CAST(ROUND({columna} * {10 ** escala}) AS INTEGER)"
+
+
+@migracion(4, "Montos en punto fijo (enteros en unidades mínimas)")
+def _montos_punto_fijo(conexion):
+    _reconstruir_tabla(conexion, 'caja', (
+        "id INTEGER NOT NULL PRIMARY KEY",
+        "pesos INTEGER NOT NULL",
+        "dolares INTEGER NOT NULL",
+        "fecha_hora DATETIME NOT NULL",
+    ), {
+        'id': 'id',
+        'pesos': _a_unidades('pesos', 2),
+        'dolares': _a_unidades('dolares', 2),
+        'fecha_hora': 'fecha_hora',
+    })
+
+    _reconstruir_tabla(conexion, 'transaction', (
+        "id INTEGER NOT NULL PRIMARY KEY",
+        "tipo VARCHAR(10) NOT NULL",
+        "monto INTEGER NOT NULL",
+        "concepto VARCHAR(255)",
+        "fecha_hora DATETIME NOT NULL",
+        "tasa_cambio INTEGER NOT NULL",
+        "comision INTEGER",
+        "descuento_cheque INTEGER",
+        "precio_compra INTEGER",
+        "precio_venta INTEGER",
+    ), {
+        'id': 'id',
+        'tipo': 'tipo',
+        'monto': _a_unidades('monto', 2),
+        'concepto': 'concepto',
+        'fecha_hora': 'fecha_hora',
+        'tasa_cambio': _a_unidades('tasa_cambio', 4),
+        'comision': _a_unidades('comision', 2),
+        'descuento_cheque': _a_unidades('descuento_cheque', 2),
+        'precio_compra': _a_unidades('precio_compra', 4),
+        'precio_venta': _a_unidades('precio_venta', 4),
+    })
+    # Al borrar la tabla original se pierden sus índices y los triggers del índice de texto
+    _indices_transaction(conexion)
+    crear_indice_texto(conexion)
+
+    montos_resumen = ('volumen', 'volumen_usd', 'comisiones', 'descuentos', 'ganancias', 'perdidas')
+    _reconstruir_tabla(conexion, 'resumen_diario', (
+        "id INTEGER NOT NULL PRIMARY KEY",
+        "fecha DATE NOT NULL",
+        "tipo VARCHAR(20) NOT NULL",
+        "cantidad INTEGER NOT NULL",
+        *(f"{columna} INTEGER NOT NULL" for columna in montos_resumen),
+        "CONSTRAINT uq_resumen_diario_fecha_tipo UNIQUE (fecha, tipo)",
+    ), {
+        'id': 'id', 'fecha': 'fecha', 'tipo': 'tipo', 'cantidad': 'cantidad',
+        **{columna: _a_unidades(columna, 2) for columna in montos_resumen},
+    })
+
+
+@migracion(5, "Libro de movimientos de caja con snapshots")
+def _libro_caja(conexion):
+    conexion.exec_driver_sql(
+        "CREATE TABLE movimiento_caja ("
+        " id INTEGER NOT NULL PRIMARY KEY,"
+        " caja_id INTEGER NOT NULL REFERENCES caja (id),"
+        " transaction_id INTEGER,"
+        " motivo VARCHAR(20) NOT NULL,"
+        " pesos INTEGER NOT NULL,"
+        " dolares INTEGER NOT NULL,"
+        " fecha_hora DATETIME NOT NULL)"
+    )
+    conexion.exec_driver_sql("CREATE INDEX ix_movimiento_caja_caja_id ON movimiento_caja (caja_id, id)")
+    conexion.exec_driver_sql(
+        "CREATE TABLE snapshot_caja ("
+        " id INTEGER NOT NULL PRIMARY KEY,"
+        " caja_id INTEGER NOT NULL REFERENCES caja (id),"
+        " movimiento_id INTEGER NOT NULL,"
+        " pesos INTEGER NOT NULL,"
+        " dolares INTEGER NOT NULL,"
+        " fecha_hora DATETIME NOT NULL)"
+    )
+    conexion.exec_driver_sql(
+        "CREATE INDEX ix_snapshot_caja_caja_id ON snapshot_caja (caja_id, movimiento_id)"
+    )
+
+    # El saldo guardado en cada caja pasa a ser su movimiento inicial y su primer snapshot
+    conexion.exec_driver_sql(
+        "INSERT INTO movimiento_caja (caja_id, transaction_id, motivo, pesos, dolares, fecha_hora)"
+        " SELECT id, NULL, 'saldo_inicial', pesos, dolares, fecha_hora FROM caja ORDER BY id"
+    )
+    conexion.exec_driver_sql(
+        "INSERT INTO snapshot_caja (caja_id, movimiento_id, pesos, dolares, fecha_hora)"
+        " SELECT caja_id, id, pesos, dolares, fecha_hora FROM movimiento_caja"
+    )
+    _reconstruir_tabla(conexion, 'caja', (
+        "id INTEGER NOT NULL PRIMARY KEY",
+        "fecha_hora DATETIME NOT NULL",
+    ), {'id': 'id', 'fecha_hora': 'fecha_hora'})
+
+
+@migracion(6, "Costo promedio ponderado y resultado precalculado por venta", reconstruir=('costos', 'resumen'))
+def _costo_promedio(conexion):
+    conexion.exec_driver_sql(
+        "CREATE TABLE costo_transaccion ("
+        " transaction_id INTEGER NOT NULL PRIMARY KEY,"
+        " moneda VARCHAR(10) NOT NULL,"
+        " fecha_hora DATETIME NOT NULL,"
+        " cantidad INTEGER NOT NULL,"
+        " costo_promedio INTEGER,"
+        " precio_costo INTEGER,"
+        " resultado INTEGER)"
+    )
+    conexion.exec_driver_sql(
+        "CREATE INDEX ix_costo_transaccion_moneda_fecha_hora"
+        " ON costo_transaccion (moneda, fecha_hora, transaction_id)"
+    )
+    # Las ganancias del resumen pasan de "última compra" a costo promedio: se recalculan al final
+
+
+@migracion(7, "Versión del libro para invalidar la cache de vistas")
+def _version_libro(conexion):
+    crear_version_libro(conexion)
+
+
+@migracion(8, "Sucursales: nombre de la caja y caja de cada transacción")
+def _sucursales(conexion):
+    conexion.exec_driver_sql("ALTER TABLE caja ADD COLUMN nombre VARCHAR(50)")
+    conexion.exec_driver_sql('ALTER TABLE "transaction" ADD COLUMN caja_id INTEGER')
+    # Hasta ahora todas las operaciones eran de la última caja creada
+    conexion.exec_driver_sql('UPDATE "transaction" SET caja_id = (SELECT max(id) FROM caja)')
+    conexion.exec_driver_sql(
+        'CREATE INDEX ix_transaction_caja_id_fecha_hora ON "transaction" (caja_id, fecha_hora)'
+    )
+
+
+@migracion(9, "Serie histórica de cotizaciones")
+def _serie_cotizaciones(conexion):
+    conexion.exec_driver_sql(
+        "CREATE TABLE cotizacion ("
+        " fuente VARCHAR(20) NOT NULL,"
+        " fecha_hora DATETIME NOT NULL,"
+        " compra INTEGER NOT NULL,"
+        " venta INTEGER NOT NULL,"
+        " PRIMARY KEY (fuente, fecha_hora)) WITHOUT ROWID"
+    )
+
+
+@migracion(10, "Cola de trabajos en segundo plano")
+def _trabajos(conexion):
+    conexion.exec_driver_sql(
+        "CREATE TABLE trabajo ("
+        " id INTEGER NOT NULL PRIMARY KEY,"
+        " tipo VARCHAR(30) NOT NULL,"
+        " estado VARCHAR(10) NOT NULL,"
+        " caja_id INTEGER,"
+        " parametros TEXT NOT NULL,"
+        " avance INTEGER NOT NULL,"
+        " total INTEGER,"
+        " resultado TEXT,"
+        " archivo VARCHAR(255),"
+        " error TEXT,"
+        " intentos INTEGER NOT NULL,"
+        " creado_en DATETIME NOT NULL,"
+        " iniciado_en DATETIME,"
+        " terminado_en DATETIME,"
+        " latido DATETIME)"
+    )
+    conexion.exec_driver_sql("CREATE INDEX ix_trabajo_estado_id ON trabajo (estado, id)")
+
+
+@migracion(11, "Signo de la comisión de cash_to_cash")
+def _signo_cash_to_cash(conexion):
+    # La tabla de impactos lee el sentido de la comisión guardada: positiva si se pagó. Antes se
+    # guardaba siempre positiva; el sentido real queda en el movimiento del alta (entraron dólares).
+    # Las filas anteriores al libro de movimientos no tienen ese movimiento (ver la migración 16).
+    conexion.exec_driver_sql(
+        'UPDATE "transaction" SET comision = -comision'
+        " WHERE tipo = 'cash_to_cash' AND comision > 0 AND EXISTS ("
+        '  SELECT 1 FROM movimiento_caja m WHERE m.transaction_id = "transaction".id'
+        "  AND m.motivo = 'alta' AND m.dolares > 0)"
+    )
+
+
+@migracion(12, "Cierres de caja diarios")
+def _cierres(conexion):
+    conexion.exec_driver_sql(
+        "CREATE TABLE cierre_caja ("
+        " id INTEGER NOT NULL PRIMARY KEY,"
+        " caja_id INTEGER NOT NULL REFERENCES caja (id),"
+        " fecha DATE NOT NULL,"
+        " movimiento_id INTEGER NOT NULL,"
+        " pesos INTEGER NOT NULL,"
+        " dolares INTEGER NOT NULL,"
+        " cantidad INTEGER NOT NULL,"
+        " comisiones INTEGER NOT NULL,"
+        " descuentos INTEGER NOT NULL,"
+        " ganancias INTEGER NOT NULL,"
+        " perdidas INTEGER NOT NULL,"
+        " cerrado_en DATETIME NOT NULL,"
+        " CONSTRAINT uq_cierre_caja_caja_id_fecha UNIQUE (caja_id, fecha))"
+    )
+    conexion.exec_driver_sql(
+        "CREATE TABLE cierre_tipo ("
+        " cierre_id INTEGER NOT NULL REFERENCES cierre_caja (id),"
+        " tipo VARCHAR(20) NOT NULL,"
+        " cantidad INTEGER NOT NULL,"
+        " volumen INTEGER NOT NULL,"
+        " volumen_usd INTEGER NOT NULL,"
+        " comisiones INTEGER NOT NULL,"
+        " descuentos INTEGER NOT NULL,"
+        " ganancias INTEGER NOT NULL,"
+        " perdidas INTEGER NOT NULL,"
+        " PRIMARY KEY (cierre_id, tipo)) WITHOUT ROWID"
+    )
+
+
+
+@migracion(13, "Comisiones del resumen: importe guardado, no multiplicado por el monto", reconstruir=('resumen',))
+def _comisiones_resumen(conexion):
+    # Sólo cambia el cálculo: el resumen se vuelve a armar al final de la migración
+    pass
+
+
+@migracion(14, "Costo promedio y resumen diario por sucursal", reconstruir=('costos', 'resumen'))
+def _costos_y_resumen_por_sucursal(conexion):
+    # Las dos tablas son derivadas del libro: se vacían y se vuelven a calcular al final
+    conexion.exec_driver_sql("DELETE FROM costo_transaccion")
+    conexion.exec_driver_sql("ALTER TABLE costo_transaccion ADD COLUMN caja_id INTEGER")
+    conexion.exec_driver_sql("DROP INDEX ix_costo_transaccion_moneda_fecha_hora")
+    conexion.exec_driver_sql(
+        "CREATE INDEX ix_costo_transaccion_caja_id_moneda_fecha_hora"
+        " ON costo_transaccion (caja_id, moneda, fecha_hora, transaction_id)"
+    )
+    conexion.exec_driver_sql("DROP TABLE resumen_diario")
+    montos_resumen = ('volumen', 'volumen_usd', 'comisiones', 'descuentos', 'ganancias', 'perdidas')
+    conexion.exec_driver_sql(
+        "CREATE TABLE resumen_diario ("
+        " id INTEGER NOT NULL PRIMARY KEY,"
+        " caja_id INTEGER,"
+        " fecha DATE NOT NULL,"
+        " tipo VARCHAR(20) NOT NULL,"
+        " cantidad INTEGER NOT NULL,"
+        + "".join(f" {columna} INTEGER NOT NULL," for columna in montos_resumen) +
+        " CONSTRAINT uq_resumen_diario_fecha_caja_id_tipo UNIQUE (fecha, caja_id, tipo))"
+    )
+    # Al borrar la tabla se pierden sus triggers de version_libro (migración 7)
+    crear_version_libro(conexion)
+
+
+@migracion(15, "Totales de los cierres: comisiones guardadas, no multiplicadas por el monto", reconstruir=('cierres',))
+def _comisiones_cierres(conexion):
+    # Los cierres anteriores guardaron las comisiones mal calculadas; se rearman al final
+    pass
+
+
+@migracion(16, "cash_to_cash heredadas sin sentido de la comisión")
+def _sentido_pendiente(conexion):
+    # Antes del libro de movimientos la comisión se guardaba siempre positiva y el alta quedó dentro
+    # del 'saldo_inicial' de la caja, sin movimiento propio: la migración 11 no tiene de dónde leer el
+    # sentido. Esas filas se marcan y no se revierten ni editan hasta que alguien lo fije a mano.
+    conexion.exec_driver_sql(
+        'ALTER TABLE "transaction" ADD COLUMN sentido_pendiente BOOLEAN NOT NULL DEFAULT 0'
+    )
+    conexion.exec_driver_sql(
+        'UPDATE "transaction" SET sentido_pendiente = 1'
+        " WHERE tipo = 'cash_to_cash' AND comision > 0 AND NOT EXISTS ("
+        '  SELECT 1 FROM movimiento_caja m WHERE m.transaction_id = "transaction".id'
+        "  AND m.motivo IN ('alta', 'edicion'))"
+    )
+
+
+@migracion(17, "Triggers de version_libro sobre resumen_diario")
+def _version_libro_resumen(conexion):
+    # La migración 14 recreaba resumen_diario sin sus triggers: las bases que ya la aplicaron los recuperan
+    crear_version_libro(conexion)
+
+
+# Consultas frecuentes que no deben recorrer la tabla completa
+CONSULTAS_CALIENTES = {
+    'historial por tipo': (
+        'SELECT * FROM "transaction" WHERE tipo = ? ORDER BY fecha_hora DESC, id DESC LIMIT 101',
+        ('venta_dolares',),
+    ),
+    'historial por fechas': (
+        'SELECT * FROM "transaction" WHERE fecha_hora >= ? AND fecha_hora < ? '
+        'ORDER BY fecha_hora DESC, id DESC LIMIT 101',
+        ('2024-01-01', '2024-02-01'),
+    ),
+    'costo vigente': (
+        'SELECT cantidad, costo_promedio FROM costo_transaccion WHERE caja_id = ? AND moneda = ? '
+        'ORDER BY fecha_hora DESC, transaction_id DESC LIMIT 1',
+        (1, 'dolares'),
+    ),
+    'recálculo de costos': (
+        'SELECT id, tipo, fecha_hora, monto, tasa_cambio, precio_compra FROM "transaction" '
+        'WHERE caja_id = ? AND tipo IN (?, ?) AND (fecha_hora, id) >= (?, ?) ORDER BY fecha_hora, id',
+        (1, 'compra_dolares', 'venta_dolares', '2024-01-01', 0),
+    ),
+    'estadísticas por sucursal': (
+        'SELECT sum(ganancias) FROM resumen_diario WHERE fecha >= ? AND caja_id = ?',
+        ('2024-01-01', 1),
+    ),
+    'saldo de caja': (
+        'SELECT sum(pesos), sum(dolares) FROM movimiento_caja WHERE caja_id = ? AND id > ?',
+        (1, 0),
+    ),
+    'historial por sucursal': (
+        'SELECT * FROM "transaction" WHERE caja_id = ? ORDER BY fecha_hora DESC, id DESC LIMIT 101',
+        (1,),
+    ),
+    'cotización vigente': (
+        'SELECT compra, venta FROM cotizacion WHERE fuente = ? AND fecha_hora <= ? '
+        'ORDER BY fecha_hora DESC LIMIT 1',
+        ('blue', '2024-01-01'),
+    ),
+    'próximo trabajo': (
+        "SELECT id FROM trabajo WHERE estado = ? ORDER BY id LIMIT 1",
+        ('pendiente',),
+    ),
+    'cierre del día': (
+        'SELECT pesos, dolares FROM cierre_caja WHERE caja_id = ? AND fecha = ?',
+        (1, '2024-01-01'),
+    ),
+    'saldo a fecha': (
+        'SELECT pesos, dolares, movimiento_id FROM cierre_caja WHERE caja_id = ? AND fecha <= ? '
+        'ORDER BY fecha DESC LIMIT 1',
+        (1, '2024-01-01'),
+    ),
+    'rango de estadísticas': (
+        'SELECT count(*) FROM "transaction" WHERE fecha_hora >= ?',
+        ('2024-01-01',),
+    ),
+}
+
+
+def explicar_consultas(conexion):
+    """
+    Ejecuta EXPLAIN QUERY PLAN sobre las consultas calientes.
+    Devuelve {nombre: (usa_indice, [detalle del plan])}.
+    """
+    resultado = {}
+    for nombre, (sql, parametros) in CONSULTAS_CALIENTES.items():
+        plan = [fila[-1] for fila in conexion.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}", parametros)]
+        recorre_tabla = any(
+            paso.startswith('SCAN') and 'USING' not in paso for paso in plan
+        )
+        resultado[nombre] = (not recorre_tabla, plan)
+    return resultado
@@ -1,22 +1,195 @@
+from flask import current_app, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 from datetime import datetime
 
-db = SQLAlchemy()
+from .dinero import Dinero, ESCALA_TASA
+
+
+class SesionPorSucursal(Session):
+    """
+    Sesión que, con una base por sucursal (ver sucursales.py), manda cada consulta al archivo
+    de la sucursal de la request. Con la base compartida se comporta como la sesión de siempre.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            enrutador = current_app.extensions.get('sucursales')
+            engine = enrutador.engine_actual() if enrutador else None
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper, clause, bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': SesionPorSucursal})
 
 class Caja(db.Model):
+    # Una caja por sucursal. El saldo no se guarda acá: surge de los movimientos (ver libro_caja.saldo_caja)
     id = db.Column(db.Integer, primary_key=True)
-    pesos = db.Column(db.Float, nullable=False)  # Saldo en pesos
-    dolares = db.Column(db.Float, nullable=False)  # Saldo en dólares
     fecha_hora = db.Column(db.DateTime, nullable=False)  # Fecha y hora de configuración
+    nombre = db.Column(db.String(50), nullable=True)  # Nombre de la sucursal
+
+class MovimientoCaja(db.Model):
+    """
+    Libro de movimientos de la caja, sólo de agregado: un delta por alta, baja o edición
+    de transacción y por cada ingreso de fondos.
+    """
+    __tablename__ = 'movimiento_caja'
+    __table_args__ = (db.Index('ix_movimiento_caja_caja_id', 'caja_id', 'id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    caja_id = db.Column(db.Integer, db.ForeignKey('caja.id'), nullable=False)
+    transaction_id = db.Column(db.Integer, nullable=True)  # Sin FK: la transacción puede haberse eliminado
+    motivo = db.Column(db.String(20), nullable=False)  # fondos, alta, baja, edicion, saldo_inicial
+    pesos = db.Column(Dinero(), nullable=False)
+    dolares = db.Column(Dinero(), nullable=False)
+    fecha_hora = db.Column(db.DateTime, nullable=False)
+
+class SnapshotCaja(db.Model):
+    """
+    Saldo acumulado de una caja hasta `movimiento_id` inclusive.
+    """
+    __tablename__ = 'snapshot_caja'
+    __table_args__ = (db.Index('ix_snapshot_caja_caja_id', 'caja_id', 'movimiento_id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    caja_id = db.Column(db.Integer, db.ForeignKey('caja.id'), nullable=False)
+    movimiento_id = db.Column(db.Integer, nullable=False)
+    pesos = db.Column(Dinero(), nullable=False)
+    dolares = db.Column(Dinero(), nullable=False)
+    fecha_hora = db.Column(db.DateTime, nullable=False)
 
 class Transaction(db.Model):
+    __table_args__ = (
+        db.Index('ix_transaction_tipo_fecha_hora', 'tipo', 'fecha_hora'),  # Historial por tipo y precio previo
+        db.Index('ix_transaction_fecha_hora', 'fecha_hora'),  # Rangos de fechas y paginación
+        db.Index('ix_transaction_caja_id_fecha_hora', 'caja_id', 'fecha_hora'),  # Historial por sucursal
+    )
+
     id = db.Column(db.Integer, primary_key=True)
+    caja_id = db.Column(db.Integer, nullable=True)  # Caja de la sucursal que hizo la operación
     tipo = db.Column(db.String(10), nullable=False)  # "compra" o "venta"
-    monto = db.Column(db.Float, nullable=False)
+    monto = db.Column(Dinero(), nullable=False)
     concepto = db.Column(db.String(255), nullable=True)
     fecha_hora = db.Column(db.DateTime, nullable=False)
-    tasa_cambio = db.Column(db.Float, nullable=False)  # Tipo de cambio
-    comision = db.Column(db.Float, nullable=True, default=0.0)  # Porcentaje de comisión (para cable)
-    descuento_cheque = db.Column(db.Float, nullable=True, default=0.0)  # Porcentaje de descuento (para cheques) 
-    precio_compra = db.Column(db.Float, nullable=True)  # Precio al que se compró (opcional)
-    precio_venta = db.Column(db.Float, nullable=True)  # Precio al que se vendió (opcional)  
\ No newline at end of file
+    tasa_cambio = db.Column(Dinero(ESCALA_TASA), nullable=False)  # Tipo de cambio
+    comision = db.Column(Dinero(), nullable=True, default=0)  # Comisión calculada (para cable)
+    descuento_cheque = db.Column(Dinero(), nullable=True, default=0)  # Descuento aplicado (para cheques)
+    precio_compra = db.Column(Dinero(ESCALA_TASA), nullable=True)  # Precio al que se compró (opcional)
+    precio_venta = db.Column(Dinero(ESCALA_TASA), nullable=True)  # Precio al que se vendió (opcional)
+    # cash_to_cash heredada cuyo sentido de la comisión no se conoce: no se revierte hasta fijarlo
+    sentido_pendiente = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
+
+class CostoTransaccion(db.Model):
+    """
+    Posición de cada moneda en cada caja (tenencia y costo promedio ponderado) después de cada compra
+    o venta, y el costo y resultado realizado de las ventas. Se mantiene en la misma transacción que el libro.
+    """
+    __tablename__ = 'costo_transaccion'
+    __table_args__ = (
+        db.Index('ix_costo_transaccion_caja_id_moneda_fecha_hora', 'caja_id', 'moneda', 'fecha_hora', 'transaction_id'),
+    )
+
+    transaction_id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # Sin FK, como movimiento_caja
+    caja_id = db.Column(db.Integer, nullable=True)  # Cada sucursal lleva su propia posición
+    moneda = db.Column(db.String(10), nullable=False)  # "dolares" o "pesos"
+    fecha_hora = db.Column(db.DateTime, nullable=False)  # Copia de la transacción, para ordenar la posición
+    cantidad = db.Column(Dinero(), nullable=False)  # Tenencia después de la operación
+    costo_promedio = db.Column(Dinero(ESCALA_TASA), nullable=True)  # None si nunca hubo compras
+    precio_costo = db.Column(Dinero(ESCALA_TASA), nullable=True)  # Costo aplicado a la venta
+    resultado = db.Column(Dinero(), nullable=True)  # Ganancia (+) o pérdida (-) realizada por la venta
+
+class ResumenDiario(db.Model):
+    """
+    Totales por sucursal, día y tipo de transacción. Se mantiene en la misma transacción que las altas,
+    ediciones y bajas para que las estadísticas no tengan que recorrer el libro completo.
+    """
+    __tablename__ = 'resumen_diario'
+    __table_args__ = (db.UniqueConstraint('fecha', 'caja_id', 'tipo', name='uq_resumen_diario_fecha_caja_id_tipo'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    caja_id = db.Column(db.Integer, nullable=True)
+    fecha = db.Column(db.Date, nullable=False)
+    tipo = db.Column(db.String(20), nullable=False)
+    cantidad = db.Column(db.Integer, nullable=False, default=0)  # Cantidad de transacciones
+    volumen = db.Column(Dinero(), nullable=False, default=0)  # Suma de montos
+    volumen_usd = db.Column(Dinero(), nullable=False, default=0)  # Suma de monto / tasa de cambio
+    comisiones = db.Column(Dinero(), nullable=False, default=0)
+    descuentos = db.Column(Dinero(), nullable=False, default=0)  # Descuentos por cheque
+    ganancias = db.Column(Dinero(), nullable=False, default=0)  # Resultado realizado positivo
+    perdidas = db.Column(Dinero(), nullable=False, default=0)  # Resultado realizado negativo
+
+class CierreCaja(db.Model):
+    """
+    Cierre del día de una caja (ver cierres.py): el saldo al cierre y los totales del día quedan
+    congelados, así los reportes de días pasados y el saldo a una fecha no recorren el libro.
+    """
+    __tablename__ = 'cierre_caja'
+    __table_args__ = (db.UniqueConstraint('caja_id', 'fecha', name='uq_cierre_caja_caja_id_fecha'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    caja_id = db.Column(db.Integer, db.ForeignKey('caja.id'), nullable=False)
+    fecha = db.Column(db.Date, nullable=False)
+    movimiento_id = db.Column(db.Integer, nullable=False)  # Último movimiento incluido en el saldo (0 si ninguno)
+    pesos = db.Column(Dinero(), nullable=False)  # Saldo al cierre
+    dolares = db.Column(Dinero(), nullable=False)
+    cantidad = db.Column(db.Integer, nullable=False, default=0)  # Transacciones del día
+    comisiones = db.Column(Dinero(), nullable=False, default=0)  # Comisiones de cables
+    descuentos = db.Column(Dinero(), nullable=False, default=0)  # Descuentos por cheque
+    ganancias = db.Column(Dinero(), nullable=False, default=0)  # Resultado realizado positivo
+    perdidas = db.Column(Dinero(), nullable=False, default=0)  # Resultado realizado negativo
+    cerrado_en = db.Column(db.DateTime, nullable=False)
+
+class CierreTipo(db.Model):
+    """
+    Totales por tipo de transacción de un cierre, con las mismas columnas que el resumen diario.
+    Sin rowid: la clave (cierre_id, tipo) agrupa en disco las filas de cada cierre.
+    """
+    __tablename__ = 'cierre_tipo'
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    cierre_id = db.Column(db.Integer, db.ForeignKey('cierre_caja.id'), primary_key=True)
+    tipo = db.Column(db.String(20), primary_key=True)
+    cantidad = db.Column(db.Integer, nullable=False, default=0)
+    volumen = db.Column(Dinero(), nullable=False, default=0)
+    volumen_usd = db.Column(Dinero(), nullable=False, default=0)
+    comisiones = db.Column(Dinero(), nullable=False, default=0)
+    descuentos = db.Column(Dinero(), nullable=False, default=0)
+    ganancias = db.Column(Dinero(), nullable=False, default=0)
+    perdidas = db.Column(Dinero(), nullable=False, default=0)
+
+class Cotizacion(db.Model):
+    """
+    Serie histórica de la cotización del dólar (ver serie_cotizaciones.py). Sin rowid: la clave
+    primaria (fuente, fecha_hora) ordena la tabla y resuelve la búsqueda de la cotización vigente.
+    """
+    __tablename__ = 'cotizacion'
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    fuente = db.Column(db.String(20), primary_key=True)  # "blue", "oficial", ...
+    fecha_hora = db.Column(db.DateTime, primary_key=True)  # Desde cuándo rige
+    compra = db.Column(Dinero(ESCALA_TASA), nullable=False)
+    venta = db.Column(Dinero(ESCALA_TASA), nullable=False)
+
+class Trabajo(db.Model):
+    """
+    Cola de trabajos en segundo plano (ver trabajos.py). Parámetros y resultado van como JSON.
+    """
+    __tablename__ = 'trabajo'
+    __table_args__ = (db.Index('ix_trabajo_estado_id', 'estado', 'id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(30), nullable=False)
+    estado = db.Column(db.String(10), nullable=False, default='pendiente')  # pendiente, en_curso, terminado, error
+    caja_id = db.Column(db.Integer, nullable=True)  # Sucursal que lo pidió
+    parametros = db.Column(db.Text, nullable=False, default='{}')
+    avance = db.Column(db.Integer, nullable=False, default=0)  # Unidades hechas (filas, operaciones)
+    total = db.Column(db.Integer, nullable=True)  # None si no se conoce de antemano
+    resultado = db.Column(db.Text, nullable=True)
+    archivo = db.Column(db.String(255), nullable=True)  # Archivo generado, dentro de TRABAJOS_DIR
+    error = db.Column(db.Text, nullable=True)
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    creado_en = db.Column(db.DateTime, nullable=False)
+    iniciado_en = db.Column(db.DateTime, nullable=True)
+    terminado_en = db.Column(db.DateTime, nullable=True)
+    latido = db.Column(db.DateTime, nullable=True)  # Último aviso del worker mientras está en curso
@@ -0,0 +1,105 @@
+# operaciones.py
+# Altas y bajas de transacciones compartidas por las vistas HTML y la API.
+from .costos import actualizar_costos, precio_costo_vigente
+from .impactos import revertir_impacto
+from .libro_caja import Saldo, registrar_movimiento
+from .models import db, Transaction
+from .resumenes import rango_afectado, reconstruir_resumen
+
+TIPOS_VALIDOS = (
+    'compra_dolares', 'venta_dolares', 'compra_pesos', 'venta_pesos',
+    'cable_subida', 'cable_bajada', 'cash_to_cash', 'descuento_cheque',
+)
+TIPOS_VENTA = ('venta_dolares', 'venta_pesos')
+
+
+class OperacionInvalida(ValueError):
+    """
+    La operación no se puede aplicar (fondos insuficientes, falta de precio, etc.).
+    El mensaje se muestra tal cual al usuario.
+    """
+
+
+def validar_precio_costo(caja_id, tipo, precio_compra, hay_compras=None):
+    """
+    Una venta sin compras previas de la moneda en la caja necesita un precio de compra ingresado a mano.
+    `hay_compras` evita leer la posición cuando el llamador ya la sigue (la importación, por lote).
+    """
+    if hay_compras is None:
+        hay_compras = precio_costo_vigente(caja_id, tipo) is not None
+    if tipo in TIPOS_VENTA and not hay_compras and not precio_compra:
+        raise OperacionInvalida("Debe ingresar un precio de compra válido, ya que no hay uno previo.")
+
+
+def validar_operacion(caja_id, tipo, monto, precio_compra):
+    """
+    Reglas comunes al alta y a la edición: tipo conocido, monto positivo y precio de costo para las ventas.
+    """
+    if tipo not in TIPOS_VALIDOS:
+        raise OperacionInvalida(f"Tipo de transacción inválido: {tipo!r}.")
+    if monto <= 0:
+        raise OperacionInvalida("El monto debe ser mayor a cero.")
+    validar_precio_costo(caja_id, tipo, precio_compra)
+
+
+def exigir_sentido(transaccion):
+    """
+    Una cash_to_cash heredada sin sentido de la comisión no se puede revertir: el signo sería un supuesto.
+    """
+    if transaccion.sentido_pendiente:
+        raise OperacionInvalida(
+            f"La transacción {transaccion.id} es una cash_to_cash anterior al libro de movimientos y no se sabe "
+            "si la comisión se pagó o se recibió. Fíjelo con 'flask caja sentido' antes de editarla o eliminarla."
+        )
+
+
+def fijar_sentido(transaccion, pagada):
+    """
+    Fija a mano el sentido de la comisión de una cash_to_cash heredada: positiva si se pagó.
+    La caja no cambia (el alta ya está en el saldo inicial); sí el resumen de ese día. No hace commit.
+    """
+    if transaccion.tipo != 'cash_to_cash':
+        raise OperacionInvalida(f"La transacción {transaccion.id} no es una cash_to_cash.")
+    comision = abs(transaccion.comision or 0)
+    transaccion.comision = comision if pagada else -comision
+    transaccion.sentido_pendiente = False
+    db.session.flush()
+    reconstruir_resumen(*rango_afectado(transaccion.tipo, transaccion.fecha_hora))
+
+
+def agregar_transaccion(caja, saldo, valores, pesos_delta, dolares_delta):
+    """
+    Agrega una transacción ya calculada junto con su movimiento de caja y su costo.
+    No hace commit ni actualiza el resumen. Devuelve (transacción, saldo después de la operación).
+    """
+    if saldo.pesos + pesos_delta < 0 or saldo.dolares + dolares_delta < 0:
+        raise OperacionInvalida("Fondos insuficientes en la caja.")
+
+    transaccion = Transaction(caja_id=caja.id, **valores)
+    db.session.add(transaccion)
+    db.session.flush()
+    registrar_movimiento(caja, pesos_delta, dolares_delta, 'alta', transaccion.id)
+    actualizar_costos((caja.id, transaccion.tipo, transaccion.fecha_hora, transaccion.id))
+    return transaccion, Saldo(saldo.pesos + pesos_delta, saldo.dolares + dolares_delta)
+
+
+def quitar_transaccion(caja, saldo, transaccion):
+    """
+    Elimina una transacción revirtiendo su impacto en la caja y en los costos.
+    No hace commit ni actualiza el resumen. Devuelve (rango del resumen afectado, saldo nuevo).
+    """
+    exigir_sentido(transaccion)
+    pesos_delta, dolares_delta, _, _ = revertir_impacto(
+        transaccion.tipo, transaccion.monto, transaccion.tasa_cambio,
+        comision=transaccion.comision, descuento_cheque=transaccion.descuento_cheque,
+    )
+    if saldo.pesos + pesos_delta < 0 or saldo.dolares + dolares_delta < 0:
+        raise OperacionInvalida("Fondos insuficientes para revertir esta transacción.")
+
+    registrar_movimiento(caja, pesos_delta, dolares_delta, 'baja', transaccion.id)
+    rango = rango_afectado(transaccion.tipo, transaccion.fecha_hora)
+    operacion = (transaccion.caja_id, transaccion.tipo, transaccion.fecha_hora, transaccion.id)
+    db.session.delete(transaccion)
+    db.session.flush()
+    actualizar_costos(operacion)
+    return rango, Saldo(saldo.pesos + pesos_delta, saldo.dolares + dolares_delta)
@@ -0,0 +1,20 @@
+# perfil_sqlite.py
+from sqlalchemy import event
+
+
+def configurar_sqlite(engine, pragmas):
+    """
+    Aplica los PRAGMA del perfil a cada conexión nueva del pool.
+    journal_mode=WAL se guarda en el archivo, el resto vale por conexión.
+    """
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _aplicar_pragmas(conexion_dbapi, _registro):
+        cursor = conexion_dbapi.cursor()
+        try:
+            for nombre, valor in pragmas.items():
+                cursor.execute(f"PRAGMA {nombre} = {valor}")
+        finally:
+            cursor.close()
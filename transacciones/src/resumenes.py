@@ -0,0 +1,60 @@
+# resumenes.py
+import datetime
+
+from sqlalchemy import delete, func, insert, select
+
+from .costos import MONEDAS
+from .estadisticas import columnas_resumen, filas_con_costo
+from .models import db, ResumenDiario
+
+
+def rango_afectado(tipo, fecha_hora):
+    """
+    Días del resumen que cambian si se agrega o quita una transacción.
+    Una compra o venta cambia además la posición de su moneda, y con ella el costo promedio
+    de todas las ventas posteriores. Devuelve (desde, hasta) como fechas; `hasta` None significa
+    "hasta el final".
+    """
+    desde = fecha_hora.date()
+    if tipo not in MONEDAS:
+        return desde, desde
+    return desde, None
+
+
+def unir_rangos(*rangos):
+    """
+    Rango mínimo que cubre todos los rangos dados.
+    """
+    desde = min(r[0] for r in rangos)
+    hasta = None if any(r[1] is None for r in rangos) else max(r[1] for r in rangos)
+    return desde, hasta
+
+
+def reconstruir_resumen(desde=None, hasta=None, conexion=None):
+    """
+    Recalcula las filas del resumen entre `desde` y `hasta` (fechas inclusivas), de todas las sucursales.
+    Sin argumentos reconstruye el resumen completo. No hace commit.
+    """
+    ejecutor = conexion or db.session
+    inicio = datetime.datetime.combine(desde, datetime.time.min) if desde else None
+    filas = filas_con_costo(inicio)
+    dia = func.date(filas.c.fecha_hora)
+    consulta = select(
+        dia.label('fecha'), filas.c.caja_id, filas.c.tipo, *columnas_resumen(filas)
+    ).group_by(dia, filas.c.caja_id, filas.c.tipo)
+
+    borrado = delete(ResumenDiario)
+    if desde:
+        consulta = consulta.where(filas.c.fecha_hora >= inicio)
+        borrado = borrado.where(ResumenDiario.fecha >= desde)
+    if hasta:
+        consulta = consulta.where(filas.c.fecha_hora < datetime.datetime.combine(hasta, datetime.time.min)
+                                  + datetime.timedelta(days=1))
+        borrado = borrado.where(ResumenDiario.fecha <= hasta)
+
+    nuevas = [dict(fila, fecha=datetime.date.fromisoformat(fila['fecha']))
+              for fila in ejecutor.execute(consulta).mappings()]
+    ejecutor.execute(borrado)
+    if nuevas:
+        ejecutor.execute(insert(ResumenDiario.__table__), nuevas)
+    return len(nuevas)
@@ -0,0 +1,179 @@
+# serie_cotizaciones.py
+"""
+Serie histórica de la cotización del dólar.
+
+Cada fila guarda compra y venta en unidades mínimas (ESCALA_TASA) con clave (fuente, fecha_hora)
+en una tabla WITHOUT ROWID: la clave primaria es a la vez el índice de la búsqueda puntual, sin
+rowid ni índice aparte. El refresco sólo agrega una fila cuando la cotización cambió, así que la
+cotización vigente en un momento es la última fila con fecha_hora menor o igual.
+
+La serie es del negocio y no de una sucursal: se lee y se escribe siempre en la base principal.
+"""
+import datetime
+import json
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from .dinero import ESCALA_TASA, a_entero, desde_entero
+from .escrituras import escritura
+from .importacion import leer_fecha_hora, leer_filas
+from .models import Cotizacion
+
+FUENTE_BLUE = 'blue'
+FORMATOS_SERIE = ('csv', 'jsonl', 'json')
+
+# Nombres de columna aceptados en los volcados: los propios y los de la evolución de bluelytics
+ALIAS = {
+    'fecha_hora': ('fecha_hora', 'fecha', 'date'),
+    'compra': ('compra', 'value_buy', 'buy'),
+    'venta': ('venta', 'value_sell', 'sell'),
+    'fuente': ('fuente', 'source'),
+}
+
+PuntoCotizacion = namedtuple('PuntoCotizacion', 'fecha_hora compra venta')
+
+
+def _a_tasa(valor):
+    # Mismo redondeo que la columna, para comparar con lo guardado
+    return desde_entero(a_entero(valor, ESCALA_TASA), ESCALA_TASA)
+
+
+def _campo(fila, nombre):
+    for alias in ALIAS[nombre]:
+        valor = fila.get(alias)
+        if valor not in (None, ''):
+            return valor
+    return None
+
+
+def preparar_punto(fila, fuente):
+    """
+    Valida una fila de un volcado y la convierte en valores para la tabla. Lanza ValueError.
+    """
+    if not isinstance(fila, dict):
+        raise ValueError("La fila no es un objeto.")
+    valores = {'fuente': str(_campo(fila, 'fuente') or fuente).strip().lower()}
+    fecha_hora = _campo(fila, 'fecha_hora')
+    if fecha_hora is None:
+        raise ValueError("Falta la fecha.")
+    try:
+        valores['fecha_hora'] = leer_fecha_hora(fecha_hora)
+    except ValueError:
+        raise ValueError(f"Fecha inválida: {fecha_hora!r}.")
+    for campo in ('compra', 'venta'):
+        valor = _campo(fila, campo)
+        try:
+            valores[campo] = Decimal(str(valor).strip())
+        except InvalidOperation:
+            raise ValueError(f"Falta la {campo} o no es un número: {valor!r}.")
+        if not valores[campo].is_finite() or valores[campo] <= 0:
+            raise ValueError(f"La {campo} debe ser mayor a cero.")
+    return valores
+
+
+def leer_volcado(flujo, formato):
+    """
+    Itera (número de fila, dict) sobre un volcado CSV, JSON lines o un arreglo JSON.
+    """
+    if formato != 'json':
+        yield from leer_filas(flujo, formato)
+        return
+    datos = json.load(flujo)
+    if not isinstance(datos, list):
+        raise ValueError("El volcado JSON debe ser una lista de cotizaciones.")
+    yield from enumerate(datos, start=1)
+
+
+class SerieCotizaciones:
+    """
+    Acceso a la tabla de cotizaciones a través del engine de la base principal. No usa la sesión,
+    así que también se puede usar desde el hilo de refresco, fuera de un contexto de app.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    @staticmethod
+    def _vigente(conexion, fuente, fecha_hora):
+        c = Cotizacion.__table__.c
+        fila = conexion.execute(
+            select(c.fecha_hora, c.compra, c.venta)
+            .where(c.fuente == fuente, c.fecha_hora <= fecha_hora)
+            .order_by(c.fecha_hora.desc()).limit(1)
+        ).first()
+        return PuntoCotizacion(*fila) if fila else None
+
+    def registrar(self, cotizacion, fecha_hora=None, fuente=FUENTE_BLUE):
+        """
+        Agrega `cotizacion` ({'buy', 'sell'}) si es distinta de la vigente. Devuelve True si agregó la fila.
+        """
+        fecha_hora = fecha_hora or datetime.datetime.now()
+        compra, venta = _a_tasa(cotizacion['buy']), _a_tasa(cotizacion['sell'])
+        with escritura(), self.engine.begin() as conexion:
+            vigente = self._vigente(conexion, fuente, fecha_hora)
+            if vigente and (vigente.compra, vigente.venta) == (compra, venta):
+                return False
+            conexion.execute(insert(Cotizacion).on_conflict_do_nothing(), {
+                'fuente': fuente, 'fecha_hora': fecha_hora, 'compra': compra, 'venta': venta,
+            })
+        return True
+
+    def importar(self, filas, fuente=FUENTE_BLUE, lote=1000):
+        """
+        Carga en lotes las filas (número, dict) de un volcado. Una cotización con la misma fuente
+        y fecha se reemplaza. Devuelve (importadas, [(número de fila, error)]).
+        """
+        sentencia = insert(Cotizacion)
+        sentencia = sentencia.on_conflict_do_update(
+            index_elements=['fuente', 'fecha_hora'],
+            set_={'compra': sentencia.excluded.compra, 'venta': sentencia.excluded.venta},
+        )
+        importadas, errores, pendientes = 0, [], []
+
+        def guardar():
+            with escritura(), self.engine.begin() as conexion:
+                conexion.execute(sentencia, pendientes)
+            pendientes.clear()
+
+        for numero, fila in filas:
+            try:
+                pendientes.append(preparar_punto(fila, fuente))
+            except ValueError as e:
+                errores.append((numero, str(e)))
+                continue
+            importadas += 1
+            if len(pendientes) >= lote:
+                guardar()
+        if pendientes:
+            guardar()
+        return importadas, errores
+
+    def en(self, fecha_hora=None, fuente=FUENTE_BLUE):
+        """
+        Cotización vigente en `fecha_hora` (por defecto, ahora), o None si la serie empieza después.
+        """
+        with self.engine.connect() as conexion:
+            return self._vigente(conexion, fuente, fecha_hora or datetime.datetime.now())
+
+    def entre(self, desde, hasta, fuente=FUENTE_BLUE):
+        """
+        Puntos con desde <= fecha_hora < hasta en orden cronológico, precedidos por el vigente en
+        `desde` si existe: con esa lista se conoce la cotización de cualquier momento del rango.
+        """
+        c = Cotizacion.__table__.c
+        with self.engine.connect() as conexion:
+            anterior = self._vigente(conexion, fuente, desde)
+            filas = conexion.execute(
+                select(c.fecha_hora, c.compra, c.venta)
+                .where(c.fuente == fuente, c.fecha_hora > desde, c.fecha_hora < hasta)
+                .order_by(c.fecha_hora)
+            ).all()
+        return ([anterior] if anterior else []) + [PuntoCotizacion(*fila) for fila in filas]
+
+
+def serie_cotizaciones():
+    return current_app.extensions['serie_cotizaciones']
@@ -0,0 +1,228 @@
+# sucursales.py
+"""
+Varias sucursales, cada una con su caja.
+
+Con la base compartida (por defecto) todas las sucursales escriben en el mismo archivo: cada
+transacción lleva el id de su caja, y el libro de movimientos, el costo promedio y el resumen
+diario se llevan por caja, igual que con una base por sucursal.
+
+Con SUCURSALES_DB_PLANTILLA cada sucursal tiene su propio archivo SQLite con el esquema completo
+(libro, costos, resumen) y las escrituras de una sucursal no esperan el lock de otra. La base
+principal queda como catálogo: su tabla caja lista las sucursales, con el mismo id que la caja
+dentro del archivo de cada una. La sesión (models.SesionPorSucursal) manda cada consulta al
+archivo de la sucursal elegida para la request en g.caja_id.
+"""
+import datetime
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from flask import current_app, g
+from sqlalchemy import create_engine, insert, select
+
+from .analitica import ESTADISTICAS
+from .escrituras import con_reintentos, configurar_transacciones, escritura
+from .estadisticas import estadisticas_desde_resumen, estadisticas_por_caja
+from .libro_caja import crear_caja, saldo_actual
+from .metricas import instrumentar_engine
+from .migraciones import aplicar_migraciones
+from .models import db, Caja
+from .perfil_sqlite import configurar_sqlite
+
+
+class Enrutador:
+    """
+    Engine de cada sucursal cuando hay una base por sucursal. Cada archivo se crea y migra la primera
+    vez que se usa en el proceso. Sin plantilla no enruta: todo va a la base principal.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.plantilla = app.config['SUCURSALES_DB_PLANTILLA']
+        self.hilos = app.config['SUCURSALES_HILOS']
+        self._lock = threading.Lock()
+        self._engines = {}
+        self._pool = None
+        self._pid = os.getpid()
+
+    @property
+    def por_archivo(self):
+        return bool(self.plantilla)
+
+    def _del_proceso(self):
+        # Tras el fork de gunicorn cada worker abre sus propias conexiones y sus propios hilos
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    for engine in self._engines.values():
+                        engine.dispose(close=False)
+                    self._pool = None
+                    self._pid = os.getpid()
+
+    def engine(self, caja_id):
+        self._del_proceso()
+        engine = self._engines.get(caja_id)
+        if engine is None:
+            with self._lock:
+                engine = self._engines.get(caja_id)
+                if engine is None:
+                    engine = self._engines[caja_id] = self._crear_engine(caja_id)
+        return engine
+
+    def _crear_engine(self, caja_id):
+        config = self.app.config
+        engine = create_engine(
+            self.plantilla.format(caja_id=caja_id), **config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+        )
+        configurar_sqlite(engine, config['SQLITE_PRAGMAS'])
+        configurar_transacciones(engine)
+        instrumentar_engine(self.app, engine)
+        with escritura():
+            aplicar_migraciones(engine)
+        return engine
+
+    def engine_actual(self):
+        caja_id = g.get('caja_id')
+        return self.engine(caja_id) if self.por_archivo and caja_id is not None else None
+
+    def pool(self):
+        self._del_proceso()
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(self.hilos, thread_name_prefix='sucursales')
+        return self._pool
+
+
+def _enrutador():
+    return current_app.extensions['sucursales']
+
+
+def por_archivo():
+    return _enrutador().por_archivo
+
+
+def nombre_sucursal(caja):
+    return caja.nombre or f"Caja {caja.id}"
+
+
+def listar_cajas():
+    """
+    Sucursales del catálogo (id, nombre), leídas siempre de la base principal.
+    """
+    with db.engine.connect() as conexion:
+        return conexion.execute(select(Caja.id, Caja.nombre).order_by(Caja.id)).all()
+
+
+def elegir_sucursal(pedida):
+    """
+    Fija g.caja_id para la request. `pedida` es el id elegido (sesión o header X-Caja) o None.
+    Sin elección, con la base compartida se usa la última caja como siempre; con una base por
+    sucursal, la última del catálogo. Devuelve False si `pedida` no es una sucursal del catálogo.
+    """
+    g.sucursales = listar_cajas()
+    ids = [caja.id for caja in g.sucursales]
+    if pedida in (None, ''):
+        if por_archivo() and ids:
+            g.caja_id = ids[-1]
+        return True
+    try:
+        caja_id = int(pedida)
+    except (TypeError, ValueError):
+        return False
+    if caja_id not in ids:
+        return False
+    g.caja_id = caja_id
+    return True
+
+
+def sucursal_elegida():
+    """
+    Sucursal (id, nombre) elegida para la request, o None si no se eligió ninguna: con la base
+    compartida las estadísticas son entonces de todo el negocio.
+    """
+    caja_id = g.get('caja_id')
+    if caja_id is None:
+        return None
+    return next((caja for caja in g.get('sucursales') or listar_cajas() if caja.id == caja_id), None)
+
+
+def en_sucursal(caja_id, funcion):
+    """
+    Ejecuta `funcion()` con `caja_id` como sucursal, en un contexto de app propio (y su propia sesión).
+    """
+    with current_app.app_context():
+        g.caja_id = caja_id
+        return funcion()
+
+
+def en_cada_sucursal(funcion):
+    """
+    Ejecuta `funcion()` una vez por sucursal, en paralelo, cada una en su contexto de app con su
+    sesión (y su archivo, si hay una base por sucursal). Devuelve [(caja, resultado)].
+    """
+    app = current_app._get_current_object()
+    cajas = g.get('sucursales') or listar_cajas()
+
+    def correr(caja):
+        with app.app_context():
+            g.caja_id = caja.id
+            return funcion()
+
+    return list(zip(cajas, _enrutador().pool().map(correr, cajas)))
+
+
+def crear_sucursal(nombre, pesos, dolares):
+    """
+    Agrega una sucursal con sus fondos iniciales y devuelve su id. Con una base por sucursal se
+    registra primero en el catálogo y después se crea la caja, con el mismo id, en su archivo.
+    """
+    if not por_archivo():
+        def crear():
+            caja = crear_caja(pesos, dolares, nombre)
+            db.session.commit()
+            return caja.id
+        return con_reintentos(crear)
+
+    db.session.rollback()  # Si la sesión tiene abierta la base principal, suelta su lock
+    with escritura(), db.engine.begin() as conexion:
+        caja_id = conexion.execute(
+            insert(Caja).values(nombre=nombre, fecha_hora=datetime.datetime.now())
+        ).inserted_primary_key[0]
+
+    def crear_en_archivo():
+        crear_caja(pesos, dolares, nombre, caja_id)
+        db.session.commit()
+
+    en_sucursal(caja_id, lambda: con_reintentos(crear_en_archivo))
+    return caja_id
+
+
+def saldos_por_sucursal():
+    """
+    [(caja, saldo o None)] de todas las sucursales.
+    """
+    return en_cada_sucursal(saldo_actual)
+
+
+def estadisticas_consolidadas(inicio):
+    """
+    Devuelve ([(caja, estadísticas)], total). Con una base por sucursal se consulta el resumen de
+    cada archivo en paralelo; con la base compartida, una sola consulta agrupada por caja.
+    """
+    if por_archivo():
+        por_sucursal = en_cada_sucursal(lambda: estadisticas_desde_resumen(inicio))
+    else:
+        por_caja = estadisticas_por_caja(inicio)
+        vacias = dict.fromkeys(ESTADISTICAS, Decimal(0))
+        por_sucursal = [(caja, por_caja.get(caja.id, vacias)) for caja in g.get('sucursales') or listar_cajas()]
+    total = {
+        clave: sum((estadisticas[clave] for _, estadisticas in por_sucursal), Decimal(0))
+        for clave in ESTADISTICAS
+    }
+    return por_sucursal, total
+
+
+def configurar_sucursales(app):
+    app.extensions['sucursales'] = Enrutador(app)
@@ -0,0 +1,534 @@
+# trabajos.py
+"""
+Cola de trabajos pesados (recálculos, exportaciones, importaciones) en una tabla SQLite.
+
+La web sólo encola: inserta una fila y responde enseguida con su id. Un proceso aparte
+(`flask --app transacciones.src.app trabajos worker`, ver procFile) toma los pendientes en orden
+y los ejecuta en un pool de procesos, así los recálculos que usan CPU no ocupan a los workers
+de gunicorn ni llegan a su timeout. Cada trabajo anota su avance en su fila, de donde lo leen
+/trabajos y /api/v1/trabajos/<id>.
+
+La cola es de toda la app y vive en la base principal; cada trabajo guarda la sucursal que lo
+pidió y se ejecuta con esa sucursal elegida.
+"""
+import concurrent.futures
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from collections import namedtuple
+from decimal import Decimal
+
+from flask import current_app
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import OperationalError
+
+from .analitica import PERIODOS, analizar
+from .costos import recalcular_costos_desde
+from .escrituras import con_reintentos, escritura
+from .estadisticas import inicio_de_rango
+from .exportacion import FORMATOS_EXPORTACION, exportar, parquet_disponible
+from .historial import filtrar_transacciones
+from .importacion import formato_desde_nombre, importar_transacciones
+from .libro_caja import caja_actual, saldo_caja, tomar_snapshot, verificar_saldos
+from .models import db, Trabajo
+from .reproduccion import reproducir_caja
+from .resumenes import reconstruir_resumen
+from .sucursales import elegir_sucursal
+
+log = logging.getLogger(__name__)
+
+ESTADOS = ('pendiente', 'en_curso', 'terminado', 'error')
+AVANCE_CADA = 0.5  # Segundos mínimos entre dos escrituras del avance
+
+TipoTrabajo = namedtuple('TipoTrabajo', 'funcion preparar descripcion reintentable')
+TIPOS = {}
+
+
+def tipo_trabajo(nombre, descripcion, preparar=None, reintentable=True):
+    """
+    Registra `funcion(parametros, contexto)` como el trabajo `nombre`. `preparar(parametros)` valida
+    los parámetros al encolar (en la request, con la sucursal elegida): devuelve los parámetros
+    normalizados o lanza ValueError con un mensaje para el usuario. Un trabajo no `reintentable`
+    (porque guarda por partes) que se interrumpe queda en error en lugar de volver a la cola.
+    """
+    def registrar(funcion):
+        TIPOS[nombre] = TipoTrabajo(funcion, preparar, descripcion, reintentable)
+        return funcion
+    return registrar
+
+
+def _reintentables():
+    return [nombre for nombre, tipo in TIPOS.items() if tipo.reintentable]
+
+
+def _valor_json(valor):
+    if isinstance(valor, Decimal):
+        return str(valor)  # Los montos viajan como texto para no perder precisión
+    if isinstance(valor, (datetime.date, datetime.datetime)):
+        return valor.isoformat()
+    raise TypeError(f"No se puede guardar {type(valor).__name__} en el resultado de un trabajo.")
+
+
+def _a_dict(fila):
+    trabajo = dict(fila._mapping)
+    trabajo['parametros'] = json.loads(trabajo['parametros'])
+    trabajo['resultado'] = json.loads(trabajo['resultado']) if trabajo['resultado'] else None
+    trabajo['descripcion'] = TIPOS[trabajo['tipo']].descripcion if trabajo['tipo'] in TIPOS else trabajo['tipo']
+    return trabajo
+
+
+class ColaTrabajos:
+    """
+    Acceso a la tabla de trabajos a través del engine de la base principal, como la serie de
+    cotizaciones: no usa la sesión, que con una base por sucursal apunta al archivo de la sucursal.
+    Los archivos de entrada y de salida de los trabajos se guardan en `directorio`.
+    """
+
+    def __init__(self, engine, directorio):
+        self.engine = engine
+        self.directorio = directorio
+
+    def ruta(self, nombre):
+        return os.path.join(self.directorio, nombre)
+
+    def encolar(self, tipo, parametros=None, caja_id=None):
+        """
+        Valida los parámetros y agrega el trabajo como pendiente. Devuelve su id. Lanza ValueError.
+        """
+        if tipo not in TIPOS:
+            raise ValueError(f"Tipo de trabajo desconocido: {tipo!r}.")
+        parametros = dict(parametros or {})
+        if TIPOS[tipo].preparar:
+            parametros = TIPOS[tipo].preparar(parametros)
+        with escritura(), self.engine.begin() as conexion:
+            return conexion.execute(insert(Trabajo).values(
+                tipo=tipo, estado='pendiente', caja_id=caja_id,
+                parametros=json.dumps(parametros, default=_valor_json),
+                avance=0, intentos=0, creado_en=datetime.datetime.now(),
+            )).inserted_primary_key[0]
+
+    def ver(self, trabajo_id):
+        with self.engine.connect() as conexion:
+            fila = conexion.execute(select(Trabajo.__table__).where(Trabajo.id == trabajo_id)).first()
+        return _a_dict(fila) if fila else None
+
+    def listar(self, limite=50, caja_id=None):
+        """
+        Los últimos `limite` trabajos, del más nuevo al más viejo; con `caja_id`, sólo los de esa sucursal.
+        """
+        consulta = select(Trabajo.__table__).order_by(Trabajo.id.desc()).limit(limite)
+        if caja_id is not None:
+            consulta = consulta.where(Trabajo.caja_id == caja_id)
+        with self.engine.connect() as conexion:
+            return [_a_dict(fila) for fila in conexion.execute(consulta)]
+
+    def tomar(self):
+        """
+        Marca como en curso el pendiente más antiguo y lo devuelve, o None si no hay.
+        """
+        t = Trabajo.__table__.c
+        ahora = datetime.datetime.now()
+        siguiente = select(t.id).where(t.estado == 'pendiente').order_by(t.id).limit(1).scalar_subquery()
+        with escritura(), self.engine.begin() as conexion:
+            fila = conexion.execute(
+                update(Trabajo.__table__).where(t.id == siguiente)
+                .values(estado='en_curso', iniciado_en=ahora, latido=ahora, intentos=t.intentos + 1)
+                .returning(*Trabajo.__table__.c)
+            ).first()
+        return _a_dict(fila) if fila else None
+
+    def _actualizar(self, trabajo_id, **valores):
+        with escritura(), self.engine.begin() as conexion:
+            conexion.execute(update(Trabajo.__table__).where(Trabajo.id == trabajo_id).values(**valores))
+
+    def avanzar(self, trabajo_id, avance, total=None):
+        valores = {'avance': avance, 'latido': datetime.datetime.now()}
+        if total is not None:
+            valores['total'] = total
+        self._actualizar(trabajo_id, **valores)
+
+    def terminar(self, trabajo_id, resultado=None, archivo=None):
+        t = Trabajo.__table__.c
+        self._actualizar(
+            trabajo_id, estado='terminado', terminado_en=datetime.datetime.now(), archivo=archivo,
+            avance=func.coalesce(t.total, t.avance),
+            resultado=json.dumps(resultado, default=_valor_json) if resultado is not None else None,
+        )
+
+    def fallar(self, trabajo_id, error):
+        self._actualizar(trabajo_id, estado='error', terminado_en=datetime.datetime.now(), error=error)
+
+    def latir(self, ids):
+        """
+        Renueva el latido de los trabajos que este worker tiene en curso.
+        """
+        if ids:
+            with escritura(), self.engine.begin() as conexion:
+                conexion.execute(
+                    update(Trabajo.__table__).where(Trabajo.id.in_(ids)).values(latido=datetime.datetime.now())
+                )
+
+    def _devolver(self, conexion, interrumpidos, intentos=None):
+        """
+        Devuelve a pendientes los trabajos `interrumpidos` (condición sobre trabajos en curso) que se
+        pueden repetir; los demás, y los que ya se intentaron `intentos` veces, pasan a error.
+        """
+        t = Trabajo.__table__.c
+        sin_reintento = t.tipo.not_in(_reintentables())
+        if intentos is not None:
+            sin_reintento = sin_reintento | (t.intentos >= intentos)
+        conexion.execute(
+            update(Trabajo.__table__).where(interrumpidos, sin_reintento)
+            .values(estado='error', terminado_en=datetime.datetime.now(),
+                    error="El trabajo se interrumpió al detenerse el worker.")
+        )
+        conexion.execute(update(Trabajo.__table__).where(interrumpidos).values(estado='pendiente', avance=0))
+
+    def reencolar(self, ids):
+        if ids:
+            t = Trabajo.__table__.c
+            with escritura(), self.engine.begin() as conexion:
+                self._devolver(conexion, (t.estado == 'en_curso') & t.id.in_(ids))
+
+    def recuperar_vencidos(self, segundos, intentos, excluir=()):
+        """
+        Los trabajos en curso sin latido hace más de `segundos` quedaron de un worker que terminó
+        sin avisar (OOM, SIGKILL) y se devuelven a la cola.
+        """
+        t = Trabajo.__table__.c
+        limite = datetime.datetime.now() - datetime.timedelta(seconds=segundos)
+        vencidos = (t.estado == 'en_curso') & (t.latido < limite) & t.id.not_in(list(excluir))
+        with escritura(), self.engine.begin() as conexion:
+            self._devolver(conexion, vencidos, intentos)
+
+    def limpiar(self, dias):
+        """
+        Borra los trabajos terminados hace más de `dias` días y sus archivos.
+        """
+        t = Trabajo.__table__.c
+        limite = datetime.datetime.now() - datetime.timedelta(days=dias)
+        viejos = t.estado.in_(('terminado', 'error')) & (t.terminado_en < limite)
+        with escritura(), self.engine.begin() as conexion:
+            filas = conexion.execute(select(t.archivo, t.parametros).where(viejos)).all()
+            conexion.execute(delete(Trabajo.__table__).where(viejos))
+        for archivo, parametros in filas:
+            for nombre in (archivo, json.loads(parametros).get('archivo')):
+                if nombre:
+                    try:
+                        os.remove(self.ruta(nombre))
+                    except FileNotFoundError:
+                        pass
+        return len(filas)
+
+
+class Contexto:
+    """
+    Lo que un trabajo en ejecución puede usar: su id, el avance y la ruta de su archivo de salida.
+    """
+
+    def __init__(self, cola, trabajo):
+        self.cola = cola
+        self.trabajo = trabajo
+        self.archivo = None
+        self._ultimo_avance = 0
+
+    def avanzar(self, avance, total=None):
+        # Se escribe como mucho cada AVANCE_CADA segundos; al terminar, el avance pasa a ser el total
+        ahora = time.monotonic()
+        if ahora - self._ultimo_avance >= AVANCE_CADA:
+            self._ultimo_avance = ahora
+            self.cola.avanzar(self.trabajo['id'], avance, total)
+
+    def salida(self, extension):
+        self.archivo = f"trabajo_{self.trabajo['id']}.{extension}"
+        return self.cola.ruta(self.archivo)
+
+    def entrada(self):
+        return self.cola.ruta(self.trabajo['parametros']['archivo'])
+
+
+def cola_trabajos():
+    return current_app.extensions['trabajos']
+
+
+# --- Tipos de trabajo ---
+
+def _preparar_desde(parametros):
+    desde = parametros.get('desde')
+    if desde:
+        try:
+            datetime.date.fromisoformat(desde)
+        except (TypeError, ValueError):
+            raise ValueError("Fecha inválida en 'desde'. Use el formato AAAA-MM-DD.")
+    return {'desde': desde or None}
+
+
+def _fecha_desde(parametros):
+    desde = parametros.get('desde')
+    return datetime.datetime.fromisoformat(desde) if desde else None
+
+
+@tipo_trabajo('recalcular_costos', "Recálculo de costos y resumen", _preparar_desde)
+def _recalcular_costos(parametros, contexto):
+    desde = _fecha_desde(parametros)
+
+    def recalcular():
+        operaciones = recalcular_costos_desde(desde)
+        filas = reconstruir_resumen(desde.date() if desde else None)
+        db.session.commit()
+        return {'operaciones': operaciones, 'filas_resumen': filas}
+
+    return con_reintentos(recalcular)
+
+
+@tipo_trabajo('reconstruir_resumen', "Reconstrucción del resumen diario", _preparar_desde)
+def _reconstruir_resumen(parametros, contexto):
+    desde = _fecha_desde(parametros)
+
+    def reconstruir():
+        filas = reconstruir_resumen(desde.date() if desde else None)
+        db.session.commit()
+        return {'filas_resumen': filas}
+
+    return con_reintentos(reconstruir)
+
+
+@tipo_trabajo('verificar_caja', "Verificación de la caja desde el libro de movimientos")
+def _verificar_caja(parametros, contexto):
+    diferencias = verificar_saldos()
+    caja = caja_actual()
+    if not caja:
+        return {'diferencias': diferencias}
+
+    def actualizar_snapshot():
+        tomar_snapshot(caja)
+        saldo = saldo_caja(caja)
+        db.session.commit()
+        return saldo
+
+    saldo = con_reintentos(actualizar_snapshot)
+    return {'diferencias': diferencias, 'caja_id': caja.id, 'pesos': saldo.pesos, 'dolares': saldo.dolares}
+
+
+@tipo_trabajo('reproducir_caja', "Reproducción del libro de la caja")
+def _reproducir_caja(parametros, contexto):
+    caja = caja_actual()
+    if not caja:
+        return {'transacciones': 0}
+    reproduccion = reproducir_caja(caja, current_app.config['REPRODUCCION_LOTE'])
+    return {
+        'caja_id': caja.id,
+        'transacciones': reproduccion.transacciones,
+        'sin_movimientos': reproduccion.sin_movimientos,
+        'esperado': reproduccion.esperado._asdict(),
+        'registrado': reproduccion.registrado._asdict(),
+        'desvios_encontrados': reproduccion.cantidad_desvios,
+        'sin_sentido': reproduccion.sin_sentido,
+        'desvios': [dict(desvio._asdict(), esperado=desvio.esperado._asdict(), registrado=desvio.registrado._asdict())
+                    for desvio in reproduccion.desvios[:100]],
+    }
+
+
+def _preparar_exportacion(parametros):
+    formato = parametros.get('formato') or 'csv'
+    if formato not in FORMATOS_EXPORTACION:
+        raise ValueError("Formato de exportación inválido.")
+    if formato == 'parquet' and not parquet_disponible():
+        raise ValueError("La exportación a Parquet requiere instalar pyarrow.")
+    filtros = {campo: parametros.get(campo) or None for campo in ('type', 'concept', 'start_date', 'end_date')}
+    _, errores = filtrar_transacciones(filtros)
+    if errores:
+        raise ValueError(" ".join(errores))
+    return dict(filtros, formato=formato)
+
+
+@tipo_trabajo('exportar', "Exportación del historial", _preparar_exportacion)
+def _exportar(parametros, contexto):
+    query, _ = filtrar_transacciones(parametros, contexto.trabajo['caja_id'])
+    total = query.order_by(None).count()
+    contexto.avanzar(0, total)
+    formato = parametros['formato']
+    _, extension = FORMATOS_EXPORTACION[formato]
+    modo, codificacion = ('w', 'utf-8') if formato == 'csv' else ('wb', None)
+    with open(contexto.salida(extension), modo, encoding=codificacion, newline='' if formato == 'csv' else None) as archivo:
+        for bloque in exportar(query, formato, current_app.config['EXPORTACION_LOTE'],
+                               lambda filas: contexto.avanzar(filas, total)):
+            archivo.write(bloque)
+    return {'filas': total}
+
+
+def _preparar_importacion(parametros):
+    formato = parametros.get('formato') or formato_desde_nombre(parametros.get('archivo'))
+    if not parametros.get('archivo') or formato not in ('csv', 'jsonl'):
+        raise ValueError("Seleccione un archivo .csv o .jsonl para importar.")
+    return {'archivo': parametros['archivo'], 'formato': formato, 'nombre': parametros.get('nombre')}
+
+
+@tipo_trabajo('importar', "Importación de transacciones", _preparar_importacion, reintentable=False)
+def _importar(parametros, contexto):
+    ruta = contexto.entrada()
+    with open(ruta, 'rb') as archivo:
+        total = sum(1 for _ in archivo) - (1 if parametros['formato'] == 'csv' else 0)
+    contexto.avanzar(0, total)
+    with open(ruta, encoding='utf-8-sig', newline='') as flujo:
+        resultado = importar_transacciones(
+            flujo, parametros['formato'], lote=current_app.config['IMPORTACION_LOTE'],
+            al_avanzar=lambda filas: contexto.avanzar(filas, total),
+        )
+    return {
+        'importadas': resultado.importadas,
+        'con_errores': len(resultado.errores),
+        'errores': [{'fila': numero, 'error': mensaje} for numero, mensaje in resultado.errores[:100]],
+    }
+
+
+def _preparar_estadisticas(parametros):
+    periodo = parametros.get('period') or None
+    if periodo is not None and periodo not in PERIODOS:
+        raise ValueError(f"Período inválido. Use {', '.join(PERIODOS)}.")
+    return {'range': parametros.get('range') or 'yearly', 'period': periodo}
+
+
+@tipo_trabajo('estadisticas', "Estadísticas desde el libro completo", _preparar_estadisticas)
+def _estadisticas(parametros, contexto):
+    # Desde el libro y no desde el resumen: sirve para controlar el resumen sobre rangos largos
+    totales, serie = analizar(
+        inicio_de_rango(parametros['range']), parametros['period'], fuente='libro', caja_id=contexto.trabajo['caja_id']
+    )
+    return {'totales': totales, 'serie': serie}
+
+
+# --- Ejecución ---
+
+_app_del_proceso = None
+
+
+def _iniciar_proceso(config):
+    """
+    Inicializador de cada proceso del pool: una app propia, sin migrar ni heredar conexiones.
+    """
+    global _app_del_proceso
+    from .app import create_app
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C lo maneja el proceso principal
+    _app_del_proceso = create_app(dict(config, MIGRAR_AL_INICIAR=False))
+
+
+def ejecutar(trabajo_id):
+    """
+    Ejecuta un trabajo ya tomado y guarda su resultado o su error. Corre en un proceso del pool.
+    """
+    with _app_del_proceso.app_context():
+        cola = cola_trabajos()
+        trabajo = cola.ver(trabajo_id)
+        contexto = Contexto(cola, trabajo)
+        try:
+            if not elegir_sucursal(trabajo['caja_id']):
+                raise ValueError(f"La sucursal {trabajo['caja_id']} ya no existe.")
+            resultado = TIPOS[trabajo['tipo']].funcion(trabajo['parametros'], contexto)
+        except Exception as e:
+            db.session.rollback()
+            cola.fallar(trabajo_id, str(e) or type(e).__name__)
+            return False
+        # Una lectura posterior al commit deja abierta una transacción de la sesión, que con
+        # BEGIN IMMEDIATE retendría el lock de escritura que necesita terminar()
+        db.session.close()
+        cola.terminar(trabajo_id, resultado, contexto.archivo)
+        return True
+
+
+class Worker:
+    """
+    Proceso que reparte los trabajos pendientes entre `procesos` procesos hijos.
+    """
+
+    def __init__(self, app, procesos):
+        self.app = app
+        self.cola = app.extensions['trabajos']
+        self.procesos = procesos
+        self.intervalo = app.config['TRABAJOS_INTERVALO']
+        self.config = {clave: valor for clave, valor in app.config.items() if clave.isupper()}
+        self.en_curso = {}  # futuro -> id del trabajo
+        self.detenido = False
+        self.pool = None
+
+    def _crear_pool(self):
+        # spawn: los hijos no heredan conexiones SQLite ni hilos del proceso principal
+        return concurrent.futures.ProcessPoolExecutor(
+            self.procesos, mp_context=multiprocessing.get_context('spawn'),
+            initializer=_iniciar_proceso, initargs=(self.config,),
+        )
+
+    def detener(self, *_):
+        self.detenido = True
+
+    def _recoger(self):
+        for futuro in [f for f in self.en_curso if f.done()]:
+            trabajo_id = self.en_curso.pop(futuro)
+            error = futuro.exception()
+            if error is not None:
+                # El proceso hijo murió (memoria, señal): el pool queda inutilizable
+                self.cola.fallar(trabajo_id, f"El proceso del trabajo terminó inesperadamente: {error}")
+                if isinstance(error, concurrent.futures.process.BrokenProcessPool):
+                    self.pool.shutdown(wait=False, cancel_futures=True)
+                    self.pool = self._crear_pool()
+
+    def _repartir(self):
+        while len(self.en_curso) < self.procesos and not self.detenido:
+            trabajo = self.cola.tomar()
+            if trabajo is None:
+                return
+            self.en_curso[self.pool.submit(ejecutar, trabajo['id'])] = trabajo['id']
+
+    def _mantener(self):
+        self.cola.latir(list(self.en_curso.values()))
+        self.cola.recuperar_vencidos(
+            self.app.config['TRABAJOS_VENCIDO'], self.app.config['TRABAJOS_INTENTOS'],
+            excluir=self.en_curso.values(),
+        )
+
+    def atender(self):
+        """
+        Atiende la cola hasta recibir SIGTERM o SIGINT. Los trabajos que estaban en curso al
+        detenerse vuelven a pendientes.
+        """
+        signal.signal(signal.SIGTERM, self.detener)
+        signal.signal(signal.SIGINT, self.detener)
+        self.pool = self._crear_pool()
+        limpieza = 0
+        try:
+            while not self.detenido:
+                try:
+                    self._recoger()
+                    self._repartir()
+                    self._mantener()
+                    if time.monotonic() - limpieza > 3600:
+                        limpieza = time.monotonic()
+                        self.cola.limpiar(self.app.config['TRABAJOS_RETENCION_DIAS'])
+                except OperationalError as e:
+                    # Base ocupada por un recálculo largo: se reintenta en la próxima vuelta
+                    log.warning("Cola de trabajos ocupada: %s", e)
+                if self.en_curso:
+                    concurrent.futures.wait(
+                        list(self.en_curso), timeout=self.intervalo,
+                        return_when=concurrent.futures.FIRST_COMPLETED,
+                    )
+                else:
+                    time.sleep(self.intervalo)
+        finally:
+            # Los hijos en medio de un trabajo se terminan: lo que no llegó al commit se descarta
+            # y el trabajo vuelve a la cola (o queda en error si no se puede repetir)
+            procesos = list((self.pool._processes or {}).values())
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            for proceso in procesos:
+                proceso.terminate()
+            self.cola.reencolar(list(self.en_curso.values()))
+
+
+def configurar_trabajos(app, engine):
+    os.makedirs(app.config['TRABAJOS_DIR'], exist_ok=True)
+    app.extensions['trabajos'] = ColaTrabajos(engine, app.config['TRABAJOS_DIR'])
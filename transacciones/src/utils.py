@@ -1,9 +1,9 @@
-import requests
+BLUELYTICS_URL = "https://api.bluelytics.com.ar/v2/latest"
 
-def get_dollar_price():
-    url = "https://api.bluelytics.com.ar/v2/latest"
+def get_dollar_price(url=BLUELYTICS_URL, timeout=5):
+    import requests  # Sólo lo usa el hilo de refresco; importarlo con la app suma ~50 ms al arranque
     try:
-        response = requests.get(url, timeout=5)
+        response = requests.get(url, timeout=timeout)
         response.raise_for_status()
         data = response.json()
 
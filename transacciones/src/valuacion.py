@@ -0,0 +1,91 @@
+# valuacion.py
+# Valuación de la caja a precio de mercado con la serie histórica de cotizaciones.
+import datetime
+from collections import namedtuple
+from decimal import Decimal
+
+from sqlalchemy import func, select
+
+from .models import db, MovimientoCaja
+from .serie_cotizaciones import FUENTE_BLUE
+
+Valuacion = namedtuple('Valuacion', 'fecha pesos dolares cotizacion valor_dolares total')
+
+CENTAVO = Decimal('0.01')
+DIAS_POR_DEFECTO = 30
+MAX_DIAS = 3660  # Una fila por día: diez años como máximo por consulta
+
+
+def _cierre(fecha):
+    return datetime.datetime.combine(fecha + datetime.timedelta(days=1), datetime.time())
+
+
+def rango_valuacion(args):
+    """
+    Lee `desde` y `hasta` (YYYY-MM-DD) de los parámetros; por defecto, los últimos 30 días.
+    Devuelve (desde, hasta, errores).
+    """
+    errores = []
+    fechas = {}
+    for campo in ('desde', 'hasta'):
+        valor = args.get(campo)
+        if valor:
+            try:
+                fechas[campo] = datetime.date.fromisoformat(valor)
+            except ValueError:
+                errores.append(f"Fecha inválida en '{campo}'. Use el formato AAAA-MM-DD.")
+    hasta = fechas.get('hasta') or datetime.date.today()
+    desde = fechas.get('desde') or hasta - datetime.timedelta(days=DIAS_POR_DEFECTO - 1)
+    if not errores and desde > hasta:
+        errores.append("La fecha de inicio es posterior a la de fin.")
+    elif not errores and (hasta - desde).days >= MAX_DIAS:
+        errores.append(f"El rango no puede superar los {MAX_DIAS} días.")
+    return desde, hasta, errores
+
+
+def movimientos_por_dia(caja_id, hasta):
+    """
+    [(fecha, pesos, dolares)] netos de cada día con movimientos anteriores a `hasta`, en orden.
+    """
+    m = MovimientoCaja.__table__.c
+    dia = func.date(m.fecha_hora)
+    filas = db.session.execute(
+        select(dia, func.sum(m.pesos), func.sum(m.dolares))
+        .where(m.caja_id == caja_id, m.fecha_hora < hasta)
+        .group_by(dia).order_by(dia)
+    ).all()
+    return [(datetime.date.fromisoformat(fecha), Decimal(pesos), Decimal(dolares)) for fecha, pesos, dolares in filas]
+
+
+def valuar_caja(caja, desde, hasta, serie, fuente=FUENTE_BLUE):
+    """
+    Saldo de la caja al cierre de cada día entre las fechas `desde` y `hasta` inclusive, con los
+    dólares valuados en pesos a la cotización de compra vigente al cierre. Devuelve [Valuacion];
+    cotización, valor_dolares y total son None los días anteriores al primer punto de la serie.
+
+    Se leen una sola vez los movimientos agrupados por día y los puntos de la serie del rango,
+    y se avanza por los dos en orden, en lugar de consultar saldo y cotización día por día.
+    """
+    movimientos = movimientos_por_dia(caja.id, _cierre(hasta))
+    puntos = serie.entre(datetime.datetime.combine(desde, datetime.time()), _cierre(hasta), fuente)
+
+    valuaciones = []
+    pesos = dolares = Decimal('0.00')
+    cotizacion = None
+    i = j = 0
+    fecha = desde
+    while fecha <= hasta:
+        while i < len(movimientos) and movimientos[i][0] <= fecha:
+            pesos += movimientos[i][1]
+            dolares += movimientos[i][2]
+            i += 1
+        while j < len(puntos) and puntos[j].fecha_hora < _cierre(fecha):
+            cotizacion = puntos[j].compra
+            j += 1
+        if cotizacion is None:
+            valuaciones.append(Valuacion(fecha, pesos, dolares, None, None, None))
+        else:
+            valor = (dolares * cotizacion).quantize(CENTAVO)
+            valuaciones.append(Valuacion(fecha, pesos, dolares, cotizacion, valor, pesos + valor))
+        fecha += datetime.timedelta(days=1)
+    return valuaciones